@@ -19,7 +19,6 @@
 
 
 import numpy
-import copy
 from scipy.special import erfinv
 from collections import namedtuple
 import matplotlib.pyplot as mpl
@@ -80,39 +79,70 @@ def probit(p):
 
 def pavx(y):
     # see: sidekit.bosaris.detplot.pavx; with fixed bugs
+    # Pools adjacent violators on a stack of blocks, with the same floating-point updates in the same
+    # order as the element-by-element original, so the result is identical. A run of equal values is
+    # taken in one step once merging it no longer changes the top block (finite values only: merging
+    # infinities gives nan).
     assert y.ndim == 1, 'Argument should be a 1-D array'
     assert y.shape[0] > 0, 'Input array is empty'
-    n = y.shape[0]
-
-    index = numpy.zeros(n,dtype=int)
-    length = numpy.zeros(n,dtype=int)
-
-    ghat = numpy.zeros(n)
-
-    ci = 0
-    index[ci] = 1
-    length[ci] = 1
-    ghat[ci] = y[0]
-
-    for j in range(1, n):
-        ci += 1
-        index[ci] = j+1
-        length[ci] = 1
-        ghat[ci] = y[j]
-        while (ci >= 1) & (ghat[numpy.max(ci - 1, 0)] >= ghat[ci]):
-            nw = length[ci - 1] + length[ci]
-            ghat[ci - 1] = ghat[ci - 1] + (length[ci] / nw) * (ghat[ci] - ghat[ci - 1])
-            length[ci - 1] = nw
-            ci -= 1
-
-    height = copy.deepcopy(ghat[:ci + 1])
-    width = copy.deepcopy(length[:ci + 1])
-
-    while n >= 0:
-        for j in range(index[ci], n+1):
-            ghat[j-1] = ghat[ci]
-        n = index[ci] - 1
-        ci -= 1
+    y = numpy.asarray(y, dtype=float)
+
+    # runs of equal values
+    starts = numpy.flatnonzero(numpy.concatenate(([True], y[1:] != y[:-1])))
+    run_values = y[starts].tolist()
+    run_finite = numpy.isfinite(y[starts]).tolist()
+    run_lengths = numpy.diff(numpy.append(starts, y.shape[0])).tolist()
+
+    # the top block, starting as the first value, and the blocks below it
+    g = run_values[0]
+    w = 1
+    run_lengths[0] -= 1
+    heights = []
+    widths = []
+
+    for v, run, finite in zip(run_values, run_lengths, run_finite):
+        while run:
+            if finite and (g < v):
+                # v starts a new block, the rest of the run merges into it without changing its value
+                heights.append(g)
+                widths.append(w)
+                g, w = v, run
+                break
+            if finite and (g == v):
+                # merging v leaves the top block at v, and it already does not violate the one below
+                w += run
+                break
+            if g > v:
+                # v pools into the top block element by element, until the run ends or the top block no
+                # longer lies above both v and the block below it
+                below = heights[-1] if heights else -numpy.inf
+                while True:
+                    w += 1
+                    g = g + (1 / w) * (v - g)
+                    run -= 1
+                    if (not run) or (below >= g) or not (g > v):
+                        break
+            elif g >= v:
+                # equal infinities
+                w += 1
+                g = g + (1 / w) * (v - g)
+                run -= 1
+            else:
+                # v is nan or an infinity above the top block: a block of its own
+                heights.append(g)
+                widths.append(w)
+                g, w = v, 1
+                run -= 1
+            while heights and (heights[-1] >= g):
+                nw = widths[-1] + w
+                g = heights[-1] + (w / nw) * (g - heights[-1])
+                w = nw
+                heights.pop()
+                widths.pop()
+
+    height = numpy.array(heights + [g])
+    width = numpy.array(widths + [w], dtype=int)
+    ghat = numpy.repeat(height, width)
 
     return ghat, width, height
 
@@ -123,11 +153,15 @@ def rocch(tar_scores, nontar_scores, laplace=True):
     # init PAV isotonic regression
     Nt = tar_scores.shape[0]
     Nn = nontar_scores.shape[0]
+    assert (Nt > 0) & (Nn > 0), 'Need both target and non-target scores'
     N = Nt + Nn
-    scores = numpy.concatenate((tar_scores, nontar_scores))
-    Pideal = numpy.concatenate((numpy.ones(Nt), numpy.zeros(Nn)))
-    perturb = numpy.argsort(scores, kind='mergesort')
-    Pideal = Pideal[perturb]
+    # targets (1) and non-targets (0) in the order of a stable sort of all scores, targets first among
+    # equal ones: every target lands after the targets and the non-targets sorted below it
+    dtype = numpy.result_type(tar_scores, nontar_scores)
+    tar_sorted = numpy.sort(numpy.asarray(tar_scores, dtype=dtype))
+    nontar_sorted = numpy.sort(numpy.asarray(nontar_scores, dtype=dtype))
+    Pideal = numpy.zeros(N)
+    Pideal[numpy.arange(Nt) + numpy.searchsorted(nontar_sorted, tar_sorted, side='left')] = 1
     if laplace:
         Pideal = numpy.concatenate(([1,0], Pideal, [1,0]))
 
@@ -136,21 +170,14 @@ def rocch(tar_scores, nontar_scores, laplace=True):
     if laplace:
         Popt = Popt[2:-2]
 
-    # ROCCH points
-    nbins = width.shape[0]
-    pmiss = numpy.zeros(nbins + 1)
-    pfa = numpy.zeros(nbins + 1)
-    left = 0
-    fa = Nn
-    miss = 0
-    for i in range(nbins):
-        pmiss[i] = miss / Nt
-        pfa[i] = fa / Nn
-        left = int(left + width[i])
-        miss = numpy.sum(Pideal[:left])
-        fa = N - left - numpy.sum(Pideal[left:])
-    pmiss[nbins] = miss / Nt
-    pfa[nbins] = fa / Nn
+    # ROCCH points: misses and false alarms below the right edge of every bin, from cumulative sums
+    # (sums of 0s and 1s, exact in floating point)
+    left = numpy.cumsum(width)
+    cumulative = numpy.concatenate(([0], numpy.cumsum(Pideal)))
+    miss = cumulative[left]
+    fa = N - left - (cumulative[-1] - miss)
+    pmiss = numpy.concatenate(([0], miss)) / Nt
+    pfa = numpy.concatenate(([Nn], fa)) / Nn
 
     return pmiss, pfa
 
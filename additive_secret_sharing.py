@@ -1,6 +1,8 @@
 import numpy as np
 import os
 
+from secret_sharing import reconstruct, split_into_ring_shares
+
 # Define thresholds based on biometric vector similarity
 threshold_1 = 0.25  # Identical fingerprints
 threshold_2 = 0.5  # Most definitely a match
@@ -8,28 +10,21 @@ threshold_3 = 1.0   # Needs further investigation
 
 
 
-def split_into_shares(secret_vector):
-    """ Splits a fingerprint template into two secret shares. """
-    s2 = np.random.rand(*secret_vector.shape)  # Use random float values
-    s1 = secret_vector - s2  # Ensure sum of shares reconstructs original
-    return s1, s2
-
-
 # Load the fingerprint templates
 probe = np.load("IrisFingerprintDatabases/FingerprintDatabase/3567/3567d11.npy")
 template = np.load("IrisFingerprintDatabases/FingerprintDatabase/3567/3567d1.npy")
 
 
-# Split template and probe into secret shares
-t1, t2 = split_into_shares(template)
-p1, p2 = split_into_shares(probe)
+# Split template and probe into fixed-point ring shares (uint64, wrapping arithmetic)
+t1, t2 = split_into_ring_shares(template)
+p1, p2 = split_into_ring_shares(probe)
 
-# Each server computes the squared difference
+# Each server computes the difference of its shares
 s1_diff = t1 - p1
 s2_diff = t2 - p2
 
-# Reconstruct the actual difference
-reconstructed_diff = s1_diff + s2_diff
+# Reconstruct the actual difference (exact up to the fixed-point quantization)
+reconstructed_diff = reconstruct(s1_diff, s2_diff)
 
 # Compute the squared Euclidean distance using secret shares
 squared_distance = np.sum(reconstructed_diff ** 2)
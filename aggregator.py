@@ -0,0 +1,120 @@
+"""
+Aggregator: combines the servers' encrypted differences so the client only
+downloads the result.
+
+Started with --aggregator, the matching servers answer VERIFY_FORWARD by
+sending their diff here (AGG_PART) under the client's tag instead of back to
+the client. The client registers a context with the relin and Galois keys for
+the square & sum (public keys only, the aggregator cannot decrypt) and asks
+for AGG_RESULT: the sum of the parties' diffs, squared and summed, one
+ciphertext at the lowest level. See protocol.py.
+
+    python aggregator.py
+    python server1.py --aggregator 127.0.0.1:65430
+    python server2.py --aggregator 127.0.0.1:65430
+    python client.py --aggregator
+"""
+import argparse
+import threading
+import time
+import tenseal as ts
+
+from ckks_utils import squared_norm
+from matching_server import (
+    CONTEXT_CACHE_SIZE, HOST, MatchingHandler, SessionServer, send_error, serve_until_stopped
+)
+from protocol import OP_AGG_PART, OP_AGG_RESULT, STATUS_OK, STATUS_UNKNOWN_SESSION
+from transport import send_large_data, receive_large_data
+
+PORT = 65430
+PARTIES = 2
+# Seconds the diffs of a tag are kept waiting for their AGG_RESULT
+PART_TTL = 60.0
+
+
+class Aggregator(SessionServer):
+    """Collects the diffs of every tag from all parties and squares & sums their total on request."""
+
+    def __init__(self, name, address, context_cache_size=CONTEXT_CACHE_SIZE, parties=PARTIES, part_ttl=PART_TTL):
+        super().__init__(name, address, MatchingHandler, context_cache_size)
+        self.operations.update({OP_AGG_PART: self.add_part, OP_AGG_RESULT: self.aggregate})
+        self.parties = parties
+        self.part_ttl = part_ttl
+        # tag -> (arrival of the first part, {party: serialized diff})
+        self.parts = {}
+        self.parts_lock = threading.Lock()
+
+    def add_part(self, conn):
+        tag = receive_large_data(conn).decode()
+        party = receive_large_data(conn)
+        diff = receive_large_data(conn)
+        party = int(party)
+        if not 0 <= party < self.parties:
+            send_error(conn, f"party {party} out of range, this aggregator combines {self.parties}")
+            return
+        now = time.monotonic()
+        with self.parts_lock:
+            # Drop the parts of clients that never came for their result
+            for stale in [tag for tag, (arrival, _) in self.parts.items() if now - arrival > self.part_ttl]:
+                del self.parts[stale]
+            self.parts.setdefault(tag, (now, {}))[1][party] = diff
+        send_large_data(conn, STATUS_OK)
+
+    def aggregate(self, conn):
+        server_proc_start = time.perf_counter()
+
+        session_id = receive_large_data(conn).decode()
+        tag = receive_large_data(conn).decode()
+
+        context = self.contexts.get(session_id)
+        if context is None:
+            # The parts stay, the client registers again and retries
+            send_large_data(conn, STATUS_UNKNOWN_SESSION)
+            return
+        with self.parts_lock:
+            _, diffs = self.parts.get(tag, (None, {}))
+            if len(diffs) == self.parties:
+                del self.parts[tag]
+        missing = sorted(set(range(self.parties)) - set(diffs))
+        if missing:
+            send_error(conn, f"missing the diffs of parties {missing} for this tag")
+            return
+
+        enc_total_diff = ts.ckks_vector_from(context, bytes(diffs[0]))
+        for party in range(1, self.parties):
+            enc_total_diff += ts.ckks_vector_from(context, bytes(diffs[party]))
+
+        receive_time = time.perf_counter()
+
+        enc_sq_dist = squared_norm(enc_total_diff, context).serialize()
+
+        calculation_time = time.perf_counter()
+
+        send_large_data(conn, STATUS_OK)
+        send_large_data(conn, enc_sq_dist)
+        server_proc_end = time.perf_counter()
+        print(f"[{self.name}] AGG_RESULT {self.parties} parts "
+              f"combine time : {receive_time - server_proc_start:.6f}s, "
+              f"square & sum time : {calculation_time - receive_time:.6f}s, "
+              f"send time : {server_proc_end - calculation_time:.6f}s, "
+              f"result size : {len(enc_sq_dist)} bytes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregator of the matching servers' encrypted diffs")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--parties", type=int, default=PARTIES, help="number of servers whose diffs are added")
+    parser.add_argument("--context-cache-size", type=int, default=CONTEXT_CACHE_SIZE,
+                        help="number of client contexts kept deserialized")
+    parser.add_argument("--part-ttl", type=float, default=PART_TTL,
+                        help="seconds to keep diffs that no client has collected")
+    args = parser.parse_args()
+
+    server = Aggregator("Aggregator", (args.host, args.port), args.context_cache_size, args.parties, args.part_ttl)
+    print(f"Aggregator waiting on {args.host}:{args.port}...")
+    serve_until_stopped(server)
+
+
+if __name__ == "__main__":
+    main()
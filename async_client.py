@@ -0,0 +1,263 @@
+"""
+Asyncio client library for batch verification jobs.
+
+Keeps a few persistent connections to every server and pipelines requests on
+them: a request is written as soon as it is issued, and since a server
+answers the requests of one connection in order, a reader task per
+connection hands the replies to the waiting requests first in, first out.
+The servers of a verification (one pool per address, any number of
+parties) are queried concurrently and their diffs summed, and every request
+gets its own timeout and byte count. Connections can negotiate frame
+compression (see transport.py) when they are opened.
+
+    client = await AsyncMatchingClient.connect(SERVERS, ctx_bytes, context)
+    enc_total_diff, counter = await client.verify("3567", [enc_p1_bytes, enc_p2_bytes])
+    diffs, counter = await client.verify_batch(ids, [enc_p1s, enc_p2s])
+    await client.close()
+
+A request that times out keeps its place in the reply queue, so its late
+reply is read and dropped and the connection stays in step.
+"""
+import asyncio
+from collections import deque
+import tenseal as ts
+
+from protocol import (
+    OP_CODECS, OP_REGISTER, OP_VERIFY, OP_VERIFY_SEED, OP_VERIFY_BATCH, STATUS_OK, STATUS_UNKNOWN_SESSION,
+    BATCH_RESULT, BATCH_OK, UnknownSessionError, context_digest
+)
+from transport import CODECS_BY_NAME, BandwidthCounter, receive_frame_async, send_frames_async, set_nodelay
+
+CONNECTIONS_PER_SERVER = 2
+REQUEST_TIMEOUT = 30.0
+
+
+class ServerError(Exception):
+    """The server answered a request with ERROR; the connection stays usable."""
+
+
+class PipelinedConnection:
+    """One connection with any number of requests in flight, answered in order."""
+
+    def __init__(self, reader, writer, codec=None):
+        self.reader = reader
+        self.writer = writer
+        self.codec = codec
+        # (future, counter, reply reader) of every request written and not answered yet, oldest first
+        self.pending = deque()
+        self.write_lock = asyncio.Lock()
+        self.closed = False
+        self.reader_task = asyncio.create_task(self._read_replies())
+
+    @classmethod
+    async def open(cls, address, codecs=()):
+        """Connects and, if `codecs` are offered, negotiates frame compression first."""
+        reader, writer = await asyncio.open_connection(*address)
+        set_nodelay(writer.get_extra_info("socket"))
+        codec = None
+        if codecs:
+            await send_frames_async(writer, [OP_CODECS, ",".join(codecs).encode()])
+            if await receive_frame_async(reader) != STATUS_OK:
+                raise ConnectionError("Server refused codec negotiation")
+            codec = CODECS_BY_NAME.get((await receive_frame_async(reader)).decode())
+        return cls(reader, writer, codec)
+
+    def __len__(self):
+        return len(self.pending)
+
+    async def request(self, frames, counter, read_reply=None):
+        """
+        Writes one request and returns the future of its reply: the payload
+        frame after OK, or what read_reply(receive) makes of the frames after OK.
+        """
+        if self.closed:
+            raise ConnectionError("Connection closed")
+        future = asyncio.get_running_loop().create_future()
+        async with self.write_lock:
+            # writer.write() buffers synchronously, so a request is never half-written
+            # even if the caller is cancelled while draining
+            self.pending.append((future, counter, read_reply or (lambda receive: receive())))
+            await send_frames_async(self.writer, frames, counter, self.codec)
+        return future
+
+    async def _receive(self):
+        frame_counter = BandwidthCounter()
+        frame = await receive_frame_async(self.reader, frame_counter)
+        self.pending[0][1].add_received(frame_counter.received, frame_counter.logical_received)
+        return frame
+
+    async def _read_replies(self):
+        try:
+            while True:
+                status = await self._receive()
+                if status == STATUS_OK:
+                    result = await self.pending[0][2](self._receive)
+                elif status == STATUS_UNKNOWN_SESSION:
+                    result = UnknownSessionError()
+                else:
+                    result = ServerError((await self._receive()).decode())
+                future, _, _ = self.pending.popleft()
+                if future.done():
+                    # The request timed out, nobody waits for this reply any more
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        except Exception as err:
+            # Lost connection, or a reply we can't parse: either way the stream is
+            # out of step, so fail every pending request and drop the connection
+            self._fail(err)
+
+    def _fail(self, err):
+        self.closed = True
+        while self.pending:
+            future, _, _ = self.pending.popleft()
+            if not future.done():
+                future.set_exception(ConnectionError(f"Connection lost: {err}"))
+        self.writer.close()
+
+    async def close(self):
+        self.closed = True
+        self.reader_task.cancel()
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+
+class ServerPool:
+    """
+    Connections to one server sharing one session; every request goes to the
+    connection with the fewest requests in flight, broken ones are replaced.
+    """
+
+    def __init__(self, address, ctx_bytes, size=CONNECTIONS_PER_SERVER, codecs=()):
+        self.address = address
+        self.ctx_bytes = ctx_bytes
+        self.size = size
+        self.codecs = codecs
+        self.session_id = context_digest(ctx_bytes)
+        self.connections = []
+        self.lock = asyncio.Lock()
+
+    async def start(self, timeout=REQUEST_TIMEOUT):
+        await self._connection()
+        await self.register(BandwidthCounter(), timeout)
+
+    async def _connection(self):
+        async with self.lock:
+            self.connections = [conn for conn in self.connections if not conn.closed]
+            while len(self.connections) < self.size:
+                self.connections.append(await PipelinedConnection.open(self.address, self.codecs))
+        return min(self.connections, key=len)
+
+    async def register(self, counter, timeout=REQUEST_TIMEOUT):
+        """Uploads the context; session IDs are context hashes, so every connection shares it."""
+        conn = await self._connection()
+        future = await conn.request([OP_REGISTER, self.ctx_bytes], counter)
+        self.session_id = (await asyncio.wait_for(future, timeout)).decode()
+
+    async def call(self, frames_for, counter, timeout=REQUEST_TIMEOUT, read_reply=None):
+        """
+        Reply of the request frames_for(session_id) builds. An evicted session
+        is registered again and the request retried once.
+        """
+        for attempt in range(2):
+            conn = await self._connection()
+            future = await conn.request(frames_for(self.session_id), counter, read_reply)
+            try:
+                return await asyncio.wait_for(future, timeout)
+            except UnknownSessionError:
+                if attempt:
+                    raise
+                await self.register(counter, timeout)
+
+    async def close(self):
+        for conn in self.connections:
+            await conn.close()
+
+
+def verify_frames(op, biometric_id, share_bytes):
+    return lambda session_id: [op, session_id.encode(), biometric_id.encode(), share_bytes]
+
+
+def batch_frames(biometric_ids, shares):
+    return lambda session_id: [OP_VERIFY_BATCH, session_id.encode(), "\n".join(biometric_ids).encode(), *shares]
+
+
+def batch_reader(count):
+    async def read_results(receive):
+        """{index: (diff payload, error message)} of the `count` results of a batch."""
+        results = {}
+        for _ in range(count):
+            index, outcome = BATCH_RESULT.unpack(await receive())
+            payload = await receive()
+            results[index] = (payload, None) if outcome == BATCH_OK else (None, payload.decode())
+        return results
+    return read_results
+
+
+class AsyncMatchingClient:
+    """Pipelined verification against every server, see the module docstring."""
+
+    def __init__(self, pools, context, timeout=REQUEST_TIMEOUT):
+        self.pools = pools
+        self.context = context
+        self.timeout = timeout
+
+    @classmethod
+    async def connect(cls, servers, ctx_bytes, context, connections=CONNECTIONS_PER_SERVER,
+                      timeout=REQUEST_TIMEOUT, codecs=()):
+        pools = [ServerPool(address, ctx_bytes, connections, codecs) for address in servers]
+        await asyncio.gather(*(pool.start(timeout) for pool in pools))
+        return cls(pools, context, timeout)
+
+    def total_diff(self, payloads):
+        """Sum of the servers' serialized diffs."""
+        enc_total_diff = ts.ckks_vector_from(self.context, bytes(payloads[0]))
+        for payload in payloads[1:]:
+            enc_total_diff += ts.ckks_vector_from(self.context, bytes(payload))
+        return enc_total_diff
+
+    async def verify(self, biometric_id, shares, seeded=False):
+        """
+        Encrypted total difference of the servers for one probe (`shares`
+        holds one encrypted share per server) and the bytes the request moved.
+        With `seeded` every share but the first is the seed payload of that
+        server's share (see secret_sharing.seed_payload) instead of its ciphertext.
+        """
+        counter = BandwidthCounter()
+        replies = await asyncio.gather(*(
+            pool.call(verify_frames(OP_VERIFY_SEED if seeded and party else OP_VERIFY, biometric_id, share),
+                      counter, self.timeout)
+            for party, (pool, share) in enumerate(zip(self.pools, shares))
+        ))
+        return self.total_diff(replies), counter
+
+    async def verify_batch(self, biometric_ids, enc_shares, timeout=None):
+        """
+        Encrypted total difference for every id of one VERIFY_BATCH per server
+        (enc_shares[party][i] is that server's share for id i; None where a
+        server failed the pair), and the bytes moved. `timeout` covers the
+        whole batch and defaults to the per-request one.
+        """
+        counter = BandwidthCounter()
+        timeout = timeout or self.timeout
+        replies = await asyncio.gather(*(
+            pool.call(batch_frames(biometric_ids, shares), counter, timeout, batch_reader(len(biometric_ids)))
+            for pool, shares in zip(self.pools, enc_shares)
+        ))
+        diffs = []
+        for index in range(len(biometric_ids)):
+            results = [reply[index] for reply in replies]
+            if any(error for _, error in results):
+                diffs.append(None)
+            else:
+                diffs.append(self.total_diff([payload for payload, _ in results]))
+        return diffs, counter
+
+    async def close(self):
+        for pool in self.pools:
+            await pool.close()
@@ -0,0 +1,185 @@
+"""
+Beaver square triples for the MPC matching mode.
+
+The servers hold additive ring shares d1 + ... + dN = d of the difference
+between template and probe (d_i = t_i - p_i, fixed point in Z_2^64 or
+Z_2^32, see secret_sharing.py) and compute shares of sum(d ** 2) without
+CKKS, using one precomputed square triple (a, c = a * a) per request, dealt
+offline as a = a1 + ... + aN, c = c1 + ... + cN. All arithmetic wraps
+around in the ring:
+
+    round 1   server i returns e_i = d_i - a_i, the client opens e = e1 + ... + eN
+    round 2   server i returns z_i = sum([i == 0] * e**2 + 2 * e * a_i + c_i)
+
+z1 + ... + zN = sum((e + a) ** 2) = sum(d ** 2), with twice the fractional bits
+of d. e is masked by the uniformly random a, so the client learns nothing
+but the distance. A triple must never be used twice (two openings would
+reveal the difference of two d's), so the servers record used triples and
+reject them.
+
+Dealing, written next to the server databases:
+
+    python beaver.py --count 100000 --dim 256 --dtype uint64 [--parties 3]
+
+    server1_triples/  a.npy, c.npy (count x dim ring elements), used.npy (count flags)
+    server2_triples/  same for server 2, and so on for every party
+    client_triples.json  {"next": 0, "count": 100000, "dtype": "uint64"}, the client's
+                         next free triple and the ring
+"""
+import argparse
+import fcntl
+import json
+import os
+import threading
+from pathlib import Path
+import numpy as np
+
+from secret_sharing import RING_DTYPES, random_ring_elements
+
+SERVER_TRIPLES = "server{}_triples"
+CLIENT_TRIPLES = "client_triples.json"
+
+
+def deal(count, dim, folders, client_file, dtype=np.uint64, rng=None, chunk=4096):
+    """Writes `count` square triples of length `dim` in the ring of `dtype`, one share per folder."""
+    rng = rng or np.random.default_rng()
+    files = []
+    for folder in folders:
+        folder = Path(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+        a = np.lib.format.open_memmap(folder / "a.npy", mode="w+", dtype=dtype, shape=(count, dim))
+        c = np.lib.format.open_memmap(folder / "c.npy", mode="w+", dtype=dtype, shape=(count, dim))
+        np.save(folder / "used.npy", np.zeros(count, dtype=np.uint8))
+        files.append((a, c))
+
+    for start in range(0, count, chunk):
+        rows = slice(start, min(start + chunk, count))
+        a = random_ring_elements((rows.stop - start, dim), dtype, rng)
+        c = a * a
+        # Shares of every server but the last are random, the last gets the remainder
+        for a_file, c_file in files[:-1]:
+            a_share = random_ring_elements(a.shape, dtype, rng)
+            c_share = random_ring_elements(a.shape, dtype, rng)
+            a_file[rows], c_file[rows] = a_share, c_share
+            a, c = a - a_share, c - c_share
+        files[-1][0][rows], files[-1][1][rows] = a, c
+    for a, c in files:
+        a.flush()
+        c.flush()
+
+    with open(client_file, "w") as f:
+        json.dump({"next": 0, "count": count, "dtype": np.dtype(dtype).name}, f)
+
+
+class TripleReuseError(Exception):
+    """The triple was already opened (or finished) by an earlier request."""
+
+
+class TripleStore:
+    """One server's triple shares, with the use of every triple recorded on disk."""
+
+    def __init__(self, folder):
+        folder = Path(folder)
+        self.a = np.load(folder / "a.npy", mmap_mode="r")
+        self.c = np.load(folder / "c.npy", mmap_mode="r")
+        self.used = np.load(folder / "used.npy", mmap_mode="r+")
+        # Opened in round 1, waiting for round 2. Both rounds of a client come over
+        # the same connection, so the same process, even with pre-forked workers.
+        self.opened = set()
+        self.lock = threading.Lock()
+        # POSIX record lock on used.npy: the threading lock only covers this
+        # process, workers forked from it share the used.npy mapping
+        self.lock_file = open(folder / "used.npy", "r+b")
+
+    def __len__(self):
+        return len(self.used)
+
+    @property
+    def dtype(self):
+        return self.a.dtype
+
+    def open(self, triple_id):
+        """a_i of a fresh triple, which is marked used before it is returned."""
+        with self.lock:
+            if not 0 <= triple_id < len(self.used):
+                raise TripleReuseError(f"no triple {triple_id}, {len(self.used)} were dealt")
+            fcntl.lockf(self.lock_file, fcntl.LOCK_EX)
+            try:
+                if self.used[triple_id]:
+                    raise TripleReuseError(f"triple {triple_id} was already used")
+                self.used[triple_id] = 1
+                self.used.flush()
+            finally:
+                fcntl.lockf(self.lock_file, fcntl.LOCK_UN)
+            self.opened.add(triple_id)
+        return self.a[triple_id]
+
+    def finish(self, triple_id):
+        """(a_i, c_i) of a triple opened by round 1, which cannot be finished again."""
+        with self.lock:
+            if triple_id not in self.opened:
+                raise TripleReuseError(f"triple {triple_id} was not opened or is already finished")
+            self.opened.remove(triple_id)
+        return self.a[triple_id], self.c[triple_id]
+
+
+def open_share(diff_share, a_share):
+    """Round 1: this server's share of e = d - a."""
+    return diff_share - a_share
+
+
+def finish_share(e, a_share, c_share, party):
+    """Round 2: this server's share of sum(d ** 2) (a 1-element array), given the opened e."""
+    # Element-wise ring arithmetic wraps around silently, numpy scalars would warn
+    z = 2 * e * a_share + c_share
+    if party == 0:
+        z += e * e
+    return z.sum(dtype=z.dtype, keepdims=True)
+
+
+class TripleAllocator:
+    """Hands out the client's unused triple ids, persisting the next one."""
+
+    def __init__(self, path=CLIENT_TRIPLES):
+        self.path = path
+        with open(path) as f:
+            state = json.load(f)
+        self.next = state["next"]
+        self.count = state["count"]
+        self.dtype = np.dtype(state["dtype"])
+
+    def take(self, n=1):
+        if self.next + n > self.count:
+            raise RuntimeError(f"Only {self.count - self.next} Beaver triples left, deal new ones")
+        ids = list(range(self.next, self.next + n))
+        self.next += n
+        # Persist before the ids are used so a crash can never hand them out twice
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"next": self.next, "count": self.count, "dtype": self.dtype.name}, f)
+        os.replace(tmp, self.path)
+        return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deal Beaver square triples for the MPC mode")
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--dtype", choices=RING_DTYPES, default="uint64",
+                        help="ring of the shares, must match the servers' ring databases")
+    parser.add_argument("--parties", type=int, default=2, help="number of servers to deal triple shares to")
+    parser.add_argument("--servers", nargs="+", help=f"triple directories, default: {SERVER_TRIPLES.format('N')}")
+    parser.add_argument("--client", default=CLIENT_TRIPLES)
+    args = parser.parse_args()
+
+    if args.parties < 2:
+        parser.error("--parties must be at least 2")
+    servers = args.servers or [SERVER_TRIPLES.format(party + 1) for party in range(args.parties)]
+    if len(servers) != args.parties:
+        parser.error(f"--servers lists {len(servers)} directories for {args.parties} parties")
+    deal(args.count, args.dim, servers, args.client, args.dtype)
+    print(f"Dealt {args.count} {args.dtype} triples of length {args.dim} to {', '.join(servers)}")
+
+
+if __name__ == "__main__":
+    main()
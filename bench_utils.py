@@ -0,0 +1,51 @@
+"""
+Setup and reporting shared by the benchmark_*.py scripts.
+
+client_contexts() builds the contexts client.py uses (see ckks_utils.py),
+latency_header() / latency_row() the latency columns of their result tables:
+
+    print(f"{'mode':<10} {latency_header()} {'bytes':>9}")
+    print(f"{name:<10} {latency_row(seconds)} {size:>9}")
+"""
+import numpy as np
+import tenseal as ts
+
+from ckks_utils import create_ckks_context, public_context_bytes, sum_rotation_steps
+
+LATENCY_STATS = ("mean", "p50", "p95")
+
+
+def eval_context_bytes(context, vector_size):
+    """Public evaluation context for the square & sum of `vector_size` values: relin and trimmed Galois keys."""
+    return public_context_bytes(context, sum_rotation_steps(vector_size), relin_keys=True)
+
+
+def client_contexts(vector_size=None):
+    """
+    The private context, its public-key-only serialization for the servers
+    and, given a `vector_size`, the deserialized evaluation context (None
+    without one).
+    """
+    context = create_ckks_context()
+    ctx_bytes = public_context_bytes(context)
+    eval_context = None if vector_size is None else ts.context_from(eval_context_bytes(context, vector_size))
+    return context, ctx_bytes, eval_context
+
+
+def latency_stat(values, stat):
+    if stat == "mean":
+        return values.mean()
+    if stat == "max":
+        return values.max()
+    # "p<q>": the q-th percentile
+    return np.percentile(values, float(stat[1:]))
+
+
+def latency_header(stats=LATENCY_STATS, unit="ms", width=9):
+    return " ".join(f"{f'{stat} {unit}':>{width}}" for stat in stats)
+
+
+def latency_row(seconds, stats=LATENCY_STATS, width=9, digits=2, scale=1000):
+    """The `stats` of the latencies `seconds`, in ms (or `scale` units per second) and aligned to latency_header()."""
+    values = np.asarray(seconds) * scale
+    return " ".join(f"{latency_stat(values, stat):>{width}.{digits}f}" for stat in stats)
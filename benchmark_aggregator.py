@@ -0,0 +1,80 @@
+"""
+End-to-end verification latency and client bandwidth with the aggregator
+(aggregator.py) against the current flow where the client downloads both
+diffs and squares & sums them itself.
+
+Both flows encrypt fresh compact shares for every verification and end with
+the decrypted distance, so latency covers encryption, the servers' round
+trips, the square & sum (client or aggregator) and decryption. Byte counts
+are the client's own traffic only.
+
+    python aggregator.py &
+    python server1.py --aggregator 127.0.0.1:65430 & python server2.py --aggregator 127.0.0.1:65430 &
+    python benchmark_aggregator.py --requests 50
+"""
+import argparse
+import time
+import numpy as np
+import tenseal as ts
+
+from bench_utils import client_contexts, eval_context_bytes, latency_header, latency_row
+from ckks_utils import squared_norm
+from client import (
+    AGGREGATOR, BANDWIDTH, SERVERS, ServerSession, encrypt_share, run_parallel, send_and_receive_server,
+    verify_aggregated
+)
+from secret_sharing import split_into_shares
+
+
+def client_flow(sessions, aggregator, biometric_id, probe, context, eval_context):
+    p1, p2 = split_into_shares(probe)
+    shares = [encrypt_share(context, p1), encrypt_share(context, p2)]
+    results = {}
+    run_parallel([
+        (send_and_receive_server, (sessions[i], biometric_id, shares[i], context, results, i)) for i in range(2)
+    ])
+    return squared_norm(results[0] + results[1], eval_context).decrypt()[0]
+
+
+def aggregator_flow(sessions, aggregator, biometric_id, probe, context, eval_context):
+    p1, p2 = split_into_shares(probe)
+    enc_sq_dist = verify_aggregated(sessions, aggregator, biometric_id,
+                                    [encrypt_share(context, p1), encrypt_share(context, p2)], context)
+    return enc_sq_dist.decrypt()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregator vs client-side square & sum")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--id", default="3567")
+    parser.add_argument("--probe", default="IrisFingerprintDatabases/FingerprintDatabase/3567/3567d11.npy")
+    args = parser.parse_args()
+
+    probe = np.load(args.probe)
+    context, ctx_bytes, _ = client_contexts()
+    eval_ctx_bytes = eval_context_bytes(context, len(probe))
+    eval_context = ts.context_from(eval_ctx_bytes)
+    sessions = [ServerSession(host, port, ctx_bytes) for host, port in SERVERS]
+    aggregator = ServerSession(*AGGREGATOR, eval_ctx_bytes)
+
+    print(f"{args.requests} verifications per flow, client traffic per verification in bytes")
+    print(f"{'flow':<11} {latency_header()} {'sent':>9} {'received':>9} {'total':>9} "
+          f"{'distance':>10}")
+    for name, flow in (("client", client_flow), ("aggregator", aggregator_flow)):
+        latencies = []
+        sent, received = BANDWIDTH.sent, BANDWIDTH.received
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            sq_dist = flow(sessions, aggregator, args.id, probe, context, eval_context)
+            latencies.append(time.perf_counter() - start)
+        sent, received = (BANDWIDTH.sent - sent) // args.requests, (BANDWIDTH.received - received) // args.requests
+        print(f"{name:<11} {latency_row(latencies)} "
+              f"{sent:>9} {received:>9} {sent + received:>9} {np.sqrt(max(sq_dist, 0)):>10.6f}")
+    print(f"Aggregator context (registered once): {len(eval_ctx_bytes)} bytes")
+
+    for session in [*sessions, aggregator]:
+        session.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Speed of the blocked all-pairs distance engine (comparison_performance.
+all_pairs_scores) over the whole database, against one Python call per
+pair as in the per-comparison plaintext baseline.
+
+The per-pair time is measured on --sample-pairs random pairs and
+extrapolated to all N (N - 1) / 2. The engine runs over every pair for each
+--tile size; its scores are consumed (counted) but not written, see
+`comparison_performance.py --all-pairs` for the full run with output.
+
+    python benchmark_all_pairs.py --database IrisFingerprintDatabases/IrisDatabase --tile 256 1024 4096
+"""
+import argparse
+import time
+import numpy as np
+
+from comparison_performance import ALL_PAIRS_TILE, DATABASE, EvaluationCache, all_pairs_scores
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Blocked all-pairs distances vs one call per pair")
+    parser.add_argument("--database", default=DATABASE)
+    parser.add_argument("--tile", type=int, nargs="+", default=[256, ALL_PAIRS_TILE, 4096])
+    parser.add_argument("--sample-pairs", type=int, default=200_000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    cache = EvaluationCache.load(args.database, None)
+    templates, labels = cache.probes, cache.labels()
+    n = len(templates)
+    pairs = n * (n - 1) // 2
+    print(f"{n} templates of {len(cache.subjects)} subjects loaded in {time.perf_counter() - start:.2f}s, "
+          f"{pairs} pairs")
+
+    rng = np.random.default_rng(0)
+    i, j = rng.integers(0, n, size=(2, args.sample_pairs))
+    start = time.perf_counter()
+    for a, b in zip(i, j):
+        float(np.linalg.norm(templates[a] - templates[b]))
+    per_pair = (time.perf_counter() - start) / args.sample_pairs
+    print(f"{'method':<16} {'seconds':>10} {'pairs/s':>14} {'tile MiB':>9}")
+    print(f"{'per pair (est.)':<16} {per_pair * pairs:>10.1f} {1 / per_pair:>14.0f} {'-':>9}")
+
+    for tile in args.tile:
+        start = time.perf_counter()
+        mated = nonmated = 0
+        for mated_scores, nonmated_scores in all_pairs_scores(templates, labels, tile):
+            mated += len(mated_scores)
+            nonmated += len(nonmated_scores)
+        elapsed = time.perf_counter() - start
+        assert mated + nonmated == pairs
+        print(f"{f'tile {tile}':<16} {elapsed:>10.2f} {pairs / elapsed:>14.0f} {tile * tile * 8 / 2**20:>9.1f}")
+    print(f"{mated} mated, {nonmated} non-mated scores")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Sustained verification throughput of async_client.py with 1, 8 and 64
+probes in flight, both servers running.
+
+The probe shares are encrypted once up front (as in benchmark_servers.py),
+so every probe covers both servers' round trips over the pooled, pipelined
+connections plus deserializing the two replies; --decrypt adds the client's
+combine, square & sum and decryption.
+
+    python server1.py & python server2.py &
+    python benchmark_async_client.py --in-flight 1 8 64 --requests 256
+"""
+import argparse
+import asyncio
+import time
+import numpy as np
+import tenseal as ts
+
+from async_client import CONNECTIONS_PER_SERVER, REQUEST_TIMEOUT, AsyncMatchingClient
+from bench_utils import client_contexts, latency_header, latency_row
+from ckks_utils import squared_norm
+from client import SERVERS
+from secret_sharing import split_into_shares
+
+
+async def run_level(client, args, shares, eval_context, in_flight):
+    latencies = []
+    traffic = []
+    distances = []
+    remaining = iter(range(args.requests))
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            enc_total_diff, counter = await client.verify(args.id, shares)
+            if args.decrypt:
+                distances.append(squared_norm(enc_total_diff, eval_context).decrypt()[0])
+            latencies.append(time.perf_counter() - start)
+            traffic.append(counter.total)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(in_flight)))
+    wall = time.perf_counter() - start
+
+    print(f"{in_flight:>9} {len(latencies):>9} {len(latencies) / wall:>10.2f} {latency_row(latencies, width=10)} "
+          f"{int(np.mean(traffic)):>12}")
+    if distances:
+        print(f"{'':>9} Euclidean Distance: {np.sqrt(max(distances[-1], 0))}")
+
+
+async def run(args):
+    probe = np.load(args.probe)
+    context, ctx_bytes, eval_context = client_contexts(len(probe))
+    p1, p2 = split_into_shares(probe)
+    shares = (ts.ckks_vector(context, p1.tolist()).serialize(), ts.ckks_vector(context, p2.tolist()).serialize())
+
+    client = await AsyncMatchingClient.connect(SERVERS, ctx_bytes, context, args.connections, args.timeout)
+    print(f"{args.requests} probes per level, {args.connections} connection(s) per server")
+    print(f"{'in flight':>9} {'probes':>9} {'probes/s':>10} {latency_header(width=10)} {'bytes/probe':>12}")
+    try:
+        for in_flight in args.in_flight:
+            await run_level(client, args, shares, eval_context, in_flight)
+    finally:
+        await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipelined asyncio client throughput")
+    parser.add_argument("--in-flight", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--requests", type=int, default=256, help="probes per in-flight level")
+    parser.add_argument("--connections", type=int, default=CONNECTIONS_PER_SERVER,
+                        help="pooled connections per server")
+    parser.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT, help="seconds per request")
+    parser.add_argument("--decrypt", action="store_true", help="also combine and decrypt every result")
+    parser.add_argument("--id", default="3567")
+    parser.add_argument("--probe", default="IrisFingerprintDatabases/FingerprintDatabase/3567/3567d11.npy")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Re-verification throughput of VERIFY_BATCH against one VERIFY request per
+pair, both servers running.
+
+A pool of probe share pairs is encrypted once up front and cycled over the
+enrolled IDs (the servers' template caches are warm either way), so the
+numbers cover framing, context lookups and the servers' ciphertext -
+plaintext work plus the client's deserialization of every diff.
+
+    python server1.py & python server2.py &
+    python benchmark_batch.py --pairs 512 --batch-sizes 1 16 64 256
+"""
+import argparse
+import itertools
+import time
+import numpy as np
+import tenseal as ts
+
+from bench_utils import client_contexts
+from ckks_utils import squared_norm
+from client import BANDWIDTH, SERVERS, ServerSession, run_parallel, send_and_receive_server, verify_batch
+from secret_sharing import split_into_shares
+from template_store import open_store
+
+
+def report(label, pairs, elapsed, traffic):
+    print(f"{label:<14} {pairs:>7} {pairs / elapsed:>10.1f} {elapsed / pairs * 1000:>10.3f} {traffic // pairs:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="VERIFY_BATCH vs one VERIFY per pair")
+    parser.add_argument("--pairs", type=int, default=512)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 16, 64, 256])
+    parser.add_argument("--shares", type=int, default=8, help="distinct encrypted probes to cycle through")
+    parser.add_argument("--database", default="server1_database",
+                        help="store to read the enrolled IDs from")
+    parser.add_argument("--probe", default="IrisFingerprintDatabases/FingerprintDatabase/3567/3567d11.npy")
+    args = parser.parse_args()
+
+    store = open_store(args.database)
+    ids = [id for id in store.subjects() if (id, f"{id}d0") in store]
+    probe = np.load(args.probe)
+    context, ctx_bytes, eval_context = client_contexts(len(probe))
+    shares = []
+    for _ in range(args.shares):
+        p1, p2 = split_into_shares(probe)
+        shares.append((ts.ckks_vector(context, p1.tolist()).serialize(),
+                       ts.ckks_vector(context, p2.tolist()).serialize()))
+    workload = list(itertools.islice(zip(itertools.cycle(ids), itertools.cycle(shares)), args.pairs))
+
+    sessions = [ServerSession(host, port, ctx_bytes) for host, port in SERVERS]
+    print(f"{args.pairs} pairs over {len(ids)} enrolled IDs")
+    print(f"{'mode':<14} {'pairs':>7} {'pairs/s':>10} {'ms/pair':>10} {'bytes/pair':>12}")
+
+    start_bytes = BANDWIDTH.total
+    start = time.perf_counter()
+    for id, (enc_p1, enc_p2) in workload:
+        results = {}
+        run_parallel([
+            (send_and_receive_server, (sessions[0], id, enc_p1, context, results, 0)),
+            (send_and_receive_server, (sessions[1], id, enc_p2, context, results, 1)),
+        ])
+    report("VERIFY", args.pairs, time.perf_counter() - start, BANDWIDTH.total - start_bytes)
+
+    for batch_size in args.batch_sizes:
+        start_bytes = BANDWIDTH.total
+        start = time.perf_counter()
+        for first in range(0, len(workload), batch_size):
+            batch = workload[first:first + batch_size]
+            diffs = verify_batch(sessions, [id for id, _ in batch], list(zip(*[shares for _, shares in batch])),
+                                 context)
+        report(f"BATCH {batch_size}", args.pairs, time.perf_counter() - start, BANDWIDTH.total - start_bytes)
+    # Last pair of the last batch, as a sanity check of the streamed results
+    print(f"Euclidean Distance (ID={batch[-1][0]}): "
+          f"{np.sqrt(max(squared_norm(diffs[-1], eval_context).decrypt()[0], 0))}")
+
+    for session in sessions:
+        session.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Frame compression trade-off: wire vs logical bytes and time per phase for
+every installed codec, both servers running.
+
+Each codec gets fresh sessions (so the context upload is measured too),
+--requests verifications with compact shares and one identification. With
+--link-mbps the connections go through a local proxy that forwards at most
+that many megabits per second in each direction, to see when spending CPU
+on compression pays off.
+
+    python server1.py & python server2.py &
+    python benchmark_codecs.py --requests 20
+    python benchmark_codecs.py --requests 20 --link-mbps 100
+"""
+import argparse
+import socket
+import threading
+import time
+import numpy as np
+
+from bench_utils import client_contexts
+from client import (
+    BANDWIDTH, SERVERS, ServerSession, encrypt_share, identify, run_parallel, send_and_receive_server
+)
+from identification import GalleryScorer, packing_layout, replicate
+from secret_sharing import split_into_shares
+from transport import CODECS, set_nodelay
+
+
+class ThrottledProxy:
+    """Forwards connections to `target`, at most `rate` bytes per second in each direction."""
+
+    def __init__(self, target, rate):
+        self.target = target
+        self.rate = rate
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.address = self.listener.getsockname()
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def accept(self):
+        while True:
+            client, _ = self.listener.accept()
+            upstream = socket.create_connection(self.target)
+            for sock in (client, upstream):
+                set_nodelay(sock)
+            threading.Thread(target=self.forward, args=(client, upstream), daemon=True).start()
+            threading.Thread(target=self.forward, args=(upstream, client), daemon=True).start()
+
+    def forward(self, source, destination):
+        try:
+            while True:
+                chunk = source.recv(1 << 16)
+                if not chunk:
+                    break
+                time.sleep(len(chunk) / self.rate)
+                destination.sendall(chunk)
+        except OSError:
+            pass
+        finally:
+            destination.close()
+
+
+def measure(label, codec_name, action):
+    sent, received = BANDWIDTH.sent, BANDWIDTH.received
+    logical_sent, logical_received = BANDWIDTH.logical_sent, BANDWIDTH.logical_received
+    start = time.perf_counter()
+    result = action()
+    elapsed = time.perf_counter() - start
+    wire = BANDWIDTH.sent - sent + BANDWIDTH.received - received
+    logical = BANDWIDTH.logical_sent - logical_sent + BANDWIDTH.logical_received - logical_received
+    print(f"{codec_name:<6} {label:<14} {wire:>12} {logical:>12} {wire / logical:>7.3f} {elapsed:>10.3f}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wire vs logical bytes per frame codec")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--link-mbps", type=float, default=0, help="throttle every connection (0: loopback)")
+    parser.add_argument("--id", default="3567")
+    parser.add_argument("--probe", default="IrisFingerprintDatabases/FingerprintDatabase/3567/3567d11.npy")
+    args = parser.parse_args()
+
+    servers = SERVERS
+    if args.link_mbps:
+        servers = [ThrottledProxy(server, args.link_mbps * 1e6 / 8).address for server in SERVERS]
+
+    probe = np.load(args.probe)
+    context, ctx_bytes, eval_context = client_contexts(len(probe))
+    p1, p2 = split_into_shares(probe)
+    shares = [encrypt_share(context, p1), encrypt_share(context, p2)]
+    block_dim, per_block = packing_layout(len(probe))
+    gallery_shares = [encrypt_share(context, replicate(p, block_dim, per_block)) for p in (p1, p2)]
+    scorer = GalleryScorer(context, eval_context, block_dim)
+
+    print(f"Link: {f'{args.link_mbps} Mbit/s' if args.link_mbps else 'loopback'}")
+    print(f"{'codec':<6} {'phase':<14} {'wire bytes':>12} {'logical':>12} {'ratio':>7} {'seconds':>10}")
+    for codec_name in ["none", *(codec.name for codec in CODECS)]:
+        codecs = [] if codec_name == "none" else [codec_name]
+        sessions = measure("register", codec_name, lambda: [
+            ServerSession(host, port, ctx_bytes, codecs=codecs) for host, port in servers
+        ])
+
+        def verify():
+            for _ in range(args.requests):
+                results = {}
+                run_parallel([
+                    (send_and_receive_server, (sessions[i], args.id, shares[i], context, results, i))
+                    for i in range(2)
+                ])
+
+        measure(f"verify x{args.requests}", codec_name, verify)
+        measure("identify", codec_name, lambda: identify(sessions, gallery_shares, context, scorer, per_block))
+        for session in sessions:
+            session.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Wire size and precision of compact ciphertexts (see ckks_utils.py) against
+the old full-size ones, both servers running.
+
+For every enrolled ID the probe is verified once per mode and the decrypted
+distance is compared with the plaintext distance to the original template,
+so the table shows what dropping levels and seeding costs in accuracy.
+
+    python server1.py & python server2.py &
+    python benchmark_compact.py --pairs 100
+"""
+import argparse
+import os
+import numpy as np
+
+from bench_utils import client_contexts
+from ckks_utils import squared_norm
+from client import BANDWIDTH, SERVERS, ServerSession, encrypt_share, run_parallel, send_and_receive_server
+from secret_sharing import split_into_shares
+from template_store import open_store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact vs full-size ciphertexts on the wire")
+    parser.add_argument("--pairs", type=int, default=100)
+    parser.add_argument("--database", default="server1_database", help="store to read the enrolled IDs from")
+    parser.add_argument("--templates", default="IrisFingerprintDatabases/FingerprintDatabase",
+                        help="plaintext <id>/<id>d0.npy templates for the reference distances")
+    parser.add_argument("--probe", default="IrisFingerprintDatabases/FingerprintDatabase/3567/3567d11.npy")
+    args = parser.parse_args()
+
+    store = open_store(args.database)
+    ids = [id for id in store.subjects() if (id, f"{id}d0") in store]
+    ids = [ids[i % len(ids)] for i in range(args.pairs)]
+    probe = np.load(args.probe)
+    expected = [np.linalg.norm(np.load(os.path.join(args.templates, id, f"{id}d0.npy")) - probe) for id in ids]
+
+    context, ctx_bytes, eval_context = client_contexts(len(probe))
+    sessions = [ServerSession(host, port, ctx_bytes) for host, port in SERVERS]
+
+    print(f"{args.pairs} verifications, bytes per uploaded share / server reply (frames included)")
+    print(f"{'mode':<10} {'upload':>10} {'reply':>10} {'bytes/verif':>12} {'max |err|':>11} {'mean |err|':>11}")
+    for mode, full_size in (("full-size", True), ("compact", False)):
+        errors = []
+        sent, received = BANDWIDTH.sent, BANDWIDTH.received
+        for id, distance in zip(ids, expected):
+            p1, p2 = split_into_shares(probe)
+            shares = [encrypt_share(context, p1, full_size), encrypt_share(context, p2, full_size)]
+            results = {}
+            run_parallel([
+                (send_and_receive_server, (sessions[i], id, shares[i], context, results, i)) for i in range(2)
+            ])
+            enc_sq_dist = squared_norm(results[0] + results[1], eval_context)
+            errors.append(abs(np.sqrt(max(enc_sq_dist.decrypt()[0], 0)) - distance))
+        sent, received = BANDWIDTH.sent - sent, BANDWIDTH.received - received
+        print(f"{mode:<10} {sent // (2 * args.pairs):>10} {received // (2 * args.pairs):>10} "
+              f"{(sent + received) // args.pairs:>12} {max(errors):>11.2e} {np.mean(errors):>11.2e}")
+
+    for session in sessions:
+        session.close()
+
+
+if __name__ == "__main__":
+    main()
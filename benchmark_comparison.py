@@ -0,0 +1,94 @@
+"""
+Comparisons per second of comparison_performance.py's evaluation engine,
+plaintext and encrypted, against the serial loop it replaced.
+
+    legacy     the old main(): every probe np.load()ed again for every pair,
+               the impostor candidates rebuilt from the full file list and
+               shuffled for every subject, one comparison after the other
+    engine     EvaluationCache + index-arithmetic impostors + process pool,
+               for every --workers count (cache loading reported separately)
+
+Encrypted comparisons take tens of milliseconds each, so only the first
+--encrypted-subjects subjects are scored in that mode.
+
+    python benchmark_comparison.py --workers 1 2 4 8
+"""
+import argparse
+import glob
+import os
+import random
+import time
+import numpy as np
+
+from comparison_performance import (
+    DATABASE, SAMPLES_PER_SUBJECT, SERVER_STORES, EvaluationCache, compare_plain, evaluate
+)
+from template_store import open_store
+
+
+def legacy_scores(db_root, store_paths):
+    """Score count of the old serial evaluation (plaintext), same sampling rules."""
+    stores = [open_store(path) for path in store_paths]
+    subject_ids = sorted(os.listdir(db_root))
+    all_files = {subject: sorted(glob.glob(os.path.join(db_root, subject, "*.npy"))) for subject in subject_ids}
+    global_pool = [(sid, f) for sid, files in all_files.items() for f in files]
+    rng = np.random.default_rng(0)
+    count = 0
+    for subject in subject_ids:
+        chosen = all_files[subject][:SAMPLES_PER_SUBJECT]
+        if len(chosen) < SAMPLES_PER_SUBJECT:
+            continue
+        templates = [os.path.splitext(os.path.basename(path))[0] for path in chosen]
+        mated = 0
+        for i in range(SAMPLES_PER_SUBJECT):
+            for j in range(i + 1, SAMPLES_PER_SUBJECT):
+                compare_plain(np.load(chosen[j]), (stores[0].get(subject, templates[i]),
+                                                   stores[1].get(subject, templates[i])), rng)
+                mated += 1
+        other_files = [(sid, f) for sid, f in global_pool if sid != subject]
+        random.shuffle(other_files)
+        for _, path in other_files[:mated]:
+            compare_plain(np.load(path), (stores[0].get(subject, templates[0]), stores[1].get(subject, templates[0])),
+                          rng)
+        count += 2 * mated
+    return count
+
+
+def run_engine(cache, encrypted, workers, limit=None):
+    start = time.perf_counter()
+    count = sum(len(mated) + len(nonmated) for _, mated, nonmated, *_ in evaluate(cache, encrypted, workers, 0, limit))
+    return count, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluation engine throughput")
+    parser.add_argument("--database", default=DATABASE)
+    parser.add_argument("--servers", nargs=2, default=SERVER_STORES, metavar="STORE")
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, os.cpu_count()}))
+    parser.add_argument("--encrypted-subjects", type=int, default=4,
+                        help="subjects scored in the encrypted mode (0 skips it)")
+    parser.add_argument("--no-legacy", action="store_true", help="skip the old serial loop")
+    args = parser.parse_args()
+
+    print(f"{'mode':<10} {'workers':>7} {'comparisons':>12} {'seconds':>9} {'comparisons/s':>14}")
+    if not args.no_legacy:
+        start = time.perf_counter()
+        count = legacy_scores(args.database, args.servers)
+        elapsed = time.perf_counter() - start
+        print(f"{'legacy':<10} {1:>7} {count:>12} {elapsed:>9.2f} {count / elapsed:>14.1f}")
+
+    start = time.perf_counter()
+    cache = EvaluationCache.load(args.database, args.servers)
+    print(f"Cache: {len(cache)} samples of {len(cache.subjects)} subjects loaded in {time.perf_counter() - start:.2f}s")
+
+    for encrypted in (False, True):
+        if encrypted and not args.encrypted_subjects:
+            continue
+        for workers in args.workers:
+            count, elapsed = run_engine(cache, encrypted, workers, args.encrypted_subjects if encrypted else None)
+            mode = "encrypted" if encrypted else "plaintext"
+            print(f"{mode:<10} {workers:>7} {count:>12} {elapsed:>9.2f} {count / elapsed:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
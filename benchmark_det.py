@@ -0,0 +1,52 @@
+"""
+ROCCH computation of DET.py (DET.rocch and the PAV isotonic regression
+DET.pavx behind it, used by DET.plot(..., plot_rocch=True)) against the
+versions it replaced, legacy_pavx / legacy_rocch of test_det.py: a Python
+loop over numpy scalars for PAV and a sum over all scores per ROCCH bin.
+
+The timings run on --scores scores (a --mated-fraction of them mated), the
+legacy functions only up to --legacy-max scores. test_det.py checks that
+both return identical results.
+
+    python benchmark_det.py --scores 10000 100000 1000000 10000000
+"""
+import argparse
+import time
+import numpy as np
+
+from DET import rocch
+from test_det import legacy_rocch
+
+
+def scores(rng, count, mated_fraction):
+    mated_count = max(1, int(count * mated_fraction))
+    return rng.normal(2.0, 1.0, mated_count), rng.normal(0.0, 1.0, count - mated_count)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DET.rocch / DET.pavx against the legacy loops")
+    parser.add_argument("--scores", type=int, nargs="+", default=[10_000, 100_000, 1_000_000, 10_000_000])
+    parser.add_argument("--mated-fraction", type=float, default=0.1)
+    parser.add_argument("--legacy-max", type=int, default=100_000, help="largest score count the legacy code runs on")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'scores':>10} {'legacy rocch':>13} {'rocch':>8} {'speedup':>8}   seconds")
+    for count in args.scores:
+        tar, non = scores(rng, count, args.mated_fraction)
+        new_time = timed(rocch, tar, non)
+        if count <= args.legacy_max:
+            old_time = timed(legacy_rocch, tar, non)
+            print(f"{count:>10} {old_time:>13.2f} {new_time:>8.2f} {old_time / new_time:>7.0f}x")
+        else:
+            print(f"{count:>10} {'-':>13} {new_time:>8.2f} {'-':>8}")
+
+
+if __name__ == "__main__":
+    main()
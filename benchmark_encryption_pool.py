@@ -0,0 +1,95 @@
+"""
+Online encryption time of the client's shares with the encryption pool
+(client.EncryptionPool) against encrypting them on the critical path.
+
+Every verification encrypts two fresh shares of the probe:
+
+    compact        encrypt_share(): secret-key, seed-compressed (the default)
+    public key     transport-level public-key encryption (what a pool zero costs)
+    pool warm      the pool is full when the verification starts, both shares
+                   are encoded and added to precomputed zeros
+    pool cold      a pool created just before the verification: nothing is
+                   precomputed yet, the shares fall back to encrypt_share()
+                   while the refill thread competes for the CPU
+    pool busy      verifications back to back without waiting for the refill
+
+Offline is the refill thread's cost per zero, which the client can spend
+while it waits on the network (session registration, earlier requests).
+
+    python benchmark_encryption_pool.py --requests 100
+"""
+import argparse
+import time
+import numpy as np
+
+from bench_utils import client_contexts, latency_header, latency_row
+from ckks_utils import encrypt_vector_bytes
+from client import EncryptionPool, encrypt_share
+from secret_sharing import split_into_shares
+
+
+def time_requests(requests, probe, encrypt, before=None):
+    """Per-verification online time (both shares) and upload size of `encrypt`, which takes the shares."""
+    times = []
+    for _ in range(requests):
+        if before:
+            before()
+        shares = split_into_shares(probe)
+        start = time.perf_counter()
+        enc_shares = encrypt(shares)
+        times.append(time.perf_counter() - start)
+    return times, sum(map(len, enc_shares))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Online share encryption with and without the encryption pool")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--pool-size", type=int, default=8)
+    parser.add_argument("--probe", default="IrisFingerprintDatabases/FingerprintDatabase/3567/3567d11.npy")
+    args = parser.parse_args()
+
+    probe = np.load(args.probe)
+    context, _, _ = client_contexts()
+
+    rows = [
+        ("compact", *time_requests(args.requests, probe,
+                                   lambda shares: [encrypt_share(context, share) for share in shares]), ""),
+        ("public key", *time_requests(args.requests, probe,
+                                      lambda shares: [encrypt_vector_bytes(context, share) for share in shares]), ""),
+    ]
+
+    pool = EncryptionPool(context, args.pool_size)
+    fill_start = time.perf_counter()
+    pool.wait_full()
+    offline = (time.perf_counter() - fill_start) / args.pool_size * 1000
+    lat, size = time_requests(args.requests, probe, pool.encrypt, pool.wait_full)
+    rows.append(("pool warm", lat, size, f"{pool.hits} hits, {pool.misses} misses"))
+    pool.close()
+
+    cold_pools = []
+
+    def new_pool():
+        if cold_pools:
+            cold_pools[-1].close()
+        cold_pools.append(EncryptionPool(context, args.pool_size))
+
+    lat, size = time_requests(args.requests, probe, lambda shares: cold_pools[-1].encrypt(shares), new_pool)
+    cold_pools[-1].close()
+    rows.append(("pool cold", lat, size, f"{sum(p.hits for p in cold_pools)} hits, "
+                                         f"{sum(p.misses for p in cold_pools)} misses"))
+
+    pool = EncryptionPool(context, args.pool_size)
+    pool.wait_full()
+    lat, size = time_requests(args.requests, probe, pool.encrypt)
+    rows.append(("pool busy", lat, size, f"{pool.hits} hits, {pool.misses} misses"))
+    pool.close()
+
+    print(f"{args.requests} verifications of 2 shares, online time per verification, pool of {args.pool_size}")
+    print(f"{'mode':<11} {latency_header()} {'upload B':>9}  notes")
+    for name, lat, size, notes in rows:
+        print(f"{name:<11} {latency_row(lat, digits=3)} {size:>9}  {notes}")
+    print(f"Offline cost per precomputed zero: {offline:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+End-to-end verification latency of the Beaver-triple MPC mode against the
+CKKS path, with both servers running.
+
+Every CKKS request covers what client.py does per probe once the context is
+registered: split, encrypt both shares, one round trip to each server,
+combine, square & sum and decrypt. Every MPC request covers split and the two
+rounds of beaver.py on fixed-point ring shares. Both compute the same
+distance, the largest difference is reported.
+
+    python beaver.py --count 10000
+    python server1.py & python server2.py &
+    python benchmark_mpc.py --requests 200
+"""
+import argparse
+import time
+import numpy as np
+import tenseal as ts
+
+from beaver import TripleAllocator, CLIENT_TRIPLES
+from bench_utils import client_contexts, latency_header, latency_row
+from ckks_utils import squared_norm
+from client import BANDWIDTH, SERVERS, ServerSession, mpc_squared_distance, run_parallel, send_and_receive_server
+from secret_sharing import split_into_ring_shares, split_into_shares
+from transport import connect
+
+
+def ckks_squared_distance(sessions, biometric_id, probe, context, eval_context):
+    p1, p2 = split_into_shares(probe)
+    enc_p1_bytes = ts.ckks_vector(context, p1.tolist()).serialize()
+    enc_p2_bytes = ts.ckks_vector(context, p2.tolist()).serialize()
+    results = {}
+    run_parallel([
+        (send_and_receive_server, (sessions[0], biometric_id, enc_p1_bytes, context, results, 0)),
+        (send_and_receive_server, (sessions[1], biometric_id, enc_p2_bytes, context, results, 1)),
+    ])
+    return squared_norm(results[0] + results[1], eval_context).decrypt()[0]
+
+
+def report(label, timings, bytes_per_request):
+    print(f"{label:<6} {latency_row(timings, width=10, digits=3)} {bytes_per_request:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MPC vs CKKS verification latency")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--id", default="3567")
+    parser.add_argument("--probe", default="IrisFingerprintDatabases/FingerprintDatabase/3567/3567d11.npy")
+    parser.add_argument("--triples", default=CLIENT_TRIPLES)
+    args = parser.parse_args()
+
+    probe = np.load(args.probe)
+
+    context, ctx_bytes, eval_context = client_contexts(len(probe))
+    sessions = [ServerSession(host, port, ctx_bytes) for host, port in SERVERS]
+
+    ckks_timings = []
+    ckks_distances = []
+    start_bytes = BANDWIDTH.total
+    for _ in range(args.requests):
+        start = time.perf_counter()
+        ckks_distances.append(ckks_squared_distance(sessions, args.id, probe, context, eval_context))
+        ckks_timings.append(time.perf_counter() - start)
+    ckks_bytes = (BANDWIDTH.total - start_bytes) // args.requests
+    for session in sessions:
+        session.close()
+
+    socks = [connect(server) for server in SERVERS]
+    mpc_timings = []
+    mpc_distances = []
+    start_bytes = BANDWIDTH.total
+    allocator = TripleAllocator(args.triples)
+    for triple_id in allocator.take(args.requests):
+        start = time.perf_counter()
+        shares = split_into_ring_shares(probe, allocator.dtype)
+        sq_dist, _, _ = mpc_squared_distance(socks, args.id, triple_id, shares, allocator.dtype)
+        mpc_distances.append(sq_dist)
+        mpc_timings.append(time.perf_counter() - start)
+    mpc_bytes = (BANDWIDTH.total - start_bytes) // args.requests
+    for sock in socks:
+        sock.close()
+
+    print(f"{args.requests} verifications of ID {args.id}")
+    print(f"{'mode':<6} {latency_header(width=10)} {'bytes/req':>12}")
+    report("CKKS", ckks_timings, ckks_bytes)
+    report("MPC", mpc_timings, mpc_bytes)
+    print(f"Speed-up (mean): {np.mean(ckks_timings) / np.mean(mpc_timings):.1f}x, "
+          f"traffic {ckks_bytes / mpc_bytes:.0f}x smaller")
+    print(f"Max |squared distance CKKS - MPC|: "
+          f"{np.max(np.abs(np.array(ckks_distances) - np.array(mpc_distances))):.2e}")
+
+
+if __name__ == "__main__":
+    main()
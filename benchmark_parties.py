@@ -0,0 +1,123 @@
+"""
+How verification latency, client bandwidth and per-server storage scale
+with the number of parties N the templates are shared among.
+
+For every N the input database is split N ways (N-of-N additive shares, see
+database_splitter.py) into a scratch directory, N matching servers are
+started on it (matching_server.py --party i --parties N) and the client
+verifies the probe --requests times: fresh shares encrypted for every
+request, all N servers queried in parallel, the N diffs summed, squared &
+summed and decrypted.
+
+    python benchmark_parties.py --parties 2 3 4 5 6 7 8 --requests 20
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+
+from benchmark_servers import wait_for_port
+from bench_utils import client_contexts, latency_header, latency_row
+from ckks_utils import squared_norm
+from client import BANDWIDTH, ServerSession, encrypt_share, server_addresses, verify_parties
+from database_splitter import split_subject
+from secret_sharing import split_into_shares
+from template_store import TemplateStore
+
+BENCHMARK_BASE_PORT = 55431
+
+
+def split_database(input_folder, parties, output_folder):
+    """Store directories of the `parties` servers holding N-of-N shares of `input_folder`."""
+    folders = [Path(output_folder, f"server{party + 1}_database") for party in range(parties)]
+    stores = None
+    for subject_folder in sorted(p for p in Path(input_folder).iterdir() if p.is_dir()):
+        keys, shares, _ = split_subject(subject_folder, "float64", False, parties)
+        if not keys:
+            continue
+        if stores is None:
+            stores = [TemplateStore.create(folder, shares[0].shape[1]) for folder in folders]
+        for store, share in zip(stores, shares):
+            store.append(keys, share)
+    return folders
+
+
+def folder_size(folder):
+    return sum(path.stat().st_size for path in Path(folder).iterdir())
+
+
+def start_servers(folders, base_port):
+    script = Path(__file__).with_name("matching_server.py")
+    servers = [
+        subprocess.Popen([sys.executable, str(script), "--party", str(party), "--parties", str(len(folders)),
+                          "--port", str(base_port + party), "--database", str(folder)],
+                         stdout=subprocess.DEVNULL)
+        for party, folder in enumerate(folders)
+    ]
+    try:
+        for party in range(len(folders)):
+            wait_for_port("127.0.0.1", base_port + party)
+    except TimeoutError:
+        stop_servers(servers)
+        raise
+    return servers
+
+
+def stop_servers(servers):
+    for server in servers:
+        server.send_signal(signal.SIGINT)
+    for server in servers:
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency and bandwidth against the number of parties")
+    parser.add_argument("--parties", type=int, nargs="+", default=list(range(2, 9)))
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--input", default="IrisFingerprintDatabases/FingerprintDatabase")
+    parser.add_argument("--base-port", type=int, default=BENCHMARK_BASE_PORT,
+                        help="party i of the benchmark servers listens on this + i")
+    parser.add_argument("--id", default="3567")
+    parser.add_argument("--probe", default="IrisFingerprintDatabases/FingerprintDatabase/3567/3567d11.npy")
+    args = parser.parse_args()
+
+    probe = np.load(args.probe)
+    context, ctx_bytes, eval_context = client_contexts(len(probe))
+    expected = np.linalg.norm(np.load(os.path.join(args.input, args.id, f"{args.id}d0.npy")) - probe)
+
+    print(f"{args.requests} verifications per N, client traffic per verification in bytes")
+    print(f"{'N':>3} {latency_header()} {'sent':>9} {'received':>9} {'total':>9} "
+          f"{'store/server':>13} {'|error|':>9}")
+    with tempfile.TemporaryDirectory() as scratch:
+        for parties in args.parties:
+            folders = split_database(args.input, parties, Path(scratch, str(parties)))
+            servers = start_servers(folders, args.base_port)
+            try:
+                sessions = [ServerSession(host, port, ctx_bytes)
+                            for host, port in server_addresses(parties, base_port=args.base_port)]
+                latencies = []
+                sent, received = BANDWIDTH.sent, BANDWIDTH.received
+                for _ in range(args.requests):
+                    start = time.perf_counter()
+                    enc_shares = [encrypt_share(context, share) for share in split_into_shares(probe, parties=parties)]
+                    enc_total_diff = verify_parties(sessions, args.id, enc_shares, context)
+                    sq_dist = squared_norm(enc_total_diff, eval_context).decrypt()[0]
+                    latencies.append(time.perf_counter() - start)
+                sent = (BANDWIDTH.sent - sent) // args.requests
+                received = (BANDWIDTH.received - received) // args.requests
+                for session in sessions:
+                    session.close()
+            finally:
+                stop_servers(servers)
+            error = abs(np.sqrt(max(sq_dist, 0)) - expected)
+            print(f"{parties:>3} {latency_row(latencies)} "
+                  f"{sent:>9} {received:>9} {sent + received:>9} {folder_size(folders[0]):>13} {error:>9.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Critical path of a client's first verification, staged (register the
+context, encrypt the shares, query the servers, in turn) against pipelined
+(client.verify_pipelined: every share streamed to its server as soon as it
+is encrypted, while the other servers are still registering).
+
+The two flows alternate, each with a fresh context so the servers deserialize
+it every time. The critical path runs from the first connection to the
+encrypted total difference; context creation and the final square & sum
+are the same in both flows and left out.
+
+    python server1.py & python server2.py &
+    python benchmark_pipeline.py --requests 30
+"""
+import argparse
+import time
+import numpy as np
+
+from bench_utils import client_contexts, latency_header, latency_row
+from client import ServerSession, encrypt_share, server_addresses, verify_parties, verify_pipelined
+from secret_sharing import split_into_shares
+
+
+def staged(addresses, ctx_bytes, biometric_id, shares, context):
+    sessions = [ServerSession(host, port, ctx_bytes) for host, port in addresses]
+    enc_shares = [encrypt_share(context, share) for share in shares]
+    verify_parties(sessions, biometric_id, enc_shares, context)
+    return sessions
+
+
+def pipelined(addresses, ctx_bytes, biometric_id, shares, context):
+    jobs = [lambda share=share: encrypt_share(context, share) for share in shares]
+    sessions, *_ = verify_pipelined(addresses, ctx_bytes, biometric_id, jobs, context)
+    return sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Staged vs pipelined first verification")
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--parties", type=int, default=2)
+    parser.add_argument("--id", default="3567")
+    parser.add_argument("--probe", default="IrisFingerprintDatabases/FingerprintDatabase/3567/3567d11.npy")
+    args = parser.parse_args()
+
+    probe = np.load(args.probe)
+    addresses = server_addresses(args.parties)
+    flows = {"staged": staged, "pipelined": pipelined}
+    latencies = {name: [] for name in flows}
+    for _ in range(args.requests):
+        for name, flow in flows.items():
+            context, ctx_bytes, _ = client_contexts()
+            shares = split_into_shares(probe, parties=args.parties)
+            start = time.perf_counter()
+            sessions = flow(addresses, ctx_bytes, args.id, shares, context)
+            latencies[name].append(time.perf_counter() - start)
+            for session in sessions:
+                session.close()
+
+    print(f"{args.requests} first verifications per flow, {args.parties} servers, critical path")
+    print(f"{'flow':<10} {latency_header()}")
+    for name, lat in latencies.items():
+        print(f"{name:<10} {latency_row(lat)}")
+    staged_mean, pipelined_mean = (np.mean(latencies[name]) for name in flows)
+    print(f"Pipelined critical path: {1 - pipelined_mean / staged_mean:+.1%} shorter than staged")
+
+
+if __name__ == "__main__":
+    main()
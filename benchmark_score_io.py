@@ -0,0 +1,94 @@
+"""
+Save and load times of --scores comparison scores (half mated, half
+non-mated) in the gzip text files the evaluation used to write against the
+binary score files of score_io.py.
+
+    text          np.savetxt("%.8f") to .txt.gz, np.loadtxt
+    binary        ScoreFileWriter, appended in --chunk score chunks with a
+                  flush each (as the evaluation does per subject); np.load
+    binary+pairs  the same with the (template row, probe row) of every score
+
+"load" reads every score into memory; "mmap" maps the files and sums the
+scores once, so it includes the page-ins of a first pass over them.
+
+    python benchmark_score_io.py --scores 10000000
+"""
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+
+from score_io import ScoreFileWriter, TEXT_FORMAT, load_scores, score_paths
+
+
+def save_text(system_name, mated, nonmated):
+    paths = score_paths(system_name)
+    np.savetxt(paths["mated_text"], mated, fmt=TEXT_FORMAT)
+    np.savetxt(paths["nonmated_text"], nonmated, fmt=TEXT_FORMAT)
+    return [paths["mated_text"], paths["nonmated_text"]]
+
+
+def load_text(system_name):
+    paths = score_paths(system_name)
+    return np.loadtxt(paths["mated_text"]), np.loadtxt(paths["nonmated_text"])
+
+
+def save_binary(system_name, mated, nonmated, chunk, pairs=None):
+    writer = ScoreFileWriter(system_name, samples=None if pairs is None else [("0", "0")])
+    for start in range(0, len(mated), chunk):
+        end = start + chunk
+        if pairs is None:
+            writer.append(mated[start:end], nonmated[start:end])
+        else:
+            writer.append(mated[start:end], nonmated[start:end], pairs[start:end], pairs[start:end])
+        writer.flush()
+    writer.close()
+    return [path for path in writer.paths.values() if not path.endswith(".txt.gz") and os.path.exists(path)]
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Text vs binary score files")
+    parser.add_argument("--scores", type=int, default=10_000_000)
+    parser.add_argument("--chunk", type=int, default=100_000, help="scores per append in the binary writer")
+    parser.add_argument("--dir", default=None, help="where to write the files (default: a temporary directory)")
+    parser.add_argument("--no-text", action="store_true", help="skip the (slow) text format")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    half = args.scores // 2
+    mated = rng.normal(0.9, 0.1, half)
+    nonmated = rng.normal(1.2, 0.1, half)
+    pairs = rng.integers(0, 20_000, size=(half, 2))
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        print(f"{2 * half} scores, seconds")
+        print(f"{'format':<14} {'save':>8} {'load':>8} {'mmap':>8} {'MiB':>8}")
+        formats = [] if args.no_text else ["text"]
+        formats += ["binary", "binary+pairs"]
+        for fmt in formats:
+            system_name = os.path.join(tmp, fmt)
+            if fmt == "text":
+                paths, save_time = timed(save_text, system_name, mated, nonmated)
+                loaded, load_time = timed(load_text, system_name)
+                mmap_time = float("nan")
+            else:
+                paths, save_time = timed(save_binary, system_name, mated, nonmated, args.chunk,
+                                         pairs if fmt == "binary+pairs" else None)
+                loaded, load_time = timed(load_scores, system_name, False)
+                _, mmap_time = timed(lambda: [float(scores.sum()) for scores in load_scores(system_name)])
+            for original, scores in zip((mated, nonmated), loaded):
+                # %.8f text and float32 both keep the scores to well below 1e-6
+                assert len(scores) == half and np.abs(scores - original).max() < 1e-6
+            size = sum(os.path.getsize(path) for path in paths) / 2**20
+            print(f"{fmt:<14} {save_time:>8.2f} {load_time:>8.3f} {mmap_time:>8.3f} {size:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
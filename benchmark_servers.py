@@ -0,0 +1,142 @@
+"""
+Load test for the matching servers.
+
+Measures throughput and per-request latency of one matching server under
+concurrent clients. Client-side encryption is done once up front so the
+numbers only cover the server and the network.
+
+Modes:
+    persistent      one long-lived connection per client, many requests each
+    per-connection  a fresh TCP connection for every request
+    one-shot        the old model: a new server process for every request
+                    (spawns the server script with --once, clients must be 1)
+
+Example:
+    python server1.py &
+    python benchmark_servers.py --mode persistent --clients 1 4 16
+    python benchmark_servers.py --mode one-shot --clients 1 --requests 5
+"""
+import argparse
+import socket
+import subprocess
+import sys
+import threading
+import time
+import numpy as np
+import tenseal as ts
+
+from bench_utils import LATENCY_STATS, client_contexts, latency_header, latency_row
+from client import ServerSession
+from secret_sharing import split_into_shares
+
+
+def wait_for_port(host, port, timeout=60.0):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            socket.create_connection((host, port)).close()
+            return
+        except OSError:
+            time.sleep(0.01)
+    raise TimeoutError(f"Server on {host}:{port} did not come up")
+
+
+def run_client(args, payload, latencies, errors):
+    biometric_id, ctx_bytes, share_bytes, context = payload
+    session = None
+    try:
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            if args.mode == "one-shot":
+                server = subprocess.Popen(
+                    [sys.executable, args.server_script, "--once", "--port", str(args.port)],
+                    stdout=subprocess.DEVNULL,
+                )
+                # The --once server closes its listener after one connection,
+                # so the readiness probe has to be the real request.
+                deadline = time.perf_counter() + 60.0
+                while session is None:
+                    try:
+                        session = ServerSession(args.host, args.port, ctx_bytes)
+                    except OSError:
+                        if time.perf_counter() > deadline:
+                            raise
+                        time.sleep(0.01)
+            elif session is None:
+                # Only the very first connection of the run has to upload the
+                # context, later ones reuse the session by its hash
+                session = ServerSession(args.host, args.port, ctx_bytes, register=False)
+
+            session.verify(biometric_id, share_bytes, context)
+
+            if args.mode != "persistent":
+                session.close()
+                session = None
+            if args.mode == "one-shot":
+                server.wait()
+            latencies.append(time.perf_counter() - start)
+    except Exception as e:
+        errors.append(e)
+    finally:
+        if session is not None:
+            session.close()
+
+
+def run_level(args, payload, clients):
+    latencies = []
+    errors = []
+    threads = [
+        threading.Thread(target=run_client, args=(args, payload, latencies, errors))
+        for _ in range(clients)
+    ]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    if errors:
+        print(f"{clients:>7} clients: {len(errors)} client(s) failed, first error: {errors[0]!r}")
+    if not latencies:
+        return
+    print(f"{clients:>7} {len(latencies):>9} {len(latencies) / wall:>10.2f} "
+          f"{latency_row(latencies, LATENCY_STATS + ('max',), width=10)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Matching server load test")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=65431)
+    parser.add_argument("--mode", choices=["persistent", "per-connection", "one-shot"],
+                        default="persistent")
+    parser.add_argument("--server-script", default="server1.py",
+                        help="server launched per request in one-shot mode")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--requests", type=int, default=10, help="requests per client")
+    parser.add_argument("--id", default="3567")
+    parser.add_argument("--probe", default="IrisFingerprintDatabases/FingerprintDatabase/3567/3567d11.npy")
+    args = parser.parse_args()
+
+    if args.mode == "one-shot" and args.clients != [1]:
+        parser.error("one-shot mode only supports --clients 1")
+
+    context, ctx_bytes, _ = client_contexts()
+    p1, _ = split_into_shares(np.load(args.probe))
+    share_bytes = ts.ckks_vector(context, p1.tolist()).serialize()
+    payload = (args.id, ctx_bytes, share_bytes, context)
+
+    if args.mode != "one-shot":
+        wait_for_port(args.host, args.port)
+        # Register the context once so the timed requests only carry shares
+        ServerSession(args.host, args.port, ctx_bytes).close()
+
+    print(f"Mode: {args.mode}, {args.requests} request(s) per client, "
+          f"context {len(ctx_bytes)} bytes, share {len(share_bytes)} bytes")
+    print(f"{'clients':>7} {'requests':>9} {'req/s':>10} {latency_header(LATENCY_STATS + ('max',), width=10)}")
+    for clients in args.clients:
+        run_level(args, payload, clients)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Lookup latency of the packed template store against the .npy directory tree.
+
+Builds a synthetic gallery in both layouts and times random single-sample
+lookups, cold (file pages dropped from the page cache with
+posix_fadvise(DONTNEED) before the run) and warm (same lookups again).
+Directory and inode caches are not dropped, so cold directory lookups are
+still optimistic; use a fresh boot or /proc/sys/vm/drop_caches for fully
+cold numbers. Run it on a disk-backed directory, tmpfs has no cold state.
+
+    python benchmark_store.py --subjects 5000 --samples 10 --lookups 2000
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+
+from bench_utils import LATENCY_STATS, latency_header, latency_row
+from template_store import TemplateStore, open_store, SHARES_FILE, INDEX_FILE
+
+
+def build_tree(root, subjects, samples, dim, rng):
+    for s in range(subjects):
+        folder = root / str(s)
+        folder.mkdir(parents=True)
+        for d in range(samples):
+            np.save(folder / f"{s}d{d}.npy", rng.random(dim))
+
+
+def drop_file_cache(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def time_lookups(lookup, keys):
+    timings = []
+    for subject, sample in keys:
+        start = time.perf_counter()
+        np.array(lookup(subject, sample))  # force the data to be read
+        timings.append(time.perf_counter() - start)
+    return np.array(timings)
+
+
+def report(label, timings):
+    print(f"{label:<22} {latency_row(timings, LATENCY_STATS + ('max',), digits=1, scale=1e6)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Template store vs .npy tree lookup latency")
+    parser.add_argument("--subjects", type=int, default=5000)
+    parser.add_argument("--samples", type=int, default=10)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--dtype", choices=["float64", "float32"], default="float64")
+    parser.add_argument("--workdir", default=".", help="where the temporary gallery is built")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    root = Path(tempfile.mkdtemp(prefix="benchmark_store_", dir=args.workdir))
+    try:
+        tree, store_path = root / "tree", root / "store"
+        start = time.perf_counter()
+        build_tree(tree, args.subjects, args.samples, args.dim, rng)
+        tree_build = time.perf_counter() - start
+        start = time.perf_counter()
+        TemplateStore.from_directory(tree, store_path, args.dtype)
+        pack = time.perf_counter() - start
+
+        rows = args.subjects * args.samples
+        print(f"Gallery: {rows} samples, dim {args.dim}, store dtype {args.dtype}")
+        print(f"Writing .npy tree: {tree_build:.2f}s, packing into store: {pack:.2f}s")
+
+        all_files = [p for folder in tree.iterdir() for p in folder.iterdir()]
+        tree_bytes = sum(p.stat().st_size for p in all_files)
+        store_bytes = sum(p.stat().st_size for p in store_path.iterdir())
+        print(f"On disk: tree {tree_bytes / 1e6:.1f} MB in {len(all_files)} files, "
+              f"store {store_bytes / 1e6:.1f} MB in 3 files")
+
+        keys = [(str(s), f"{s}d{d}") for s, d in
+                zip(rng.integers(args.subjects, size=args.lookups), rng.integers(args.samples, size=args.lookups))]
+
+        def tree_lookup(subject, sample):
+            return np.load(tree / subject / f"{sample}.npy")
+
+        # Cold: drop the file pages, then open (store) and look up
+        for p in all_files:
+            drop_file_cache(p)
+        tree_cold = time_lookups(tree_lookup, keys)
+        tree_warm = time_lookups(tree_lookup, keys)
+
+        drop_file_cache(store_path / SHARES_FILE)
+        drop_file_cache(store_path / INDEX_FILE)
+        start = time.perf_counter()
+        store = open_store(store_path)
+        store_open = time.perf_counter() - start
+        store_cold = time_lookups(store.get, keys)
+        store_warm = time_lookups(store.get, keys)
+
+        print(f"Store open (index of {rows} rows, cold): {store_open * 1e3:.1f} ms")
+        print(f"\n{'lookup latency':<22} {latency_header(LATENCY_STATS + ('max',), unit='us')}")
+        report("npy tree, cold", tree_cold)
+        report("store, cold", store_cold)
+        report("npy tree, warm", tree_warm)
+        report("store, warm", store_warm)
+        print(f"\nSpeed-up (mean): cold {tree_cold.mean() / store_cold.mean():.1f}x, "
+              f"warm {tree_warm.mean() / store_warm.mean():.1f}x")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
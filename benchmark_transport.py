@@ -0,0 +1,74 @@
+"""
+Receive throughput of the framed transport over loopback TCP.
+
+Compares transport.receive_large_data (recv_into a preallocated bytearray)
+with the helper the client and servers used before (4-byte length, chunks
+appended with data += chunk) for frame sizes between 1 and 50 MB.
+
+    python benchmark_transport.py --sizes 1 5 10 25 50 --repeat 3
+"""
+import argparse
+import socket
+import threading
+import time
+
+from transport import send_large_data, receive_large_data
+
+
+def legacy_send_large_data(sock, data_bytes):
+    size = len(data_bytes)
+    sock.sendall(size.to_bytes(4, 'big'))
+    sock.sendall(data_bytes)
+
+def legacy_receive_large_data(sock):
+    size = int.from_bytes(sock.recv(4), 'big')
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(min(131072, size - len(data)))
+        if not chunk:
+            raise ConnectionError("Closed prematurely")
+        data += chunk
+    return data
+
+
+def loopback_pair():
+    listener = socket.create_server(("127.0.0.1", 0))
+    sender = socket.create_connection(listener.getsockname())
+    receiver, _ = listener.accept()
+    listener.close()
+    return sender, receiver
+
+
+def measure(send, receive, payload, repeat):
+    sender, receiver = loopback_pair()
+    thread = threading.Thread(target=lambda: [send(sender, payload) for _ in range(repeat)])
+    timings = []
+    thread.start()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        data = receive(receiver)
+        timings.append(time.perf_counter() - start)
+        assert len(data) == len(payload)
+    thread.join()
+    sender.close()
+    receiver.close()
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Framed transport receive throughput")
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 5, 10, 25, 50],
+                        help="frame sizes in MB")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'size MB':>8} {'legacy MB/s':>12} {'framed MB/s':>12} {'speed-up':>9}")
+    for size_mb in args.sizes:
+        payload = bytes(int(size_mb * 1024 * 1024))
+        legacy = measure(legacy_send_large_data, legacy_receive_large_data, payload, args.repeat)
+        framed = measure(send_large_data, receive_large_data, payload, args.repeat)
+        print(f"{size_mb:>8g} {size_mb / legacy:>12.1f} {size_mb / framed:>12.1f} {legacy / framed:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Throughput of one matching server against its number of pre-forked workers
+(matching_server.py --workers), from 1 to every core.
+
+For every worker count a server is started on --database, then --clients
+per worker client processes keep verifying the probe for --duration seconds,
+each over its own persistent connection with a share encrypted up front.
+Clients are processes rather than threads so the load generator is not
+bound by the GIL. Every client registers before the clock starts: the
+workers do not share their deserialized contexts.
+
+Memory is the proportional set size (PSS) summed over the server's parent
+and workers, which counts the pages they share (the memory-mapped store, the
+templates encoded before the fork) once, next to the plain RSS sum, which
+counts them for every process.
+
+    python benchmark_workers.py --workers 1 2 4 8 --tenseal-threads 1
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+import numpy as np
+
+from benchmark_servers import wait_for_port
+from bench_utils import client_contexts, latency_header, latency_row
+from client import ServerSession, encrypt_share
+from secret_sharing import split_into_shares
+
+BENCHMARK_PORT = 55421
+
+
+def server_pids(pid):
+    """`pid` and its children (the pre-forked workers)."""
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [pid, *map(int, f.read().split())]
+
+
+def memory_kib(pids):
+    """(RSS, PSS) in KiB summed over `pids`."""
+    rss = pss = 0
+    for pid in pids:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                field, *value = line.split()
+                if field == "Rss:":
+                    rss += int(value[0])
+                elif field == "Pss:":
+                    pss += int(value[0])
+    return rss, pss
+
+
+def run_client(host, port, payload, barrier, duration, results):
+    biometric_id, ctx_bytes, share_bytes, context = payload
+    latencies = []
+    try:
+        session = ServerSession(host, port, ctx_bytes)
+        barrier.wait()
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            session.verify(biometric_id, share_bytes, context)
+            latencies.append(time.perf_counter() - start)
+        session.close()
+    except Exception as e:
+        print(f"client {os.getpid()} failed: {e!r}")
+    results.put(latencies)
+
+
+def run_level(args, payload, workers):
+    script = Path(__file__).with_name("matching_server.py")
+    command = [sys.executable, str(script), "--party", "0", "--port", str(args.port),
+               "--database", args.database, "--workers", str(workers)]
+    if args.tenseal_threads is not None:
+        command += ["--tenseal-threads", str(args.tenseal_threads)]
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    try:
+        wait_for_port(args.host, args.port)
+        clients = args.clients_per_worker * workers
+        mp = multiprocessing.get_context("fork")
+        barrier = mp.Barrier(clients)
+        results = mp.Queue()
+        processes = [
+            mp.Process(target=run_client, args=(args.host, args.port, payload, barrier, args.duration, results))
+            for _ in range(clients)
+        ]
+        for p in processes:
+            p.start()
+        latencies = [latency for _ in processes for latency in results.get()]
+        for p in processes:
+            p.join()
+        rss, pss = memory_kib(server_pids(server.pid))
+    finally:
+        server.send_signal(signal.SIGINT)
+        server.wait()
+    return clients, latencies, rss, pss
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Matching server throughput against pre-forked workers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=BENCHMARK_PORT)
+    parser.add_argument("--workers", type=int, nargs="+", default=list(range(1, os.cpu_count() + 1)))
+    parser.add_argument("--tenseal-threads", type=int, default=1,
+                        help="TenSEAL threads per worker (default 1: workers x threads = cores)")
+    parser.add_argument("--clients-per-worker", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load per worker count")
+    parser.add_argument("--database", default="server1_database")
+    parser.add_argument("--id", default="3567")
+    parser.add_argument("--probe", default="IrisFingerprintDatabases/FingerprintDatabase/3567/3567d11.npy")
+    args = parser.parse_args()
+
+    context, ctx_bytes, _ = client_contexts()
+    p1, _ = split_into_shares(np.load(args.probe))
+    payload = (args.id, ctx_bytes, encrypt_share(context, p1), context)
+
+    print(f"{os.cpu_count()} cores, {args.tenseal_threads} TenSEAL thread(s) per worker, "
+          f"{args.clients_per_worker} client(s) per worker, {args.duration:.0f}s per worker count")
+    print(f"{'workers':>7} {'clients':>7} {'requests':>9} {'req/s':>9} {'speedup':>8} "
+          f"{latency_header(('mean', 'p95'))} {'RSS MiB':>9} {'PSS MiB':>9}")
+    base = None
+    for workers in args.workers:
+        clients, lat, rss, pss = run_level(args, payload, workers)
+        if not len(lat):
+            print(f"{workers:>7} {clients:>7}: no request completed")
+            continue
+        throughput = len(lat) / args.duration
+        base = base or throughput
+        print(f"{workers:>7} {clients:>7} {len(lat):>9} {throughput:>9.2f} {throughput / base:>7.2f}x "
+              f"{latency_row(lat, ('mean', 'p95'))} {rss / 1024:>9.1f} {pss / 1024:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+CKKS context helpers shared by client.py and comparison_performance.py.
+
+The client keeps the private context (secret key, no Galois keys) and hands
+out public serializations of it:
+
+    servers      public key only - they only subtract
+    evaluation   public key, relin keys and Galois keys for exactly the
+                 power-of-two rotations CKKSVector.sum() uses for the
+                 template length
+
+TenSEAL can only generate Galois keys for every rotation and regenerates
+them whenever a private context is deserialized, so trimmed keys are created
+with SEAL's KeyGenerator and spliced into the public context protobuf
+(TenSEALContextProto.public_context.galois_keys, see tenseal/proto).
+
+Servers that work on raw SEAL ciphertexts (e.g. subtracting pre-encoded
+plaintexts) turn them back into CKKSVector bytes with ckks_vector_bytes().
+
+Everything that crosses the wire only needs TRANSPORT_DEPTH levels: the
+client (or the aggregator) squares the combined difference once (one
+multiplication and rescale) before summing. Ciphertexts are therefore
+created or mod-switched at that level, which drops the 40-bit primes they
+will never use:
+
+    fresh upload   3 primes, public-key encrypted        ~331 KB
+    compact        2 primes, secret-key encrypted with    ~115 KB
+                   the second polynomial stored as a seed
+    diff reply     2 primes                               ~235 KB
+
+Seeded serialization only exists for symmetric (secret-key) encryption, so
+servers, which only hold the public key, always send full ciphertexts.
+"""
+import os
+import struct
+import tempfile
+import tenseal as ts
+from tenseal import sealapi
+
+POLY_MODULUS_DEGREE = 8192
+COEFF_MOD_BIT_SIZES = [60, 40, 40, 60]
+GLOBAL_SCALE = 2**40
+# Multiplicative depth the receiver of a transported ciphertext still needs
+TRANSPORT_DEPTH = 1
+
+# sealapi can only save objects to a file path, use a RAM-backed directory when there is one
+SCRATCH_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+# Field numbers from tenseal/proto/tensealcontext.proto and tensors.proto
+_CONTEXT_PUBLIC_CONTEXT = 2
+_PUBLIC_GALOIS_KEYS = 5
+_VECTOR_SIZES = 1
+_VECTOR_CIPHERTEXTS = 2
+_VECTOR_SCALE = 3
+_VARINT, _FIXED64, _LENGTH_DELIMITED = 0, 1, 2
+
+
+def create_ckks_context(galois_keys=False):
+    """
+    Private CKKS context with relinearization keys. Galois keys for every
+    rotation are only generated on request (the old behaviour), use
+    public_context_bytes() to ship trimmed ones instead.
+    """
+    context = ts.context(
+        scheme=ts.SCHEME_TYPE.CKKS,
+        poly_modulus_degree=POLY_MODULUS_DEGREE,
+        coeff_mod_bit_sizes=COEFF_MOD_BIT_SIZES
+    )
+    context.global_scale = GLOBAL_SCALE
+    if galois_keys:
+        context.generate_galois_keys()
+    return context
+
+
+def sum_rotation_steps(vector_size):
+    """Rotations CKKSVector.sum() performs on a vector of `vector_size` slots."""
+    return [1 << i for i in range((vector_size - 1).bit_length())]
+
+
+def create_galois_keys(context, steps):
+    """Serialized (seed-compressed) Galois keys for the given rotation steps only."""
+    seal_context = context.seal_context().data
+    galois_elts = seal_context.key_context_data().galois_tool().get_elts_from_steps(steps)
+    keygen = sealapi.KeyGenerator(seal_context, context.secret_key().data)
+    return seal_serialize(keygen.create_galois_keys(galois_elts))
+
+
+def public_context_bytes(context, galois_steps=None, relin_keys=False):
+    """
+    Serializes `context` without its secret key. Galois keys are included for
+    `galois_steps` only (none if None), relinearization keys on request.
+    """
+    ctx_bytes = context.serialize(
+        save_public_key=True,
+        save_secret_key=False,
+        save_galois_keys=False,
+        save_relin_keys=relin_keys
+    )
+    if not galois_steps:
+        return ctx_bytes
+
+    galois_field = _encode_field(_PUBLIC_GALOIS_KEYS, _LENGTH_DELIMITED,
+                                 create_galois_keys(context, galois_steps))
+    fields = []
+    for number, wire_type, value in _decode_fields(ctx_bytes):
+        if number == _CONTEXT_PUBLIC_CONTEXT:
+            value = value + galois_field
+        fields.append((number, wire_type, value))
+    return b"".join(_encode_field(*field) for field in fields)
+
+
+def level_parms_id(seal_context, depth=TRANSPORT_DEPTH):
+    """parms_id of the level with `depth` rescales left (chain index `depth`)."""
+    context_data = seal_context.first_context_data()
+    while context_data.chain_index() > depth:
+        context_data = context_data.next_context_data()
+    return context_data.parms_id()
+
+
+def mod_switch_down(evaluator, ciphertext, seal_context, depth=TRANSPORT_DEPTH):
+    """Drops the primes of `ciphertext` beyond those needed for `depth` more rescales."""
+    if seal_context.get_context_data(ciphertext.parms_id()).chain_index() > depth:
+        evaluator.mod_switch_to_inplace(ciphertext, level_parms_id(seal_context, depth))
+
+
+def encrypt_vector_bytes(context, values, depth=TRANSPORT_DEPTH, symmetric=False):
+    """
+    CKKSVector bytes of `values` encrypted at the level with `depth` rescales
+    left. `symmetric` encrypts with the secret key and serializes the second
+    polynomial as its seed, halving the size again; otherwise the public key
+    is used (all that servers hold).
+    """
+    seal_context = context.seal_context().data
+    plain = sealapi.Plaintext()
+    sealapi.CKKSEncoder(seal_context).encode(list(values), level_parms_id(seal_context, depth),
+                                             context.global_scale, plain)
+    if symmetric:
+        serialized = seal_serialize(sealapi.Encryptor(seal_context, context.secret_key().data).encrypt_symmetric(plain))
+    else:
+        ciphertext = sealapi.Ciphertext()
+        sealapi.Encryptor(seal_context, context.public_key().data).encrypt(plain, ciphertext)
+        serialized = seal_serialize(ciphertext)
+    return _vector_bytes(serialized, len(values), context.global_scale)
+
+
+def seal_serialize(seal_object):
+    """Serialized bytes of a sealapi object (ciphertext, keys, ...)."""
+    fd, path = tempfile.mkstemp(dir=SCRATCH_DIR)
+    os.close(fd)
+    try:
+        seal_object.save(path)
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+
+def ckks_vector_bytes(ciphertext, size):
+    """
+    Serializes a sealapi ciphertext holding a `size`-slot vector exactly like
+    CKKSVector.serialize(), so ts.ckks_vector_from() can load it.
+    """
+    return _vector_bytes(seal_serialize(ciphertext), size, ciphertext.scale)
+
+
+def _vector_bytes(serialized_ciphertext, size, scale):
+    return (
+        _encode_field(_VECTOR_SIZES, _LENGTH_DELIMITED, _encode_varint(size))
+        + _encode_field(_VECTOR_CIPHERTEXTS, _LENGTH_DELIMITED, serialized_ciphertext)
+        + _encode_field(_VECTOR_SCALE, _FIXED64, struct.pack("<d", scale))
+    )
+
+
+def squared_norm(enc_vector, eval_context):
+    """
+    Encrypted sum of squares of `enc_vector`, computed with the relin and
+    Galois keys of `eval_context`. The result is linked back to the context
+    of `enc_vector` so it can be decrypted there.
+    """
+    own_context = enc_vector.context()
+    # Relink instead of copy(): copying a vector deep-copies its context and keys
+    enc_vector.link_context(eval_context)
+    try:
+        enc_sq_sum = (enc_vector * enc_vector).sum()
+    finally:
+        enc_vector.link_context(own_context)
+    enc_sq_sum.link_context(own_context)
+    return enc_sq_sum
+
+
+# Minimal protobuf wire format, enough for the TenSEAL context and vector messages
+
+def _decode_varint(buf, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return result, pos
+
+
+def _encode_varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _decode_fields(buf):
+    pos = 0
+    while pos < len(buf):
+        key, pos = _decode_varint(buf, pos)
+        number, wire_type = key >> 3, key & 0x7
+        if wire_type == _VARINT:
+            value, pos = _decode_varint(buf, pos)
+        elif wire_type == _FIXED64:
+            value, pos = buf[pos:pos + 8], pos + 8
+        elif wire_type == _LENGTH_DELIMITED:
+            length, pos = _decode_varint(buf, pos)
+            value, pos = buf[pos:pos + length], pos + length
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+        yield number, wire_type, value
+
+
+def _encode_field(number, wire_type, value):
+    key = _encode_varint(number << 3 | wire_type)
+    if wire_type == _VARINT:
+        return key + _encode_varint(value)
+    if wire_type == _LENGTH_DELIMITED:
+        return key + _encode_varint(len(value)) + value
+    return key + value
@@ -1,164 +1,817 @@
-import socket
+import argparse
+import os
 import time
 import threading
+from collections import deque
 import numpy as np
 import tenseal as ts
+from tenseal import sealapi
+
+from beaver import TripleAllocator, CLIENT_TRIPLES
+from ckks_utils import (
+    TRANSPORT_DEPTH, ckks_vector_bytes, create_ckks_context, create_galois_keys, encrypt_vector_bytes, level_parms_id,
+    public_context_bytes, squared_norm, sum_rotation_steps
+)
+from identification import GalleryScorer, packing_layout, replicate, top_k
+from protocol import (
+    OP_CODECS, OP_REGISTER, OP_VERIFY, OP_VERIFY_SEED, OP_VERIFY_BATCH, OP_VERIFY_FORWARD, OP_IDENTIFY, OP_MPC_OPEN,
+    OP_MPC_OPEN_SEED, OP_MPC_FINISH, OP_AGG_RESULT, STATUS_OK, STATUS_UNKNOWN_SESSION, BATCH_RESULT, BATCH_OK,
+    UnknownSessionError, context_digest
+)
+from secret_sharing import (
+    counter_nonce, decode_fixed, frac_bits_for, new_seed, seed_payload, split_into_ring_shares, split_into_shares,
+    split_with_seeds
+)
+from transport import (
+    CODECS, CODECS_BY_NAME, BandwidthCounter, connect, send_frames, send_large_data, receive_large_data, set_codec
+)
 
 PLAIN_MODULUS = 1032193
+BASE_PORT = 65431
+
+def server_addresses(parties, host="127.0.0.1", base_port=BASE_PORT):
+    """Addresses of the `parties` matching servers, party i listening on base_port + i."""
+    return [(host, base_port + party) for party in range(parties)]
+
+SERVERS = server_addresses(2)
+AGGREGATOR = ("127.0.0.1", 65430)
+
+# Bandwidth of all server connections
+BANDWIDTH = BandwidthCounter()
+
+def encrypt_share(context, values, full_size=False):
+    """
+    Serialized encrypted share: compact (transport level, secret-key encrypted
+    and seeded, see ckks_utils.py) unless `full_size` asks for the old fresh
+    public-key ciphertext at the top level.
+    """
+    if full_size:
+        return ts.ckks_vector(context, list(values)).serialize()
+    return encrypt_vector_bytes(context, values, symmetric=True)
+
+class EncryptionPool:
+    """
+    Offline/online split of the share encryption. A background thread keeps
+    up to `size` public-key encryptions of zero at the transport level ready;
+    encrypting a share online only encodes it and adds it to one of them
+    (add_plain), about half the time of a compact encryption. Every zero is
+    used once. The result is a full ciphertext (~235 KB): seed compression
+    only exists for fresh secret-key encryptions. With the pool empty (cold)
+    encrypt() falls back to encrypt_share().
+    """
+
+    def __init__(self, context, size, depth=TRANSPORT_DEPTH):
+        self.context = context
+        seal_context = context.seal_context().data
+        self.parms_id = level_parms_id(seal_context, depth)
+        self.encoder = sealapi.CKKSEncoder(seal_context)
+        self.encryptor = sealapi.Encryptor(seal_context, context.public_key().data)
+        self.evaluator = sealapi.Evaluator(seal_context)
+        self.size = size
+        self.zeros = deque()
+        self.hits = self.misses = 0
+        self.stopped = False
+        self.changed = threading.Condition()
+        self.thread = threading.Thread(target=self.fill, daemon=True)
+        self.thread.start()
+
+    def fill(self):
+        while True:
+            with self.changed:
+                self.changed.wait_for(lambda: self.stopped or len(self.zeros) < self.size)
+                if self.stopped:
+                    return
+            zero = sealapi.Ciphertext()
+            self.encryptor.encrypt_zero(self.parms_id, zero)
+            # add_plain needs matching scales, encrypt() would set it from the plaintext
+            zero.scale = self.context.global_scale
+            with self.changed:
+                self.zeros.append(zero)
+                self.changed.notify_all()
+
+    def wait_full(self, timeout=None):
+        """Blocks until the pool is full (or `timeout` seconds passed), e.g. before timing warm encryptions."""
+        with self.changed:
+            self.changed.wait_for(lambda: len(self.zeros) == self.size, timeout)
+
+    def encrypt(self, shares):
+        """
+        Serialized encrypted `shares` (those of one probe). The refill only
+        starts after the last one: SEAL holds the GIL, a zero encrypted in
+        between would stall the online step.
+        """
+        with self.changed:
+            zeros = [self.zeros.popleft() if self.zeros else None for _ in shares]
+        enc_shares = []
+        for values, ciphertext in zip(shares, zeros):
+            if ciphertext is None:
+                self.misses += 1
+                enc_shares.append(encrypt_share(self.context, values))
+                continue
+            self.hits += 1
+            plain = sealapi.Plaintext()
+            self.encoder.encode(list(values), self.parms_id, self.context.global_scale, plain)
+            self.evaluator.add_plain_inplace(ciphertext, plain)
+            enc_shares.append(ckks_vector_bytes(ciphertext, len(values)))
+        with self.changed:
+            self.changed.notify_all()
+        return enc_shares
+
+    def close(self):
+        """Stops refilling, the zeros left can still be used."""
+        with self.changed:
+            self.stopped = True
+            self.changed.notify_all()
+        self.thread.join()
+
+def receive_status(sock, counter=BANDWIDTH):
+    status = receive_large_data(sock, counter)
+    if status == STATUS_UNKNOWN_SESSION:
+        raise UnknownSessionError()
+    if status != STATUS_OK:
+        raise ConnectionError(f"Server error: {receive_large_data(sock, counter).decode()}")
+
+def negotiate_codec(sock, names, counter=BANDWIDTH):
+    """Offers the codecs `names` (preferred first), returns the one the server picked or None."""
+    send_large_data(sock, OP_CODECS, counter)
+    send_large_data(sock, ",".join(names).encode(), counter)
+    receive_status(sock, counter)
+    codec = CODECS_BY_NAME.get(receive_large_data(sock, counter).decode())
+    set_codec(sock, codec)
+    return codec
+
+def codec_names(choice):
+    """Codec names to offer for the --codec option."""
+    if choice == "none":
+        return []
+    return [codec.name for codec in CODECS] if choice == "auto" else [choice]
+
+def register_session(sock, ctx_bytes, counter=BANDWIDTH):
+    """Uploads the context once and returns the session ID the server keeps it under."""
+    send_large_data(sock, OP_REGISTER, counter)
+    send_large_data(sock, ctx_bytes, counter)
+    receive_status(sock, counter)
+    return receive_large_data(sock, counter).decode()
+
+def query_server(sock, session_id, biometric_id, enc_share_bytes, context, counter=BANDWIDTH, op=OP_VERIFY):
+    """
+    Runs one verification request over an open (possibly reused) connection.
+    With op=OP_VERIFY_SEED `enc_share_bytes` is a seed payload instead. A
+    PendingShare is waited for after the header frames went out.
+    """
+    send_large_data(sock, op, counter)
+    send_large_data(sock, session_id.encode(), counter)
+    send_large_data(sock, biometric_id.encode(), counter)
+    if isinstance(enc_share_bytes, PendingShare):
+        enc_share_bytes = enc_share_bytes.get()
+    send_large_data(sock, enc_share_bytes, counter)
+
+    receive_status(sock, counter)
+    partial_diff_bytes = receive_large_data(sock, counter)
+    return ts.ckks_vector_from(context, bytes(partial_diff_bytes))
+
+def query_forward(sock, session_id, biometric_id, enc_share_bytes, tag, counter=BANDWIDTH):
+    """Verification whose diff the server sends to the aggregator under `tag` instead of back here."""
+    send_large_data(sock, OP_VERIFY_FORWARD, counter)
+    send_large_data(sock, session_id.encode(), counter)
+    send_large_data(sock, biometric_id.encode(), counter)
+    send_large_data(sock, enc_share_bytes, counter)
+    send_large_data(sock, tag.encode(), counter)
+    receive_status(sock, counter)
+
+def request_aggregate(sock, session_id, tag, context, counter=BANDWIDTH):
+    """Encrypted squared distance the aggregator computed from the diffs forwarded under `tag`."""
+    send_large_data(sock, OP_AGG_RESULT, counter)
+    send_large_data(sock, session_id.encode(), counter)
+    send_large_data(sock, tag.encode(), counter)
+    receive_status(sock, counter)
+    return ts.ckks_vector_from(context, bytes(receive_large_data(sock, counter)))
+
+def query_batch(sock, session_id, pairs, context, counter=BANDWIDTH):
+    """
+    Runs one batch verification of (biometric id, enc share bytes) pairs and
+    yields (index, encrypted diff, error message) as the server streams the
+    results; diff is None for a pair the server could not verify. The shares
+    are uploaded from a second thread while the results come in.
+    """
+    send_large_data(sock, OP_VERIFY_BATCH, counter)
+    send_large_data(sock, session_id.encode(), counter)
+    send_large_data(sock, "\n".join(biometric_id for biometric_id, _ in pairs).encode(), counter)
+    sender = threading.Thread(target=send_frames, args=(sock, [share for _, share in pairs], counter))
+    sender.start()
+    try:
+        receive_status(sock, counter)
+        for _ in pairs:
+            index, outcome = BATCH_RESULT.unpack(receive_large_data(sock, counter))
+            payload = receive_large_data(sock, counter)
+            if outcome == BATCH_OK:
+                yield index, ts.ckks_vector_from(context, bytes(payload)), None
+            else:
+                yield index, None, payload.decode()
+    finally:
+        sender.join()
+
+def request_identification(sock, session_id, enc_share_bytes, counter=BANDWIDTH):
+    """Starts an identification request, returns the gallery ids; the blocks follow."""
+    send_large_data(sock, OP_IDENTIFY, counter)
+    send_large_data(sock, session_id.encode(), counter)
+    send_large_data(sock, enc_share_bytes, counter)
+
+    receive_status(sock, counter)
+    ids = receive_large_data(sock, counter).decode()
+    return ids.split("\n") if ids else []
+
+def mpc_open(sock, biometric_id, triple_id, p_share, counter=BANDWIDTH, dtype=None):
+    """
+    MPC round 1: the server's share of e = d - a for this triple. `p_share`
+    is the ring share of the probe or a seed payload to expand it from (then
+    `dtype` gives the ring).
+    """
+    seeded = isinstance(p_share, bytes)
+    send_large_data(sock, OP_MPC_OPEN_SEED if seeded else OP_MPC_OPEN, counter)
+    send_large_data(sock, biometric_id.encode(), counter)
+    send_large_data(sock, str(triple_id).encode(), counter)
+    send_large_data(sock, p_share if seeded else np.ascontiguousarray(p_share), counter)
+
+    receive_status(sock, counter)
+    return np.frombuffer(receive_large_data(sock, counter), dtype=dtype if seeded else p_share.dtype)
+
+def mpc_finish(sock, triple_id, e, counter=BANDWIDTH):
+    """MPC round 2: the server's share of the squared distance."""
+    send_large_data(sock, OP_MPC_FINISH, counter)
+    send_large_data(sock, str(triple_id).encode(), counter)
+    send_large_data(sock, e, counter)
+
+    receive_status(sock, counter)
+    return np.frombuffer(receive_large_data(sock, counter), dtype=e.dtype)
+
+class PendingShare:
+    """Encrypted share bytes handed from the encrypting thread to the one sending them."""
+
+    def __init__(self):
+        self.ready = threading.Event()
+        self.value = None
+        self.handed_over = None
+
+    def set(self, value):
+        self.value = value
+        self.handed_over = time.perf_counter()
+        self.ready.set()
+
+    def get(self):
+        self.ready.wait()
+        return self.value
+
+class ServerSession:
+    """
+    Persistent connection to one server with the client context registered
+    on it. `counter` only counts the codec negotiation and registration.
+    """
+
+    def __init__(self, host, port, ctx_bytes, register=True, codecs=(), counter=BANDWIDTH):
+        self.sock = connect((host, port))
+        self.ctx_bytes = ctx_bytes
+        self.codec = negotiate_codec(self.sock, codecs, counter) if codecs else None
+        if register:
+            self.session_id = register_session(self.sock, ctx_bytes, counter)
+        else:
+            # Session IDs are context hashes, so a session registered over an
+            # earlier connection can be reused without uploading the context
+            self.session_id = context_digest(ctx_bytes)
+
+    def verify(self, biometric_id, enc_share_bytes, context):
+        try:
+            return query_server(self.sock, self.session_id, biometric_id, enc_share_bytes, context)
+        except UnknownSessionError:
+            # The server evicted our context, upload it again and retry once
+            self.session_id = register_session(self.sock, self.ctx_bytes)
+            return query_server(self.sock, self.session_id, biometric_id, enc_share_bytes, context)
+
+    def verify_seed(self, biometric_id, payload, context):
+        """Verification with the probe share expanded by the server from a seed payload."""
+        try:
+            return query_server(self.sock, self.session_id, biometric_id, payload, context, op=OP_VERIFY_SEED)
+        except UnknownSessionError:
+            self.session_id = register_session(self.sock, self.ctx_bytes)
+            return query_server(self.sock, self.session_id, biometric_id, payload, context, op=OP_VERIFY_SEED)
+
+    def verify_forward(self, biometric_id, enc_share_bytes, tag):
+        try:
+            query_forward(self.sock, self.session_id, biometric_id, enc_share_bytes, tag)
+        except UnknownSessionError:
+            self.session_id = register_session(self.sock, self.ctx_bytes)
+            query_forward(self.sock, self.session_id, biometric_id, enc_share_bytes, tag)
+
+    def aggregate(self, tag, context):
+        """AGG_RESULT, on a session with the aggregator."""
+        try:
+            return request_aggregate(self.sock, self.session_id, tag, context)
+        except UnknownSessionError:
+            self.session_id = register_session(self.sock, self.ctx_bytes)
+            return request_aggregate(self.sock, self.session_id, tag, context)
+
+    def verify_batch(self, pairs, context):
+        try:
+            yield from query_batch(self.sock, self.session_id, pairs, context)
+        except UnknownSessionError:
+            # Raised before the first result, so nothing was yielded yet
+            self.session_id = register_session(self.sock, self.ctx_bytes)
+            yield from query_batch(self.sock, self.session_id, pairs, context)
+
+    def identify(self, enc_share_bytes):
+        try:
+            return request_identification(self.sock, self.session_id, enc_share_bytes)
+        except UnknownSessionError:
+            self.session_id = register_session(self.sock, self.ctx_bytes)
+            return request_identification(self.sock, self.session_id, enc_share_bytes)
+
+    def receive_block(self, context):
+        return ts.ckks_vector_from(context, bytes(receive_large_data(self.sock, BANDWIDTH)))
 
-# Global counters for bandwidth
-TOTAL_BYTES_SENT = 0
-TOTAL_BYTES_RECEIVED = 0
-BW_LOCK = threading.Lock()  # lock to protect counters
-
-def create_ckks_context():
-    context = ts.context(
-        scheme=ts.SCHEME_TYPE.CKKS,
-        poly_modulus_degree=8192,
-        coeff_mod_bit_sizes=[60, 40, 40, 60]
-    )
-    context.global_scale = 2**40
-    context.generate_galois_keys()
-    return context
-
-def split_into_shares(secret_vector):
-    s2 = np.random.rand(*secret_vector.shape)
-    s1 = secret_vector - s2
-    return s1, s2
-
-def send_large_data(sock, data_bytes):
-    """Send data with size prefix, track total bytes sent."""
-    global TOTAL_BYTES_SENT
-    size = len(data_bytes)
-    size_prefix = size.to_bytes(4, 'big')
-    # increment counters
-    with BW_LOCK:
-        TOTAL_BYTES_SENT += len(size_prefix) + size
-    # send
-    sock.sendall(size_prefix)
-    sock.sendall(data_bytes)
-
-def receive_large_data(sock):
-    """Receive data with size prefix, track total bytes read."""
-    global TOTAL_BYTES_RECEIVED
-    size_prefix = sock.recv(4)
-    if len(size_prefix) < 4:
-        raise ConnectionError("Connection closed prematurely")
-    size = int.from_bytes(size_prefix, 'big')
-    with BW_LOCK:
-        TOTAL_BYTES_RECEIVED += 4 + size
-
-    data = b""
-    while len(data) < size:
-        chunk = sock.recv(min(131072, size - len(data)))
-        if not chunk:
-            raise ConnectionError("Connection closed prematurely")
-        data += chunk
-    return data
+    def close(self):
+        self.sock.close()
+
+def open_session(host, port, ctx_bytes, sessions, key, codecs=()):
+    sessions[key] = ServerSession(host, port, ctx_bytes, codecs=codecs)
 
 def send_and_receive_server(
-    host, port,
+    session,
     biometric_id,
-    ctx_bytes,
     enc_share_bytes,
     context,
     result_dict,
     result_key
 ):
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.connect((host, port))
+    result_dict[result_key] = session.verify(biometric_id, enc_share_bytes, context)
 
-    send_large_data(sock, biometric_id.encode())
-    send_large_data(sock, ctx_bytes)
-    send_large_data(sock, enc_share_bytes)
+def send_seed_to_server(session, biometric_id, payload, context, result_dict, result_key):
+    result_dict[result_key] = session.verify_seed(biometric_id, payload, context)
 
-    partial_diff_bytes = receive_large_data(sock)
-    sock.close()
+def verify_parties(sessions, biometric_id, shares, context, seeded=False):
+    """
+    Encrypted total difference of the probe to `biometric_id`: the sum of
+    the diffs all servers return for their share, queried in parallel. With
+    `seeded` every share but the first is a seed payload.
+    """
+    results = {}
+    run_parallel([
+        (send_seed_to_server if seeded and party else send_and_receive_server,
+         (session, biometric_id, share, context, results, party))
+        for party, (session, share) in enumerate(zip(sessions, shares))
+    ])
+    enc_total_diff = results[0]
+    for party in range(1, len(sessions)):
+        enc_total_diff += results[party]
+    return enc_total_diff
 
-    result_dict[result_key] = ts.ckks_vector_from(context, partial_diff_bytes)
+def pipeline_party(address, ctx_bytes, codecs, registration, biometric_id, pending, context, seed, results, party):
+    start = time.perf_counter()
+    session = ServerSession(*address, ctx_bytes, codecs=codecs, counter=registration)
+    registered = time.perf_counter()
+    verify = session.verify_seed if seed else session.verify
+    diff = verify(biometric_id, pending, context)
+    results[party] = (session, diff, registered - start, time.perf_counter() - pending.handed_over)
 
-# Main Client Code
-overall_start = time.perf_counter()
+def verify_pipelined(addresses, ctx_bytes, biometric_id, encrypt_jobs, context, seeded=False, codecs=()):
+    """
+    First verification as a pipeline instead of register, encrypt, query in
+    turn: one thread per server connects, registers the context and sends the
+    request header while this thread runs `encrypt_jobs` (one callable per
+    party returning its share bytes), each share streamed to its server as
+    soon as it is ready. Share i + 1 is encrypted while share i is on the wire
+    and being processed. With `seeded` every job but the first returns a seed
+    payload.
 
-context_creation_start = time.perf_counter()
-context = create_ckks_context()
-context_creation_end = time.perf_counter()
+    Returns the sessions, the encrypted total difference, the share bytes,
+    the registration traffic (a BandwidthCounter) and the stage times:
+    slowest registration, encryption, and slowest round trip from a share's
+    hand-over to its diff.
+    """
+    registration = BandwidthCounter()
+    pending = [PendingShare() for _ in addresses]
+    results = {}
+    threads, errors = start_parallel([
+        (pipeline_party, (address, ctx_bytes, codecs, registration, biometric_id, pending[party], context,
+                          seeded and party > 0, results, party))
+        for party, address in enumerate(addresses)
+    ])
+    encrypt_time = 0.0
+    for job, share in zip(encrypt_jobs, pending):
+        start = time.perf_counter()
+        value = job()
+        encrypt_time += time.perf_counter() - start
+        share.set(value)
+    join_parallel(threads, errors)
 
-ctx_bytes = context.serialize()
+    sessions = [results[party][0] for party in range(len(addresses))]
+    enc_total_diff = results[0][1]
+    for party in range(1, len(addresses)):
+        enc_total_diff += results[party][1]
+    stages = (max(r[2] for r in results.values()), encrypt_time, max(r[3] for r in results.values()))
+    return sessions, enc_total_diff, [share.value for share in pending], registration, stages
 
-probe = np.load("IrisFingerprintDatabases/FingerprintDatabase/3567/3567d11.npy")
-p1, p2 = split_into_shares(probe)
+def verify_aggregated(sessions, aggregator, biometric_id, enc_shares, context):
+    """
+    Encrypted squared distance of the probe to `biometric_id`: every server
+    forwards its diff to the aggregator, which returns the square & sum.
+    """
+    tag = os.urandom(16).hex()
+    run_parallel([
+        (session.verify_forward, (biometric_id, enc_share_bytes, tag))
+        for session, enc_share_bytes in zip(sessions, enc_shares)
+    ])
+    return aggregator.aggregate(tag, context)
 
-encrypt_start = time.perf_counter()
-Enc_p1 = ts.ckks_vector(context, p1.tolist())
-Enc_p2 = ts.ckks_vector(context, p2.tolist())
-encrypt_end = time.perf_counter()
-encrypt_time = encrypt_end - encrypt_start
+def start_identification(session, enc_share_bytes, result_dict, result_key):
+    result_dict[result_key] = session.identify(enc_share_bytes)
 
-biometric_id = "3567"
-ctx_size = len(ctx_bytes)
-enc_p1_bytes = Enc_p1.serialize()
-enc_p2_bytes = Enc_p2.serialize()
-enc_p1_size = len(enc_p1_bytes)
-enc_p2_size = len(enc_p2_bytes)
+def identify(sessions, enc_shares, context, scorer, per_block):
+    """
+    Gallery ids and distances to the probe (one encrypted replicated share
+    per server), scored block by block as they arrive.
+    """
+    gallery = {}
+    run_parallel([
+        (start_identification, (session, enc_share_bytes, gallery, party))
+        for party, (session, enc_share_bytes) in enumerate(zip(sessions, enc_shares))
+    ])
+    if any(gallery[party] != gallery[0] for party in gallery):
+        raise ValueError("The servers hold different galleries")
+    ids = gallery[0]
 
-results = {}
+    sq_distances = []
+    for start in range(0, len(ids), per_block):
+        enc_diff1 = sessions[0].receive_block(context)
+        enc_diff2 = sessions[1].receive_block(context)
+        for session in sessions[2:]:
+            enc_diff2 += session.receive_block(context)
+        sq_distances.append(scorer.squared_distances(enc_diff1, enc_diff2, min(per_block, len(ids) - start)))
+    # CKKS noise can push a zero distance slightly below 0
+    return ids, np.sqrt(np.maximum(np.concatenate(sq_distances or [[]]), 0))
 
-parallel_start = time.perf_counter()
+def collect_batch(session, pairs, context, result_dict, result_key):
+    result_dict[result_key] = {index: (diff, error) for index, diff, error in session.verify_batch(pairs, context)}
 
-t1 = threading.Thread(
-    target=send_and_receive_server,
-    args=(
-        "127.0.0.1", 65431,
-        biometric_id, ctx_bytes, enc_p1_bytes,
-        context, results, "res1"
-    )
-)
-t2 = threading.Thread(
-    target=send_and_receive_server,
-    args=(
-        "127.0.0.1", 65432,
-        biometric_id, ctx_bytes, enc_p2_bytes,
-        context, results, "res2"
-    )
-)
+def verify_batch(sessions, biometric_ids, enc_shares, context):
+    """
+    Encrypted total difference for every id of a batch sent to all servers
+    at once (enc_shares[party][i] is that server's share for id i), None
+    where a server failed the pair.
+    """
+    results = {}
+    run_parallel([
+        (collect_batch, (session, list(zip(biometric_ids, party_shares)), context, results, party))
+        for party, (session, party_shares) in enumerate(zip(sessions, enc_shares))
+    ])
+    diffs = []
+    for index in range(len(biometric_ids)):
+        replies = [results[party][index] for party in range(len(sessions))]
+        errors = [error for _, error in replies if error]
+        if errors:
+            print(f"⚠️ WARNING: pair {index} (ID={biometric_ids[index]}) failed: {errors[0]}")
+            diffs.append(None)
+            continue
+        enc_total_diff = replies[0][0]
+        for diff, _ in replies[1:]:
+            enc_total_diff += diff
+        diffs.append(enc_total_diff)
+    return diffs
+
+def mpc_open_server(sock, biometric_id, triple_id, p_share, dtype, result_dict, result_key):
+    result_dict[result_key] = mpc_open(sock, biometric_id, triple_id, p_share, dtype=dtype)
+
+def mpc_finish_server(sock, triple_id, e, result_dict, result_key):
+    result_dict[result_key] = mpc_finish(sock, triple_id, e)
+
+def start_parallel(targets):
+    """Starts one thread per (target, args), returns what join_parallel() needs."""
+    errors = []
+
+    def run(target, args):
+        try:
+            target(*args)
+        except Exception as err:
+            errors.append(err)
+
+    threads = [threading.Thread(target=run, args=(target, args)) for target, args in targets]
+    for t in threads:
+        t.start()
+    return threads, errors
+
+def join_parallel(threads, errors):
+    """Waits for the threads of start_parallel() and raises the first exception one of them failed with."""
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+
+def run_parallel(targets):
+    join_parallel(*start_parallel(targets))
+
+def report_context_variants(vector_size):
+    """Keygen time and serialized size of every context variant the client could ship."""
+    print("\n-- Context variants --")
+    start = time.perf_counter()
+    full = create_ckks_context(galois_keys=True)
+    full_keygen = time.perf_counter() - start
+    start = time.perf_counter()
+    base = create_ckks_context()
+    base_keygen = time.perf_counter() - start
+    steps = sum_rotation_steps(vector_size)
+    start = time.perf_counter()
+    create_galois_keys(base, steps)
+    trimmed_keygen = base_keygen + time.perf_counter() - start
+
+    variants = [
+        ("all Galois keys (old)", full_keygen, len(full.serialize())),
+        (f"{len(steps)} Galois keys for sum() + relin", trimmed_keygen,
+         len(public_context_bytes(base, steps, relin_keys=True))),
+        ("public key only (servers)", base_keygen, len(public_context_bytes(base))),
+    ]
+    for name, keygen, size in variants:
+        print(f"{name:<36} keygen {keygen:.6f} s  size {size}")
+
+def open_ring_shares(results, parties):
+    """Sum of the ring shares of every party in `results` (wrapping around in the ring)."""
+    total = results[0]
+    for party in range(1, parties):
+        total = total + results[party]
+    return total
+
+def mpc_squared_distance(socks, biometric_id, triple_id, shares, dtype):
+    """
+    Squared distance computed by the servers on the ring shares of the probe
+    (one per server, in the ring of `dtype`), plus the time of each round. A
+    share can also be the seed payload its server expands the share from.
+    """
+    results = {}
+    round1_start = time.perf_counter()
+    run_parallel([
+        (mpc_open_server, (sock, biometric_id, triple_id, share, dtype, results, party))
+        for party, (sock, share) in enumerate(zip(socks, shares))
+    ])
+    e = open_ring_shares(results, len(socks))
+    round2_start = time.perf_counter()
+    run_parallel([
+        (mpc_finish_server, (sock, triple_id, e, results, party)) for party, sock in enumerate(socks)
+    ])
+    round2_end = time.perf_counter()
+    sq_dist = decode_fixed(open_ring_shares(results, len(socks)), 2 * frac_bits_for(dtype))[0]
+    return sq_dist, round2_start - round1_start, round2_end - round2_start
+
+def run_mpc(args, probe):
+    """Verification in the Beaver-triple MPC mode, no CKKS involved."""
+    allocator = TripleAllocator(args.triples)
+    triple_ids = allocator.take(args.repeat)
+    if args.seeded:
+        # Every server but the first expands its share from a seed, only the first share travels in full
+        seeds = [new_seed() for _ in range(args.parties - 1)]
+        shares = [split_with_seeds(probe, seeds, counter_nonce(0), allocator.dtype)]
+        shares += [seed_payload(seed, 0) for seed in seeds]
+    else:
+        shares = split_into_ring_shares(probe, allocator.dtype, parties=args.parties)
+    socks = [connect(server) for server in server_addresses(args.parties)]
+
+    round1_time = 0
+    round2_time = 0
+    for triple_id in triple_ids:
+        sq_dist, round1, round2 = mpc_squared_distance(socks, args.id, triple_id, shares, allocator.dtype)
+        round1_time += round1
+        round2_time += round2
+    for sock in socks:
+        sock.close()
+
+    print(f"Euclidean Distance: {np.sqrt(max(sq_dist, 0))}")
+
+    print("\n==== MPC BENCHMARK RESULTS ====")
+    print(f"Round 1 (open e):         {round1_time / args.repeat:.6f} s (mean of {args.repeat})")
+    print(f"Round 2 (finish):         {round2_time / args.repeat:.6f} s")
+    print(f"Online time:              {(round1_time + round2_time) / args.repeat:.6f} s")
+    print(f"Per verification:         {BANDWIDTH.total // args.repeat} bytes")
+    print(f"Triples used:             {triple_ids[0]}..{triple_ids[-1]}")
+
+def run_identification(args, probe, shares, context, eval_context, sessions, register_bytes):
+    block_dim, per_block = packing_layout(len(probe))
+    encrypt_start = time.perf_counter()
+    enc_shares = [encrypt_share(context, replicate(share, block_dim, per_block), args.full_size) for share in shares]
+    encrypt_end = time.perf_counter()
+    scorer = GalleryScorer(context, eval_context, block_dim)
+
+    identify_start = time.perf_counter()
+    for _ in range(args.repeat):
+        ids, distances = identify(sessions, enc_shares, context, scorer, per_block)
+    identify_time = (time.perf_counter() - identify_start) / args.repeat
+
+    print(f"Top {args.top_k} of {len(ids)} gallery templates:")
+    for rank, (id, dist) in enumerate(top_k(ids, distances, args.top_k) if ids else [], 1):
+        print(f"  {rank}. ID={id}  Euclidean Distance: {dist}")
+
+    print("\n==== IDENTIFICATION BENCHMARK ====")
+    print(f"Gallery size:             {len(ids)} templates in {-(-len(ids) // per_block)} blocks "
+          f"of {per_block} x {block_dim} slots")
+    print(f"Encryption time (shares): {encrypt_end - encrypt_start:.6f} s")
+    print(f"Identification time:      {identify_time:.6f} s (mean of {args.repeat})")
+    print(f"Throughput:               {len(ids) / identify_time:.0f} templates/s")
+    print(f"Encrypted share size:     {len(enc_shares[0])}")
+    print(f"Per identification:       {(BANDWIDTH.total - register_bytes) // args.repeat} bytes")
+
+def main():
+    parser = argparse.ArgumentParser(description="Biometric verification client")
+    parser.add_argument("--probe", default="IrisFingerprintDatabases/FingerprintDatabase/3567/3567d11.npy")
+    parser.add_argument("--id", default="3567")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="verify the probe this many times over the same sessions")
+    parser.add_argument("--mpc", action="store_true",
+                        help="compute the distance on secret shares with Beaver triples instead of CKKS")
+    parser.add_argument("--triples", default=CLIENT_TRIPLES,
+                        help="the client's triple counter written by beaver.py")
+    parser.add_argument("--identify", action="store_true",
+                        help="1:N identification against every enrolled template instead of verifying --id")
+    parser.add_argument("--top-k", type=int, default=5,
+                        help="number of closest gallery templates to print with --identify")
+    parser.add_argument("--full-context", action="store_true",
+                        help="ship the context with all Galois keys to the servers (old behaviour)")
+    parser.add_argument("--context-report", action="store_true",
+                        help="print keygen time and size of every context variant")
+    parser.add_argument("--full-size", action="store_true",
+                        help="upload fresh top-level public-key ciphertexts instead of compact ones")
+    parser.add_argument("--codec", choices=["none", "auto", *CODECS_BY_NAME], default="none",
+                        help="negotiate compression of the frames with the servers (auto: fastest installed)")
+    parser.add_argument("--seeded", action="store_true",
+                        help="send every server but the first a 40-byte PRG seed instead of its probe share "
+                             "(also with --mpc)")
+    parser.add_argument("--aggregator", action="store_true",
+                        help="have the servers forward their diffs to the aggregator (aggregator.py), "
+                             "which returns the squared distance")
+    parser.add_argument("--parties", type=int, default=2,
+                        help="number of servers to share the probe among, server i on port "
+                             f"{BASE_PORT} + i (see matching_server.py)")
+    parser.add_argument("--no-pipeline", action="store_true",
+                        help="register, encrypt and query in turn instead of streaming every share to its "
+                             "server as soon as it is encrypted")
+    parser.add_argument("--encryption-pool", type=int, default=0, metavar="SIZE",
+                        help="precompute up to SIZE encryptions of zero in the background while the sessions "
+                             "are registered, the shares are then added to them (larger uploads, see EncryptionPool)")
+    args = parser.parse_args()
+    if args.parties < 2:
+        parser.error("--parties must be at least 2")
+    if args.seeded and args.identify:
+        parser.error("--seeded only applies to verification")
+    if args.aggregator and (args.seeded or args.identify):
+        parser.error("--aggregator only applies to verification without --seeded")
+    if args.encryption_pool and (args.full_size or args.mpc):
+        parser.error("--encryption-pool makes transport-level CKKS ciphertexts, it excludes --full-size and --mpc")
+
+    overall_start = time.perf_counter()
+
+    probe = np.load(args.probe)
+
+    if args.mpc:
+        run_mpc(args, probe)
+        return
+
+    if args.seeded:
+        # Only the first share is materialized here, every other server expands its own from a seed
+        seeds = [new_seed() for _ in range(args.parties - 1)]
+        shares = [split_with_seeds(probe, seeds, counter_nonce(0))]
+    else:
+        shares = split_into_shares(probe, parties=args.parties)
+
+    context_creation_start = time.perf_counter()
+    if args.full_context:
+        context = create_ckks_context(galois_keys=True)
+        ctx_bytes = context.serialize()
+        eval_context = context
+    else:
+        # Servers only subtract, so they get the public key and nothing else.
+        # The square & sum below runs on a public context holding just the
+        # Galois keys .sum() needs for this template length.
+        context = create_ckks_context()
+        ctx_bytes = public_context_bytes(context)
+        eval_ctx_bytes = public_context_bytes(context, sum_rotation_steps(len(probe)), relin_keys=True)
+        eval_context = ts.context_from(eval_ctx_bytes)
+    if args.aggregator and args.full_context:
+        # The aggregator gets the evaluation keys, never the secret key
+        eval_ctx_bytes = public_context_bytes(context, sum_rotation_steps(len(probe)), relin_keys=True)
+    context_creation_end = time.perf_counter()
+
+    # Fills while the sessions are registered below
+    pool = EncryptionPool(context, args.encryption_pool) if args.encryption_pool else None
+    # A pool is filled during the registration, the pipeline overlaps the two
+    pipelined = not (args.no_pipeline or args.identify or args.aggregator or pool)
+
+    biometric_id = args.id
+    ctx_size = len(ctx_bytes)
+    addresses = server_addresses(args.parties)
+    round_trips = []
+
+    if pipelined:
+        encrypt_jobs = [lambda share=share: encrypt_share(context, share, args.full_size) for share in shares]
+        if args.seeded:
+            encrypt_jobs += [lambda seed=seed: seed_payload(seed, 0) for seed in seeds]
+        critical_start = time.perf_counter()
+        sessions, enc_total_diff, enc_shares, registration, stages = verify_pipelined(
+            addresses, ctx_bytes, biometric_id, encrypt_jobs, context, args.seeded, codec_names(args.codec)
+        )
+        critical_path = time.perf_counter() - critical_start
+        register_time, encrypt_time, round_trip = stages
+        round_trips.append(round_trip)
+        BANDWIDTH.add_sent(registration.sent, registration.logical_sent)
+        BANDWIDTH.add_received(registration.received, registration.logical_received)
+        register_bytes = registration.total
+    else:
+        # Register the context once per server, every query after that only refers to it
+        sessions = {}
+        register_start = time.perf_counter()
+        run_parallel([
+            (open_session, (host, port, ctx_bytes, sessions, i, codec_names(args.codec)))
+            for i, (host, port) in enumerate(addresses)
+        ])
+        sessions = [sessions[i] for i in range(args.parties)]
+        if args.aggregator:
+            aggregator = ServerSession(*AGGREGATOR, eval_ctx_bytes, codecs=codec_names(args.codec))
+        register_time = time.perf_counter() - register_start
+        register_bytes = BANDWIDTH.total
+
+        if pool:
+            # This run needs no more zeros, stop refilling before the online step
+            pool.close()
+        encrypt_start = time.perf_counter()
+        if pool:
+            enc_shares = pool.encrypt(shares)
+        else:
+            enc_shares = [encrypt_share(context, share, args.full_size) for share in shares]
+        if args.seeded:
+            enc_shares += [seed_payload(seed, 0) for seed in seeds]
+        encrypt_time = time.perf_counter() - encrypt_start
+
+    if args.identify:
+        run_identification(args, probe, shares, context, eval_context, sessions, register_bytes)
+        for session in sessions:
+            session.close()
+        return
+
+    for _ in range(args.repeat - len(round_trips)):
+        start = time.perf_counter()
+        if args.aggregator:
+            enc_sq_dist = verify_aggregated(sessions, aggregator, biometric_id, enc_shares, context)
+        else:
+            enc_total_diff = verify_parties(sessions, biometric_id, enc_shares, context, args.seeded)
+        round_trips.append(time.perf_counter() - start)
+    if not pipelined:
+        critical_path = register_time + encrypt_time + round_trips[0]
+
+    for session in sessions:
+        session.close()
+
+    combine_start = time.perf_counter()
+    if args.aggregator:
+        aggregator.close()
+    else:
+        enc_sq_dist = squared_norm(enc_total_diff, eval_context)
+    dec_sq_dist = enc_sq_dist.decrypt()[0] % PLAIN_MODULUS
+    dist = np.sqrt(dec_sq_dist)
+    combine_end = time.perf_counter()
+    overall_end = time.perf_counter()
+
+    print(f"Euclidean Distance: {dist}")
+
+    print("\n==== BENCHMARK RESULTS ====")
+
+    print("\n-- Times --")
+    print(f"Context creation time:    {context_creation_end - context_creation_start:.6f} s")
+    print(f"Encryption time (shares): {encrypt_time:.6f} s"
+          f"{f' (pool: {pool.hits} precomputed, {pool.misses} cold)' if pool else ''}")
+    print(f"Session registration:     {register_time:.6f} s")
+    print(f"Server round-trip time:   {np.mean(round_trips):.6f} s (mean of {args.repeat})"
+          f"{' (via the aggregator)' if args.aggregator else ''}")
+    # Pipelined, the stages above overlap, so their sum says nothing about the staged flow
+    # (see benchmark_pipeline.py, which runs both)
+    print(f"Critical path:            {critical_path:.6f} s "
+          f"({'pipelined' if pipelined else 'registration, encryption, round trip in turn'})")
+    combine_label = "Final decrypt:" if args.aggregator else "Final combine & decrypt:"
+    print(f"{combine_label:<26}{(combine_end - combine_start):.6f} s")
+    print(f"Total client time:        {(overall_end - overall_start):.6f} s")
+
+    print("\n-- Data Sizes (bytes) --")
+    print(f"Context size:             {ctx_size}")
+    for party, share in enumerate(enc_shares):
+        label = f"Share {party + 1} seed size:" if args.seeded and party else f"Encrypted share {party + 1} size:"
+        print(f"{label:<26}{len(share)}")
+    if args.aggregator:
+        print(f"Aggregator context size:  {len(eval_ctx_bytes)}")
+        print(f"Encrypted result size:    {len(enc_sq_dist.serialize())}")
+
+    print("\n-- Bandwidth (Bytes) --")
+    print(f"Codec:                    {sessions[0].codec.name if sessions[0].codec else 'none'}")
+    print(f"Total bytes sent:         {BANDWIDTH.sent} (logical {BANDWIDTH.logical_sent})")
+    print(f"Total bytes received:     {BANDWIDTH.received} (logical {BANDWIDTH.logical_received})")
+    print(f"Sum (sent+received):      {BANDWIDTH.total} (logical {BANDWIDTH.logical_total})")
+    print(f"Session registration:     {register_bytes}")
+    print(f"Per verification:         {(BANDWIDTH.total - register_bytes) // args.repeat}")
+
+    if args.context_report:
+        report_context_variants(len(probe))
 
-t1.start()
-t2.start()
-t1.join()
-t2.join()
-
-parallel_end = time.perf_counter()
-
-enc_res1 = results["res1"]
-enc_res2 = results["res2"]
-
-combine_start = time.perf_counter()
-enc_total_diff = enc_res1 + enc_res2
-enc_sq_diff = enc_total_diff * enc_total_diff
-enc_sq_dist = enc_sq_diff.sum()
-dec_sq_dist = enc_sq_dist.decrypt()[0] % PLAIN_MODULUS
-dist = np.sqrt(dec_sq_dist)
-combine_end = time.perf_counter()
-overall_end = time.perf_counter()
-
-print(f"Euclidean Distance: {dist}")
-
-print("\n==== BENCHMARK RESULTS ====")
-
-print("\n-- Times --")
-print(f"Context creation time:    {context_creation_end - context_creation_start:.6f} s")
-print(f"Encryption time (p1,p2):  {encrypt_time:.6f} s")
-print(f"Server round-trip time:   {(parallel_end - parallel_start):.6f} s")
-print(f"Final combine & decrypt:  {(combine_end - combine_start):.6f} s")
-print(f"Total client time:        {(overall_end - overall_start):.6f} s")
-
-print("\n-- Data Sizes (bytes) --")
-print(f"Context size:             {ctx_size}")
-print(f"Encrypted share 1 size:   {enc_p1_size}")
-print(f"Encrypted share 2 size:   {enc_p2_size}")
-
-print("\n-- Bandwidth (Bytes) --")
-print(f"Total bytes sent:         {TOTAL_BYTES_SENT}")
-print(f"Total bytes received:     {TOTAL_BYTES_RECEIVED}")
-print(f"Sum (sent+received):      {TOTAL_BYTES_SENT + TOTAL_BYTES_RECEIVED}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,144 +1,378 @@
-import os
+"""
+Mated and non-mated comparison scores of the secret-shared iris database,
+for DET curves (see DET.py and Biometric_Performance_Tutorial.ipynb).
+
+For every subject with at least SAMPLES_PER_SUBJECT samples the first of
+them are compared pairwise (mated, template i against probe j > i), and the
+first sample as template against as many probes of other subjects
+(non-mated). Every comparison splits the probe into fresh shares, subtracts
+them from the servers' template shares and takes the Euclidean norm of the
+total difference, on plain vectors or, with --encrypted, under CKKS.
+
+The evaluation engine loads every probe and both template shares once into
+an EvaluationCache, samples impostors by index arithmetic over the database
+order and spreads the subjects over a process pool. Every subject draws its
+shares and impostors from its own child of one SeedSequence, so the scores
+do not depend on the number of workers.
+
+Scores are streamed subject by subject to binary score files (float32
+.npy with JSON metadata and the sample rows of every comparison, see
+score_io.py; --text exports gzip text files as well), and a checkpoint
+(<system>_checkpoint.tsv) records every finished subject: an interrupted
+run continues with --resume, with the same scores as an uninterrupted one.
+Encrypted runs encrypt every template once for all its comparisons.
+
+--all-pairs is the plaintext baseline over the whole database instead:
+the distance of every pair of samples (mated when both belong to the same
+subject), computed tile by tile with matrix products (all_pairs_scores)
+and streamed to the score files (without pairs: that is every i < j).
+
+    python comparison_performance.py --workers 8
+    python comparison_performance.py --encrypted --seed 1
+    python comparison_performance.py --all-pairs --text
+"""
+import argparse
 import glob
-import random
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 import numpy as np
 import tenseal as ts
 
-# --- CKKS context and helper function ---
-def create_ckks_context():
-    context = ts.context(
-        scheme=ts.SCHEME_TYPE.CKKS,
-        poly_modulus_degree=8192,
-        coeff_mod_bit_sizes=[60, 40, 40, 60]  # CKKS modulus sizes
-    )
-    context.global_scale = 2**40  # Large scaling factor for precision
-    context.generate_galois_keys()
-    return context
-
-context = create_ckks_context()
-
-def split_into_shares(secret_vector):
-    """Splits a fingerprint template into two secret shares."""
-    s2 = np.random.rand(*secret_vector.shape)
-    s1 = secret_vector - s2
-    return s1, s2
-
-def compare_samples(probe, subject_id, template_filename):
-    """Compares a probe against a template using CKKS encryption."""
-
-    # 1) Split & scale the probe
-    p1, p2 = split_into_shares(probe)
-
-    # Encrypt the shares using CKKS
-    #Enc_p1 = ts.ckks_vector(context, p1.tolist())
-    #Enc_p2 = ts.ckks_vector(context, p2.tolist())
-    Enc_p1 = p1
-    Enc_p2 = p2
-
-    # 2) Load & encrypt template shares
-    s1_path = f"server1_iris_database/{subject_id}/{template_filename}"
-    s2_path = f"server2_iris_database/{subject_id}/{template_filename}"
-    t1 = np.load(s1_path)
-    t2 = np.load(s2_path)
-
-    #Enc_s1 = ts.ckks_vector(context, t1.tolist())
-    #Enc_s2 = ts.ckks_vector(context, t2.tolist())
-    Enc_s1 = t1
-    Enc_s2 = t2
-
-    # 3) Compute encrypted difference
-    Enc_diff1 = Enc_s1 - Enc_p1
-    Enc_diff2 = Enc_s2 - Enc_p2
-    Enc_total_diff = Enc_diff1 + Enc_diff2
-
-    # 4) Compute Euclidean distance
-    Enc_sq_diff = Enc_total_diff * Enc_total_diff
-    Enc_sq_sum = Enc_sq_diff.sum()
-
-    # Decrypt and compute the final result
-    #decrypted_sq_sum = Enc_sq_sum.decrypt()
-    #distance = float(np.sqrt(decrypted_sq_sum[0]))  # Approximate due to CKKS
-    distance = float(np.sqrt(Enc_sq_sum))
-    return distance
+from ckks_utils import create_ckks_context, public_context_bytes, sum_rotation_steps, squared_norm
+from score_io import ScoreFileWriter, export_text
+from secret_sharing import split_into_shares
+from template_store import open_store
+
+SAMPLES_PER_SUBJECT = 5
+DATABASE = "IrisFingerprintDatabases/IrisDatabase"
+SERVER_STORES = ["server1_iris_database", "server2_iris_database"]
+# Rows per side of an all-pairs tile: a few tile x tile float64 matrices in memory
+ALL_PAIRS_TILE = 1024
+
+# --- CKKS context and helper functions ---
+
+@lru_cache(maxsize=None)
+def ckks_context():
+    """This process's private context, created on first use (after the fork in pool workers)."""
+    return create_ckks_context()
+
+@lru_cache(maxsize=None)
+def eval_context(vector_size):
+    """Public context with only the Galois keys .sum() needs for this vector size."""
+    return ts.context_from(public_context_bytes(
+        ckks_context(), sum_rotation_steps(vector_size), relin_keys=True
+    ))
+
+def prepare_plain(t1, t2):
+    return t1, t2
+
+def compare_plain(probe, template, rng):
+    """Distance of `probe` to the template shared as (t1, t2), on plain shares."""
+    t1, t2 = template
+    p1, p2 = split_into_shares(probe, rng)
+    total_diff = (t1 - p1) + (t2 - p2)
+    return float(np.sqrt(np.dot(total_diff, total_diff)))
+
+def prepare_encrypted(t1, t2):
+    """Both template shares encrypted once, for every comparison the template takes part in."""
+    context = ckks_context()
+    return ts.ckks_vector(context, t1.tolist()), ts.ckks_vector(context, t2.tolist())
+
+def compare_encrypted(probe, template, rng):
+    """Same as compare_plain() under CKKS, `template` from prepare_encrypted()."""
+    context = ckks_context()
+    enc_t1, enc_t2 = template
+    p1, p2 = split_into_shares(probe, rng)
+    enc_diff1 = enc_t1 - ts.ckks_vector(context, p1.tolist())
+    enc_diff2 = enc_t2 - ts.ckks_vector(context, p2.tolist())
+    enc_sq_sum = squared_norm(enc_diff1 + enc_diff2, eval_context(len(probe)))
+    # CKKS noise can push a zero distance slightly below 0
+    return float(np.sqrt(max(enc_sq_sum.decrypt()[0], 0)))
+
+# --- Evaluation engine ---
+
+class EvaluationCache:
+    """
+    Every sample of the database in one order (subject by subject, samples
+    sorted): the probes as read from the database and the two servers'
+    template shares, one row per sample (None when loaded without stores).
+    Subject s owns rows starts[s]:ends[s].
+    """
+
+    def __init__(self, subjects, keys, starts, ends, probes, t1, t2):
+        self.subjects = subjects
+        self.keys = keys
+        self.starts = starts
+        self.ends = ends
+        self.probes = probes
+        self.t1 = t1
+        self.t2 = t2
+
+    @classmethod
+    def load(cls, db_root=DATABASE, store_paths=SERVER_STORES):
+        subjects = []
+        keys = []
+        starts = []
+        for subject in sorted(os.listdir(db_root)):
+            subject_path = os.path.join(db_root, subject)
+            if not os.path.isdir(subject_path):
+                continue
+            subjects.append(subject)
+            starts.append(len(keys))
+            for path in sorted(glob.glob(os.path.join(subject_path, "*.npy"))):
+                keys.append((subject, os.path.splitext(os.path.basename(path))[0]))
+        starts = np.array(starts, dtype=np.int64)
+        ends = np.append(starts[1:], len(keys))
+
+        probes = np.stack([np.load(os.path.join(db_root, subject, f"{sample}.npy")) for subject, sample in keys])
+        t1 = t2 = None
+        if store_paths:
+            t1, t2 = (np.asarray(open_store(path).get_many(keys)) for path in store_paths)
+        return cls(subjects, keys, starts, ends, probes, t1, t2)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def labels(self):
+        """Subject index of every row, non-decreasing."""
+        return np.repeat(np.arange(len(self.subjects)), self.ends - self.starts)
+
+# Set in every pool worker by init_worker()
+_cache = None
+_prepare = None
+_compare = None
+
+def init_worker(cache, encrypted):
+    global _cache, _prepare, _compare
+    _cache = cache
+    _prepare, _compare = (prepare_encrypted, compare_encrypted) if encrypted else (prepare_plain, compare_plain)
+
+def impostor_rows(cache, subject, count, rng):
+    """`count` distinct random rows of other subjects, drawn without building the list of candidates."""
+    start, end = cache.starts[subject], cache.ends[subject]
+    others = len(cache) - (end - start)
+    rows = rng.choice(others, size=min(count, others), replace=False)
+    # Candidates are numbered around the subject's own rows
+    rows[rows >= start] += end - start
+    return rows
+
+def score_subject(task):
+    """
+    Mated and non-mated scores of one subject (an index into cache.subjects)
+    with its own seed, and the (template row, probe row) pair of every score.
+    """
+    subject, seed = task
+    rng = np.random.default_rng(seed)
+    start = _cache.starts[subject]
+    # A subject's templates only take part in its own comparisons, prepare (encrypt) each once here
+    templates = [_prepare(_cache.t1[start + i], _cache.t2[start + i]) for i in range(SAMPLES_PER_SUBJECT - 1)]
+
+    mated = []
+    mated_pairs = []
+    for i in range(SAMPLES_PER_SUBJECT):
+        for j in range(i + 1, SAMPLES_PER_SUBJECT):
+            mated.append(_compare(_cache.probes[start + j], templates[i], rng))
+            mated_pairs.append((start + i, start + j))
+
+    # As many non-mated scores, the subject's first sample as template
+    rows = impostor_rows(_cache, subject, len(mated), rng)
+    nonmated = [_compare(_cache.probes[row], templates[0], rng) for row in rows]
+    nonmated_pairs = [(start, row) for row in rows]
+    return _cache.subjects[subject], mated, nonmated, mated_pairs, nonmated_pairs
+
+def evaluate(cache, encrypted=False, workers=1, seed=0, limit=None, skip=()):
+    """
+    Yields (subject ID, mated scores, non-mated scores, mated pairs,
+    non-mated pairs) from score_subject() for every subject with at least
+    SAMPLES_PER_SUBJECT samples (the first `limit` of them, then leaving out
+    the IDs in `skip`), in database order, computed by `workers` processes
+    (in this one for 1).
+    """
+    # One child per subject, eligible or not, so a subject's seed only depends on `seed` and its position
+    seeds = np.random.SeedSequence(seed).spawn(len(cache.subjects))
+    tasks = [
+        (subject, seeds[subject]) for subject in range(len(cache.subjects))
+        if cache.ends[subject] - cache.starts[subject] >= SAMPLES_PER_SUBJECT
+    ][:limit]
+    tasks = [task for task in tasks if cache.subjects[task[0]] not in skip]
+    if workers == 1:
+        init_worker(cache, encrypted)
+        yield from map(score_subject, tasks)
+        return
+    # A few chunks per worker: small enough to balance, large enough to keep the pipes quiet
+    chunksize = max(1, len(tasks) // (4 * workers))
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(cache, encrypted)) as pool:
+        yield from pool.map(score_subject, tasks, chunksize=chunksize)
+
+def all_pairs_scores(templates, labels, tile=ALL_PAIRS_TILE):
+    """
+    Yields (mated, non-mated) arrays of the Euclidean distances between rows
+    i < j of `templates`, tile by tile, mated where labels[i] == labels[j].
+    Squared distances come from ||a||^2 + ||b||^2 - 2 a.b with one matrix
+    product per tile, so memory stays at a few tile x tile matrices for any
+    number of rows. `labels` must be non-decreasing (rows grouped by
+    subject): tiles whose label ranges do not overlap are all non-mated and
+    skip the masking.
+    """
+    templates = np.ascontiguousarray(templates, dtype=np.float64)
+    labels = np.asarray(labels)
+    sq_norms = np.einsum("ij,ij->i", templates, templates)
+    n = len(templates)
+    for i0 in range(0, n, tile):
+        i1 = min(i0 + tile, n)
+        for j0 in range(i0, n, tile):
+            j1 = min(j0 + tile, n)
+            sq = templates[i0:i1] @ templates[j0:j1].T
+            sq *= -2
+            sq += sq_norms[i0:i1, None]
+            sq += sq_norms[None, j0:j1]
+            # Rounding can leave identical rows slightly below 0
+            np.maximum(sq, 0, out=sq)
+            np.sqrt(sq, out=sq)
+            if labels[i1 - 1] < labels[j0]:
+                yield sq[:0].ravel(), sq.ravel()
+                continue
+            pairs = np.ones(sq.shape, dtype=bool) if j0 > i0 else np.triu(np.ones(sq.shape, dtype=bool), 1)
+            same = labels[i0:i1, None] == labels[None, j0:j1]
+            yield sq[pairs & same], sq[pairs & ~same]
+
+def save_all_pairs(cache, system_name, params, tile=ALL_PAIRS_TILE):
+    """Streams the all-pairs scores of the cached samples to the score files, returns the ScoreFileWriter."""
+    writer = ScoreFileWriter(system_name, params=params)
+    try:
+        for mated, nonmated in all_pairs_scores(cache.probes, cache.labels(), tile):
+            writer.append(mated, nonmated)
+    finally:
+        writer.close()
+    return writer
+
+class ScoreWriter:
+    """
+    Appends the scores and pairs of every subject to the binary score files
+    (a ScoreFileWriter), flushes them, then records the subject and the
+    running score counts in the checkpoint.
+
+    The checkpoint starts with the run parameters as JSON; a resumed run must
+    pass the same ones. Resuming cuts the score files back to the counts of
+    the last recorded subject, dropping whatever was written after it.
+    """
+
+    def __init__(self, system_name, params, samples, resume=False):
+        self.checkpoint_path = f"{system_name}_checkpoint.tsv"
+        self.done = set()
+        counts = None
+        if resume and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                recorded = json.loads(f.readline())
+                if recorded != params:
+                    raise ValueError(f"{self.checkpoint_path} is from a run with {recorded}, not {params}")
+                checkpoint_size = f.tell()
+                for line in f:
+                    # A line cut off by the interruption does not count
+                    if not line.endswith("\n"):
+                        break
+                    subject, mated, nonmated = line.split("\t")
+                    self.done.add(subject)
+                    counts = (int(mated), int(nonmated))
+                    checkpoint_size += len(line)
+            os.truncate(self.checkpoint_path, checkpoint_size)
+            self.checkpoint = open(self.checkpoint_path, "a")
+        else:
+            self.checkpoint = open(self.checkpoint_path, "w")
+            self.checkpoint.write(json.dumps(params) + "\n")
+            self.checkpoint.flush()
+        # Nothing recorded yet starts the score files afresh
+        self.scores = ScoreFileWriter(system_name, samples=samples, params=params, counts=counts)
+
+    @property
+    def counts(self):
+        return self.scores.counts
+
+    def append(self, subject, mated, nonmated, mated_pairs, nonmated_pairs):
+        self.scores.append(mated, nonmated, mated_pairs, nonmated_pairs)
+        self.scores.flush()
+        self.checkpoint.write(f"{subject}\t{self.counts[0]}\t{self.counts[1]}\n")
+        self.checkpoint.flush()
+
+    def close(self):
+        self.scores.close()
+        self.checkpoint.close()
 
 def main():
-    system_name = "iris_non-encrypted"
-
-    db_root = "IrisFingerprintDatabases/IrisDatabase"
-    subject_ids = sorted(os.listdir(db_root))
-
-    mated_scores = []
-    nonmated_scores = []
-
-    all_files_dict = {}
-    for subj in subject_ids:
-        subj_path = os.path.join(db_root, subj)
-        if os.path.isdir(subj_path):
-            npy_files = sorted(glob.glob(os.path.join(subj_path, "*.npy")))
-            all_files_dict[subj] = npy_files
-
-    # Create a global pool for non-mated comparisons
-    global_pool = [(sid, f) for sid, files in all_files_dict.items() for f in files]
-
-    for subj in subject_ids:
-        files_in_subj = all_files_dict.get(subj, [])
-        if len(files_in_subj) < 5:
-            continue  # Skip if fewer than 4 files
-
-        chosen_files = files_in_subj[:5]
-
-        # ========== Mated: Compare all pairwise combos within the first 4 ==========
-        local_mated_scores = []
-        for i in range(5):
-            for j in range(i + 1, 5):
-                template_path = chosen_files[i]
-                probe_path = chosen_files[j]
-
-                template_filename = os.path.basename(template_path)
-                probe_array = np.load(probe_path)
-
-                dist = compare_samples(probe_array, subj, template_filename)
-                local_mated_scores.append(dist)
-
-        K = len(local_mated_scores)  # typically 6
-        if K == 0:
-            continue
-
-        # ========== Non-Mated: Pick exactly K random files from other subjects ==========
-        other_files = [(sid, f) for sid, f in global_pool if sid != subj]
-        random.shuffle(other_files)
-        chosen_nonmated = other_files[:K]
-
-        local_nonmated_scores = []
-        for (other_sid, nfpath) in chosen_nonmated:
-            template_filename = os.path.basename(chosen_files[0])  # Use first as template
-            probe_array = np.load(nfpath)
-
-            dist = compare_samples(probe_array, subj, template_filename)
-            local_nonmated_scores.append(dist)
-
-        # Store results
-        mated_scores.extend(local_mated_scores)
-        nonmated_scores.extend(local_nonmated_scores)
-
-        print(f"Subject {subj}: +{K} mated, +{K} non-mated.")
-
-    # Convert final results to arrays
-    mated_scores = np.array(mated_scores)
-    nonmated_scores = np.array(nonmated_scores)
-
-    print(f"TOTAL Mated: {len(mated_scores)}")
-    print(f"TOTAL Non-Mated: {len(nonmated_scores)}")
-
-    # Save results
-    mated_txt_file = f"{system_name}_mated.txt.gz"
-    nonmated_txt_file = f"{system_name}_nonmated.txt.gz"
-
-    np.savetxt(mated_txt_file, mated_scores, fmt="%.8f")
-    np.savetxt(nonmated_txt_file, nonmated_scores, fmt="%.8f")
+    parser = argparse.ArgumentParser(description="Mated and non-mated scores of the secret-shared database")
+    parser.add_argument("--database", default=DATABASE)
+    parser.add_argument("--servers", nargs=2, default=SERVER_STORES, metavar="STORE",
+                        help="template share stores of the two servers (see database_splitter.py)")
+    parser.add_argument("--encrypted", action="store_true", help="compare under CKKS instead of on plain shares")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0, help="seed of the shares and the impostor sampling")
+    parser.add_argument("--subjects", type=int, default=None,
+                        help="only score the first N subjects (impostors still come from all of them)")
+    parser.add_argument("--all-pairs", action="store_true",
+                        help="plaintext distances of every pair of samples in the database instead")
+    parser.add_argument("--tile", type=int, default=ALL_PAIRS_TILE, help="rows per side of an --all-pairs tile")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted run from its checkpoint (same options required)")
+    parser.add_argument("--text", action="store_true",
+                        help="export the scores as gzip text files (<system>_mated.txt.gz ...) as well")
+    parser.add_argument("--system-name", default=None,
+                        help="prefix of the score files (default iris_encrypted / iris_non-encrypted / "
+                             "iris_all-pairs)")
+    args = parser.parse_args()
+    if args.all_pairs and (args.encrypted or args.resume):
+        parser.error("--all-pairs is the plaintext baseline, it excludes --encrypted and --resume")
+    system_name = args.system_name or (
+        "iris_all-pairs" if args.all_pairs else "iris_encrypted" if args.encrypted else "iris_non-encrypted"
+    )
 
-    print(f"Saved {len(mated_scores)} mated scores to {mated_txt_file}")
-    print(f"Saved {len(nonmated_scores)} nonmated scores to {nonmated_txt_file}")
+    start = time.perf_counter()
+    # The all-pairs baseline compares the templates themselves, no shares needed
+    cache = EvaluationCache.load(args.database, None if args.all_pairs else args.servers)
+    load_time = time.perf_counter() - start
+    print(f"Loaded {len(cache)} samples of {len(cache.subjects)} subjects in {load_time:.2f}s")
+
+    if args.all_pairs:
+        start = time.perf_counter()
+        writer = save_all_pairs(cache, system_name, {"database": args.database, "all_pairs": True}, args.tile)
+        elapsed = time.perf_counter() - start
+        mated_count, nonmated_count = writer.counts
+        print(f"TOTAL Mated: {mated_count}")
+        print(f"TOTAL Non-Mated: {nonmated_count}")
+        print(f"{mated_count + nonmated_count} pairs scored and saved to {writer.paths['mated']} / "
+              f"{writer.paths['nonmated']} in {elapsed:.2f}s")
+        if args.text:
+            print(f"Exported {' / '.join(export_text(system_name))}")
+        return
+
+    params = {"database": args.database, "servers": args.servers, "encrypted": args.encrypted,
+              "seed": args.seed, "subjects": args.subjects, "samples_per_subject": SAMPLES_PER_SUBJECT}
+    writer = ScoreWriter(system_name, params, cache.keys, args.resume)
+    if writer.done:
+        print(f"Resuming after {len(writer.done)} subjects ({writer.counts[0]} mated, {writer.counts[1]} non-mated)")
+
+    comparisons = 0
+    start = time.perf_counter()
+    try:
+        for subject, mated, nonmated, mated_pairs, nonmated_pairs in evaluate(
+                cache, args.encrypted, args.workers, args.seed, args.subjects, writer.done):
+            writer.append(subject, mated, nonmated, mated_pairs, nonmated_pairs)
+            comparisons += len(mated) + len(nonmated)
+            print(f"Subject {subject}: +{len(mated)} mated, +{len(nonmated)} non-mated.")
+    finally:
+        writer.close()
+    elapsed = time.perf_counter() - start
+
+    print(f"TOTAL Mated: {writer.counts[0]}")
+    print(f"TOTAL Non-Mated: {writer.counts[1]}")
+    print(f"{comparisons} {'encrypted' if args.encrypted else 'plaintext'} comparisons in {elapsed:.2f}s "
+          f"({comparisons / max(elapsed, 1e-9):.1f} comparisons/s, {args.workers} workers)")
+    print(f"Saved {writer.counts[0]} mated scores to {writer.scores.paths['mated']}")
+    print(f"Saved {writer.counts[1]} nonmated scores to {writer.scores.paths['nonmated']}")
+    if args.text:
+        print(f"Exported {' / '.join(export_text(system_name))}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,56 +1,224 @@
+"""
+Splits every template of the input database into secret shares, one per
+server (two by default, N-of-N with --parties), and appends them to the
+servers' template stores.
+
+Subjects are split by a pool of worker processes and appended in order by
+the main process, with at most a few subjects per worker in flight. After
+every store holds a subject it is recorded in the manifest (one
+"subject<TAB>rows" line), so an interrupted run continues with --resume
+from the last recorded subject.
+
+With --seeded, the share of every server but the first is expanded from a
+random 32-byte seed of its own (see secret_sharing.expand_share) and their
+stores keep only the seed and the index; server 1 stores the explicit
+remainder.
+
+    python database_splitter.py --workers 8 --verify
+    python database_splitter.py --resume
+    python database_splitter.py --seeded
+    python database_splitter.py --parties 4 --verify
+"""
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import numpy as np
 
-# Define paths using pathlib
-input_folder = Path("IrisFingerprintDatabases/IrisDatabase")
-server1_folder = Path("server1_iris_database")
-server2_folder = Path("server2_iris_database")
+from secret_sharing import (
+    RING_DTYPES, encode_fixed, expand_share, frac_bits_for, new_seed, sample_nonce,
+    split_into_ring_shares, split_into_shares, split_with_seeds,
+)
+from template_store import TemplateStore, open_store
+
+INPUT_FOLDER = "IrisFingerprintDatabases/IrisDatabase"
+# Store of server N (1-based)
+SERVER_FOLDER = "server{}_iris_database"
+MANIFEST = "splitter_manifest.tsv"
+
+def split_subject(subject_folder, dtype, verify, parties=2, seeds=None):
+    """
+    Loads and splits every template of one subject into `parties` shares.
+    Returns the store keys, the share matrix of every party and the samples
+    whose stored shares (after the cast to `dtype`) do not reconstruct the
+    template. With `seeds` (one per party but the first) those parties'
+    shares are expanded from them and returned as None.
+    """
+    subject_folder = Path(subject_folder)
+    file_paths = sorted(subject_folder.glob("*.npy"))
+    keys = [(subject_folder.name, file_path.stem) for file_path in file_paths]
+    if not file_paths:
+        return keys, None, []
+    templates = np.stack([np.load(file_path) for file_path in file_paths])
+
+    mismatches = []
+    if seeds is not None:
+        nonces = [sample_nonce(subject, sample) for subject, sample in keys]
+        t1 = np.stack([
+            split_with_seeds(template, seeds, nonce, dtype) for template, nonce in zip(templates, nonces)
+        ])
+        if verify:
+            for (_, sample), share, template, nonce in zip(keys, t1, templates, nonces):
+                share_sum = share
+                for seed in seeds:
+                    share_sum = share_sum + expand_share(seed, nonce, share.shape, dtype)
+                if dtype in RING_DTYPES:
+                    if not np.array_equal(share_sum, encode_fixed(template, dtype)):
+                        mismatches.append((sample, "ring shares differ"))
+                elif not np.allclose(share_sum, template, atol=1e-8 if np.dtype(dtype) == np.float64 else 1e-5):
+                    mismatches.append((sample, float(np.sum(share_sum - template))))
+        return keys, [t1] + [None] * len(seeds), mismatches
+
+    # Fresh OS entropy per subject, forked workers must not share the parent's RNG state
+    rng = np.random.default_rng()
+    if dtype in RING_DTYPES:
+        shares = split_into_ring_shares(templates, dtype, rng, parties=parties)
+        if verify:
+            # Ring shares reconstruct the quantized template exactly
+            encoded = encode_fixed(templates, dtype)
+            share_sum = shares[0]
+            for share in shares[1:]:
+                share_sum = share_sum + share
+            for (_, sample), sample_sum, template in zip(keys, share_sum, encoded):
+                if not np.array_equal(sample_sum, template):
+                    mismatches.append((sample, int(np.count_nonzero(sample_sum != template))))
+        return keys, list(shares), mismatches
 
-# Ensure output folders exist
-server1_folder.mkdir(parents=True, exist_ok=True)
-server2_folder.mkdir(parents=True, exist_ok=True)
+    shares = [share.astype(dtype) for share in split_into_shares(templates, rng, parties)]
+    if verify:
+        reconstructed = sum(share.astype(np.float64) for share in shares)
+        atol = 1e-8 if np.dtype(dtype) == np.float64 else 1e-5
+        for (_, sample), template, reconstructed_template in zip(keys, templates, reconstructed):
+            if not np.allclose(reconstructed_template, template, atol=atol):
+                mismatches.append((sample, float(np.sum(reconstructed_template - template))))
+    return keys, shares, mismatches
 
-def split_into_shares(secret_vector):
-    """ Splits a fingerprint template into two secret shares. """
-    s2 = np.random.rand(*secret_vector.shape)  # Generate random float values
-    s1 = secret_vector - s2  # Ensure sum of shares reconstructs original
-    return s1, s2
+def read_manifest(path):
+    """(subject, rows) entries of the manifest, rows being the store size after the subject."""
+    entries = []
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                # A line cut short by the interruption ends without a newline
+                if not line.endswith("\n"):
+                    break
+                subject, rows = line.rstrip("\n").split("\t")
+                entries.append((subject, int(rows)))
+    return entries
 
-# Iterate through user ID folders in the input database
-for user_id_folder in input_folder.iterdir():
-    if not user_id_folder.is_dir():  # Skip non-folder entries
-        continue
+def open_stores(args, folders):
+    """Stores (one per party) to continue and the subjects they already hold."""
+    entries = read_manifest(args.manifest) if args.resume else []
+    # Rewrite the manifest without a trailing partial line (empty for a fresh run)
+    with open(args.manifest, "w") as f:
+        f.writelines(f"{subject}\t{rows}\n" for subject, rows in entries)
+    if not entries:
+        return None, set()
 
-    # Create corresponding folders in server1 and server2 databases
-    server1_user_folder = server1_folder / user_id_folder.name
-    server2_user_folder = server2_folder / user_id_folder.name
+    stores = [open_store(folder) for folder in folders]
+    if stores[0].dtype != np.dtype(args.dtype):
+        raise ValueError(f"Cannot resume {folders[0]} ({stores[0].dtype.name} shares) with --dtype {args.dtype}")
+    for folder, store in zip(folders[1:], stores[1:]):
+        if store.is_seeded != args.seeded:
+            raise ValueError(f"Cannot resume {folder} with{'out' if args.seeded else ''} --seeded")
+    for store in stores:
+        # Drop what was appended after the last subject the manifest recorded
+        store.truncate(entries[-1][1])
+    return stores, {subject for subject, _ in entries}
 
-    server1_user_folder.mkdir(parents=True, exist_ok=True)
-    server2_user_folder.mkdir(parents=True, exist_ok=True)
+def server_folders(args):
+    """Store directory of every party: --servers, else SERVER_FOLDER, with --server1/--server2 overrides."""
+    folders = list(args.servers or [SERVER_FOLDER.format(party + 1) for party in range(args.parties)])
+    if len(folders) != args.parties:
+        raise ValueError(f"--servers lists {len(folders)} directories for {args.parties} parties")
+    for party, folder in enumerate((args.server1, args.server2)):
+        if folder:
+            folders[party] = folder
+    return folders
 
-    # Process each .npy file in the user folder
-    for file_path in user_id_folder.glob("*.npy"):
-        # Load biometric template
-        template = np.load(file_path)
+def main():
+    parser = argparse.ArgumentParser(description="Split the template database into one share store per server")
+    parser.add_argument("--input", default=INPUT_FOLDER)
+    parser.add_argument("--parties", type=int, default=2, help="number of servers to share every template among")
+    parser.add_argument("--servers", nargs="+", metavar="DIR",
+                        help=f"store directory of every server (default: {SERVER_FOLDER.format('<N>')})")
+    parser.add_argument("--server1", help="store directory of server 1")
+    parser.add_argument("--server2", help="store directory of server 2")
+    parser.add_argument("--manifest", default=MANIFEST)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--dtype", choices=["float64", "float32", *RING_DTYPES], default="float64",
+                        help="float64/float32 give real shares for the CKKS path, uint64/uint32 "
+                             "exact fixed-point ring shares for the MPC mode (see secret_sharing.py)")
+    parser.add_argument("--verify", action="store_true",
+                        help="check in memory that the stored shares reconstruct every template")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted run from the manifest")
+    parser.add_argument("--seeded", action="store_true",
+                        help="store the shares of every server but the first as a 32-byte PRG seed "
+                             "instead of share rows")
+    args = parser.parse_args()
+    if args.parties < 2:
+        parser.error("--parties must be at least 2")
+    try:
+        folders = server_folders(args)
+    except ValueError as err:
+        parser.error(str(err))
 
-        # Compute secret shares
-        t1, t2 = split_into_shares(template)
+    start = time.perf_counter()
+    stores, done = open_stores(args, folders)
+    seeds = None
+    if args.seeded:
+        seeds = [store.seed for store in stores[1:]] if stores else [new_seed() for _ in folders[1:]]
+    subject_folders = (p for p in sorted(Path(args.input).iterdir()) if p.is_dir() and p.name not in done)
+    if done:
+        print(f"Resuming after {len(done)} subjects ({len(stores[0])} samples)")
 
-        # Define save paths
-        t1_path = server1_user_folder / file_path.name
-        t2_path = server2_user_folder / file_path.name
+    files = 0
+    subjects = 0
+    mismatches = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool, open(args.manifest, "a") as manifest:
+        # Results are appended in submission order, keep only a few subjects per worker in flight
+        pending = deque()
+        max_pending = 4 * args.workers
+        while True:
+            for subject_folder in subject_folders:
+                pending.append(pool.submit(split_subject, subject_folder, args.dtype, args.verify,
+                                           args.parties, seeds))
+                if len(pending) >= max_pending:
+                    break
+            if not pending:
+                break
 
-        # Save secret shares in respective folders (ensure float64 for precision)
-        np.save(t1_path, t1.astype(np.float64))
-        np.save(t2_path, t2.astype(np.float64))
+            keys, shares, subject_mismatches = pending.popleft().result()
+            if not keys:
+                continue
+            # Create the packed stores once the template length is known
+            if stores is None:
+                frac_bits = frac_bits_for(args.dtype) if args.dtype in RING_DTYPES else None
+                dim = shares[0].shape[1]
+                stores = [TemplateStore.create(folders[0], dim, args.dtype, frac_bits)] + [
+                    TemplateStore.create(folder, dim, args.dtype, frac_bits, seeds[party] if seeds else None)
+                    for party, folder in enumerate(folders[1:])
+                ]
+            for store, share in zip(stores, shares):
+                store.append(keys, share)
+            manifest.write(f"{keys[0][0]}\t{len(stores[0])}\n")
+            manifest.flush()
 
-        # ✅ Load back & verify correctness
-        t1_loaded = np.load(t1_path)
-        t2_loaded = np.load(t2_path)
-        reconstructed_template = t1_loaded + t2_loaded
-        diff = np.sum(reconstructed_template - template)
+            for sample, diff in subject_mismatches:
+                print(f"⚠️ WARNING: Mismatch detected for {sample} (difference: {diff})")
+            files += len(keys)
+            subjects += 1
+            mismatches += len(subject_mismatches)
 
-        if not np.allclose(reconstructed_template, template, atol=1e-8):
-            print(f"⚠️ WARNING: Mismatch detected for {file_path.name} (Sum difference: {diff})")
+    elapsed = time.perf_counter() - start
+    print(f"✅ Secret sharing complete. Data stored in {', '.join(repr(folder) for folder in folders)}.")
+    print(f"Split {files} files of {subjects} subjects in {elapsed:.2f}s "
+          f"({files / elapsed:.0f} files/s, {args.workers} workers)")
+    if args.verify:
+        print(f"Verified in memory: {mismatches} mismatches")
 
-print("✅ Secret sharing complete. Data stored in 'server1_database' and 'server2_database'.")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+SIMD packing for 1:N identification.
+
+A CKKS ciphertext has POLY_MODULUS_DEGREE / 2 slots. Templates are padded
+with zeros to the next power of two (`block_dim`) and `per_block` of them
+are laid out back to back in one slot vector:
+
+    slots  | t0 (block_dim) | t1 (block_dim) | ... | t(per_block - 1) |
+
+The client replicates its probe share the same way, so one
+ciphertext - plaintext on a server yields the differences to `per_block`
+templates at once. The client adds the two servers' blocks, squares them
+and sums each segment with rotations by 1, 2, ..., block_dim / 2 (the same
+Galois keys CKKSVector.sum() uses for a `block_dim` vector), after which
+slot j * block_dim holds the squared distance to template j.
+"""
+import numpy as np
+from tenseal import sealapi
+
+from ckks_utils import POLY_MODULUS_DEGREE, sum_rotation_steps
+
+SLOT_COUNT = POLY_MODULUS_DEGREE // 2
+
+
+def packing_layout(dim, slot_count=SLOT_COUNT):
+    """(block_dim, per_block) for templates of length `dim`."""
+    block_dim = 1 << (dim - 1).bit_length()
+    if block_dim > slot_count:
+        raise ValueError(f"Templates of length {dim} do not fit in {slot_count} slots")
+    return block_dim, slot_count // block_dim
+
+
+def replicate(vector, block_dim, per_block):
+    """`vector` zero-padded to `block_dim` and repeated `per_block` times."""
+    padded = np.zeros(block_dim)
+    padded[:len(vector)] = vector
+    return np.tile(padded, per_block)
+
+
+def pack_blocks(templates, block_dim, per_block):
+    """Slot vectors of `per_block` templates each, the last one zero-filled."""
+    blocks = np.zeros((-(-len(templates) // per_block) * per_block, block_dim))
+    blocks[:len(templates), :templates.shape[1]] = templates
+    return blocks.reshape(-1, per_block * block_dim)
+
+
+class GalleryScorer:
+    """
+    Turns pairs of server blocks into squared distances. Works on raw SEAL
+    ciphertexts because CKKSVector has no rotation by an arbitrary step.
+    """
+
+    def __init__(self, context, eval_context, block_dim):
+        self.block_dim = block_dim
+        eval_seal_context = eval_context.seal_context().data
+        self.evaluator = sealapi.Evaluator(eval_seal_context)
+        self.relin_keys = eval_context.relin_keys().data
+        self.galois_keys = eval_context.galois_keys().data
+        seal_context = context.seal_context().data
+        self.decryptor = sealapi.Decryptor(seal_context, context.secret_key().data)
+        self.encoder = sealapi.CKKSEncoder(seal_context)
+
+    def squared_distances(self, enc_diff1, enc_diff2, count):
+        """Squared distances to the first `count` templates of one block."""
+        (diff,) = enc_diff1.ciphertext()
+        (diff2,) = enc_diff2.ciphertext()
+        evaluator = self.evaluator
+        evaluator.add_inplace(diff, diff2)
+        evaluator.square_inplace(diff)
+        evaluator.relinearize_inplace(diff, self.relin_keys)
+        evaluator.rescale_to_next_inplace(diff)
+        rotated = sealapi.Ciphertext()
+        for step in sum_rotation_steps(self.block_dim):
+            evaluator.rotate_vector(diff, step, self.galois_keys, rotated)
+            evaluator.add_inplace(diff, rotated)
+
+        plain = sealapi.Plaintext()
+        self.decryptor.decrypt(diff, plain)
+        slots = np.array(self.encoder.decode_double(plain))
+        return slots[:count * self.block_dim:self.block_dim]
+
+
+def top_k(ids, distances, k):
+    """The `k` closest (id, distance) pairs, closest first."""
+    k = min(k, len(distances))
+    nearest = np.argpartition(distances, k - 1)[:k]
+    nearest = nearest[np.argsort(distances[nearest])]
+    return [(ids[i], float(distances[i])) for i in nearest]
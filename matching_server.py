@@ -0,0 +1,661 @@
+import argparse
+import os
+import signal
+import socket
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+import tenseal as ts
+
+from beaver import TripleStore, TripleReuseError, open_share, finish_share
+from ckks_utils import create_ckks_context, encrypt_vector_bytes, level_parms_id
+from identification import packing_layout
+from protocol import (
+    OP_CODECS, OP_REGISTER, OP_VERIFY, OP_VERIFY_SEED, OP_VERIFY_BATCH, OP_VERIFY_FORWARD, OP_IDENTIFY, OP_MPC_OPEN,
+    OP_MPC_OPEN_SEED, OP_MPC_FINISH, OP_AGG_PART, STATUS_OK, STATUS_UNKNOWN_SESSION, STATUS_ERROR, BATCH_RESULT,
+    BATCH_OK, BATCH_FAILED, context_digest
+)
+from secret_sharing import expand_payload
+from template_cache import TemplateCache, TEMPLATE_CACHE_SIZE
+from template_store import META_FILE, open_store
+from transport import (
+    choose_codec, connect, set_codec, set_nodelay, send_frames, send_large_data, receive_large_data
+)
+
+HOST = "127.0.0.1"
+# Party i listens on BASE_PORT + i
+BASE_PORT = 65431
+CONTEXT_CACHE_SIZE = 16
+
+
+class ContextCache:
+    """
+    Bounded LRU of deserialized CKKS contexts, keyed by context hash (= session
+    id). `n_threads` sizes TenSEAL's thread pool of every context (None: one
+    thread per core).
+    """
+
+    def __init__(self, maxsize=CONTEXT_CACHE_SIZE, n_threads=None):
+        self.maxsize = maxsize
+        self.n_threads = n_threads
+        self.contexts = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, session_id):
+        with self.lock:
+            context = self.contexts.get(session_id)
+            if context is not None:
+                self.contexts.move_to_end(session_id)
+            return context
+
+    def register(self, ctx_bytes):
+        session_id = context_digest(ctx_bytes)
+        if self.get(session_id) is not None:
+            return session_id
+        # Deserializing takes a while, don't hold the lock for it
+        context = ts.context_from(ctx_bytes, n_threads=self.n_threads)
+        with self.lock:
+            self.contexts[session_id] = context
+            self.contexts.move_to_end(session_id)
+            while len(self.contexts) > self.maxsize:
+                self.contexts.popitem(last=False)
+        return session_id
+
+
+def send_error(conn, message):
+    send_large_data(conn, STATUS_ERROR)
+    send_large_data(conn, message.encode())
+
+
+class MatchingHandler(socketserver.BaseRequestHandler):
+    """Serves verification requests on one connection until the client hangs up."""
+
+    def setup(self):
+        set_nodelay(self.request)
+        self.server.track_connection(self.request)
+
+    def handle(self):
+        while True:
+            try:
+                op = receive_large_data(self.request)
+            except ConnectionError:
+                # The client closed the connection between two requests
+                break
+            handler = self.server.operations.get(bytes(op))
+            if handler is None:
+                # Can't tell where the unknown request ends, so drop the connection
+                send_error(self.request, f"unknown operation {op[:32].decode(errors='replace')}")
+                break
+            self.server.streaming.started = False
+            try:
+                handler(self.request)
+            except ConnectionError:
+                break
+            except Exception as err:
+                print(f"[{self.server.name}] {op.decode()} failed: {err!r}")
+                if self.server.streaming.started:
+                    # The client is reading a streamed reply (VERIFY_BATCH results, IDENTIFY
+                    # blocks) and could take an error frame for part of it: drop the connection
+                    break
+                # Operations read their frames before working on them, so the connection is
+                # normally still in step: report the error and serve the next request. Frames
+                # left unread show up as an unknown operation, which drops the connection.
+                send_error(self.request, f"{op.decode()} failed: {err!r}")
+
+    def finish(self):
+        self.server.untrack_connection(self.request)
+
+
+class SessionServer(socketserver.ThreadingTCPServer):
+    """
+    Threaded server keeping the contexts clients register (see protocol.py)
+    and the open connections, so stop() can end them gracefully. The matching
+    servers and the aggregator build on it.
+    """
+
+    allow_reuse_address = True
+    # Set by listen(): pre-forked workers bind one socket each to the same port
+    reuse_port = False
+    # Wait for in-flight requests in server_close() instead of killing them
+    daemon_threads = False
+    block_on_close = True
+
+    def __init__(self, name, address, handler, context_cache_size=CONTEXT_CACHE_SIZE, tenseal_threads=None,
+                 bind_and_activate=True):
+        super().__init__(address, handler, bind_and_activate)
+        self.name = name
+        self.contexts = ContextCache(context_cache_size, tenseal_threads)
+        self.connections = set()
+        self.connections_lock = threading.Lock()
+        # Request handlers by operation code, see MatchingHandler
+        self.operations = {OP_CODECS: self.negotiate_codec, OP_REGISTER: self.register}
+        # Per handler thread: whether the current request's reply is already being streamed
+        self.streaming = threading.local()
+
+    def server_bind(self):
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def listen(self):
+        """
+        Binds and listens on a socket of this process's own with SO_REUSEPORT,
+        for a server created with bind_and_activate=False. Every worker of
+        serve_workers() calls it after the fork, and the kernel spreads the
+        incoming connections over their sockets.
+        """
+        self.socket.close()
+        self.socket = socket.socket(self.address_family, self.socket_type)
+        self.reuse_port = True
+        self.server_bind()
+        self.server_activate()
+
+    def track_connection(self, conn):
+        with self.connections_lock:
+            self.connections.add(conn)
+
+    def untrack_connection(self, conn):
+        with self.connections_lock:
+            self.connections.discard(conn)
+
+    def start_stream(self, conn):
+        """Sends STATUS_OK ahead of a reply streamed in parts; a failure after this drops the connection."""
+        self.streaming.started = True
+        send_large_data(conn, STATUS_OK)
+
+    def negotiate_codec(self, conn):
+        codec = choose_codec(receive_large_data(conn).decode().split(","))
+        send_large_data(conn, STATUS_OK)
+        send_large_data(conn, codec.name.encode() if codec else b"none")
+        set_codec(conn, codec)
+
+    def register(self, conn):
+        start = time.perf_counter()
+        ctx_bytes = receive_large_data(conn)
+        session_id = self.contexts.register(ctx_bytes)
+        send_large_data(conn, STATUS_OK)
+        send_large_data(conn, session_id.encode())
+        print(f"[{self.name}] registered session {session_id[:12]} "
+              f"({len(ctx_bytes)} bytes) in {time.perf_counter() - start:.6f}s")
+
+    def stop(self):
+        """
+        Stops accepting connections and lets every connection finish the
+        request it is working on. Must not be called from the serving thread.
+        """
+        self.shutdown()
+        with self.connections_lock:
+            for conn in self.connections:
+                # Wakes up handlers blocked waiting for the next request
+                try:
+                    conn.shutdown(socket.SHUT_RD)
+                except OSError:
+                    pass
+
+
+class MatchingServer(SessionServer):
+    """
+    Long-lived matching server: one thread per connection, many requests per
+    connection. Clients register their context once and then send
+    (session, ID, encrypted share) requests, see protocol.py.
+    """
+
+    def __init__(self, name, address, database_folder, context_cache_size=CONTEXT_CACHE_SIZE,
+                 template_cache_size=TEMPLATE_CACHE_SIZE, party=0, ring_database_folder=None,
+                 triples_folder=None, aggregator=None, tenseal_threads=None, bind_and_activate=True):
+        # Open the share store first so a bad --database fails before binding the port
+        self.store = open_store(database_folder)
+        super().__init__(name, address, MatchingHandler, context_cache_size, tenseal_threads, bind_and_activate)
+        self.templates = TemplateCache(self.store, template_cache_size)
+        # Enrolled template of every subject: the gallery for identification
+        self.enrolled = [(id, f"{id}d0") for id in self.store.subjects() if (id, f"{id}d0") in self.store]
+        self.block_dim, self.per_block = packing_layout(self.store.dim)
+        # MPC mode: share index (server 1 adds the public e**2 term), ring shares and Beaver triples
+        self.party = party
+        self.ring_store = open_store(ring_database_folder) if ring_database_folder else None
+        self.triples = TripleStore(triples_folder) if triples_folder else None
+        if self.ring_store and self.triples and self.ring_store.dtype != self.triples.dtype:
+            raise ValueError(f"{ring_database_folder} holds {self.ring_store.dtype.name} shares "
+                             f"but the triples in {triples_folder} are {self.triples.dtype.name}")
+        # VERIFY_FORWARD: (host, port) of the aggregator, one connection to it per handler thread
+        self.aggregator = aggregator
+        self.aggregator_connections = threading.local()
+        self.operations.update({
+            OP_VERIFY: self.verify,
+            OP_VERIFY_SEED: self.verify_seed,
+            OP_VERIFY_BATCH: self.verify_batch,
+            OP_VERIFY_FORWARD: self.verify_forward,
+            OP_IDENTIFY: self.identify,
+            OP_MPC_OPEN: self.mpc_open,
+            OP_MPC_OPEN_SEED: lambda conn: self.mpc_open(conn, seeded=True),
+            OP_MPC_FINISH: self.mpc_finish,
+        })
+
+    def check_enrolled(self, conn, id, store=None):
+        """Replies with an error and returns False when `id` has no enrolled template in `store` (the share store)."""
+        if (id, f"{id}d0") in (self.store if store is None else store):
+            return True
+        send_error(conn, f"ID {id} is not enrolled")
+        return False
+
+    def verify(self, conn):
+        server_proc_start = time.perf_counter()
+
+        session_id = receive_large_data(conn).decode()
+        id = receive_large_data(conn).decode()
+        share_bytes = receive_large_data(conn)
+
+        context = self.contexts.get(session_id)
+        if context is None:
+            send_large_data(conn, STATUS_UNKNOWN_SESSION)
+            return
+        if not self.check_enrolled(conn, id):
+            return
+        enc_p = ts.ckks_vector_from(context, bytes(share_bytes))
+
+        receive_time = time.perf_counter()
+
+        # Enc(t) - Enc(p) computed as t - Enc(p) with t already encoded
+        diff = self.templates.subtract_from(enc_p, id, f"{id}d0")
+
+        calculation_time = time.perf_counter()
+
+        send_large_data(conn, STATUS_OK)
+        send_large_data(conn, diff)
+        server_proc_end = time.perf_counter()
+        print(f"[{self.name}] ID={id} "
+              f"receiving time : {receive_time - server_proc_start:.6f}s, "
+              f"calculation time : {calculation_time - receive_time:.6f}s, "
+              f"send time : {server_proc_end - calculation_time:.6f}s, "
+              f"total processing time : {server_proc_end - server_proc_start:.6f}s")
+
+    def forward_to_aggregator(self, tag, diff):
+        """Hands `diff` to the aggregator over this thread's connection, reconnecting once if it dropped."""
+        for attempt in range(2):
+            sock = getattr(self.aggregator_connections, "sock", None)
+            try:
+                if sock is None:
+                    sock = self.aggregator_connections.sock = connect(self.aggregator)
+                send_frames(sock, [OP_AGG_PART, tag.encode(), str(self.party).encode(), diff])
+                status = receive_large_data(sock)
+                break
+            except (ConnectionError, OSError):
+                # A resent part replaces the first one, so retrying is safe
+                if sock is not None:
+                    sock.close()
+                self.aggregator_connections.sock = None
+                if attempt:
+                    raise
+        if status != STATUS_OK:
+            raise ConnectionError(f"aggregator error: {receive_large_data(sock).decode()}")
+
+    def verify_forward(self, conn):
+        """VERIFY with the diff sent to the aggregator under the client's tag instead of back to the client."""
+        server_proc_start = time.perf_counter()
+
+        session_id = receive_large_data(conn).decode()
+        id = receive_large_data(conn).decode()
+        share_bytes = receive_large_data(conn)
+        tag = receive_large_data(conn).decode()
+
+        context = self.contexts.get(session_id)
+        if context is None:
+            send_large_data(conn, STATUS_UNKNOWN_SESSION)
+            return
+        if self.aggregator is None:
+            send_error(conn, "this server has no aggregator, see --aggregator")
+            return
+        if not self.check_enrolled(conn, id):
+            return
+        enc_p = ts.ckks_vector_from(context, bytes(share_bytes))
+
+        receive_time = time.perf_counter()
+
+        diff = self.templates.subtract_from(enc_p, id, f"{id}d0")
+
+        calculation_time = time.perf_counter()
+
+        try:
+            self.forward_to_aggregator(tag, diff)
+        except (ConnectionError, OSError) as err:
+            send_error(conn, f"could not forward the diff: {err}")
+            return
+        send_large_data(conn, STATUS_OK)
+        server_proc_end = time.perf_counter()
+        print(f"[{self.name}] VERIFY_FORWARD ID={id} "
+              f"receiving time : {receive_time - server_proc_start:.6f}s, "
+              f"calculation time : {calculation_time - receive_time:.6f}s, "
+              f"forward time : {server_proc_end - calculation_time:.6f}s, "
+              f"total processing time : {server_proc_end - server_proc_start:.6f}s")
+
+    def verify_seed(self, conn):
+        server_proc_start = time.perf_counter()
+
+        session_id = receive_large_data(conn).decode()
+        id = receive_large_data(conn).decode()
+        payload = receive_large_data(conn)
+
+        context = self.contexts.get(session_id)
+        if context is None:
+            send_large_data(conn, STATUS_UNKNOWN_SESSION)
+            return
+        if not self.check_enrolled(conn, id):
+            return
+        try:
+            p_share = expand_payload(payload, self.store.dim)
+        except ValueError as err:
+            send_error(conn, str(err))
+            return
+
+        receive_time = time.perf_counter()
+
+        # The probe share was never encrypted, so encrypt the difference here, at the transport level
+        template = self.templates.load_template(id, f"{id}d0")
+        diff = encrypt_vector_bytes(context, template - p_share)
+
+        calculation_time = time.perf_counter()
+
+        send_large_data(conn, STATUS_OK)
+        send_large_data(conn, diff)
+        server_proc_end = time.perf_counter()
+        print(f"[{self.name}] VERIFY_SEED ID={id} "
+              f"expand time : {receive_time - server_proc_start:.6f}s, "
+              f"encryption time : {calculation_time - receive_time:.6f}s, "
+              f"send time : {server_proc_end - calculation_time:.6f}s, "
+              f"total processing time : {server_proc_end - server_proc_start:.6f}s")
+
+    def verify_batch(self, conn):
+        """VERIFY for N pairs under one session lookup, each result sent as soon as it is ready."""
+        server_proc_start = time.perf_counter()
+
+        session_id = receive_large_data(conn).decode()
+        ids = receive_large_data(conn).decode()
+        ids = ids.split("\n") if ids else []
+
+        context = self.contexts.get(session_id)
+        if context is None:
+            # Drain the shares so the connection stays in step
+            for _ in ids:
+                receive_large_data(conn)
+            send_large_data(conn, STATUS_UNKNOWN_SESSION)
+            return
+        self.start_stream(conn)
+
+        failed = 0
+        for index, id in enumerate(ids):
+            share_bytes = receive_large_data(conn)
+            key = (id, f"{id}d0")
+            if key not in self.store:
+                send_frames(conn, [BATCH_RESULT.pack(index, BATCH_FAILED), f"ID {id} is not enrolled".encode()])
+                failed += 1
+                continue
+            try:
+                enc_p = ts.ckks_vector_from(context, bytes(share_bytes))
+                diff = self.templates.subtract_from(enc_p, *key)
+            except Exception as err:
+                # The rest of the batch is still to be read, fail this pair only
+                send_frames(conn, [BATCH_RESULT.pack(index, BATCH_FAILED), f"pair {index}: {err!r}".encode()])
+                failed += 1
+                continue
+            send_frames(conn, [BATCH_RESULT.pack(index, BATCH_OK), diff])
+        server_proc_end = time.perf_counter()
+        print(f"[{self.name}] VERIFY_BATCH {len(ids)} pairs ({failed} failed) "
+              f"total processing time : {server_proc_end - server_proc_start:.6f}s, "
+              f"per pair : {(server_proc_end - server_proc_start) / max(len(ids), 1):.6f}s")
+
+    def identify(self, conn):
+        server_proc_start = time.perf_counter()
+
+        session_id = receive_large_data(conn).decode()
+        share_bytes = receive_large_data(conn)
+
+        context = self.contexts.get(session_id)
+        if context is None:
+            send_large_data(conn, STATUS_UNKNOWN_SESSION)
+            return
+        enc_p = ts.ckks_vector_from(context, bytes(share_bytes))
+        if enc_p.size() != self.block_dim * self.per_block:
+            send_error(conn, f"expected a probe replicated to {self.per_block} x {self.block_dim} "
+                             f"slots, got {enc_p.size()}")
+            return
+
+        receive_time = time.perf_counter()
+
+        self.start_stream(conn)
+        send_large_data(conn, "\n".join(id for id, _ in self.enrolled).encode())
+        blocks = 0
+        # Blocks go out as they are computed, the client scores while we work on the next
+        for diff in self.templates.subtract_gallery_from(enc_p, self.enrolled, self.block_dim, self.per_block):
+            send_large_data(conn, diff)
+            blocks += 1
+        server_proc_end = time.perf_counter()
+        print(f"[{self.name}] IDENTIFY {len(self.enrolled)} templates in {blocks} blocks "
+              f"receiving time : {receive_time - server_proc_start:.6f}s, "
+              f"calculation & send time : {server_proc_end - receive_time:.6f}s, "
+              f"total processing time : {server_proc_end - server_proc_start:.6f}s")
+
+    def mpc_unavailable(self):
+        """Why this server cannot serve MPC requests, None if it can."""
+        if self.ring_store is None:
+            return "this server has no ring share database, see database_splitter.py --dtype uint64"
+        if self.triples is None:
+            return "this server has no Beaver triples, see beaver.py"
+        return None
+
+    def mpc_open(self, conn, seeded=False):
+        """Round 1, on the probe share itself or (`seeded`) on a seed payload to expand it from."""
+        server_proc_start = time.perf_counter()
+
+        id = receive_large_data(conn).decode()
+        triple_id = receive_large_data(conn)
+        p_bytes = receive_large_data(conn)
+
+        receive_time = time.perf_counter()
+        error = self.mpc_unavailable()
+        if error:
+            send_error(conn, error)
+            return
+        if not self.check_enrolled(conn, id, self.ring_store):
+            return
+        triple_id = int(triple_id)
+        if seeded:
+            try:
+                p_share = expand_payload(p_bytes, self.ring_store.dim, self.ring_store.dtype)
+            except ValueError as err:
+                send_error(conn, str(err))
+                return
+        else:
+            p_share = np.frombuffer(p_bytes, dtype=self.ring_store.dtype)
+        if len(p_share) != self.ring_store.dim:
+            send_error(conn, f"expected {self.ring_store.dim} {self.ring_store.dtype.name} ring elements")
+            return
+        try:
+            a_share = self.triples.open(triple_id)
+        except TripleReuseError as err:
+            send_error(conn, str(err))
+            return
+        e_share = open_share(self.ring_store.get(id, f"{id}d0") - p_share, a_share)
+        calculation_time = time.perf_counter()
+
+        send_large_data(conn, STATUS_OK)
+        send_large_data(conn, e_share.tobytes())
+        server_proc_end = time.perf_counter()
+        print(f"[{self.name}] MPC_OPEN{'_SEED' if seeded else ''} ID={id} triple={triple_id} "
+              f"calculation time : {(calculation_time - receive_time) * 1e6:.1f}us, "
+              f"total processing time : {(server_proc_end - server_proc_start) * 1e6:.1f}us")
+
+    def mpc_finish(self, conn):
+        server_proc_start = time.perf_counter()
+
+        triple_id = receive_large_data(conn)
+        e_bytes = receive_large_data(conn)
+
+        receive_time = time.perf_counter()
+        error = self.mpc_unavailable()
+        if error:
+            send_error(conn, error)
+            return
+        triple_id = int(triple_id)
+        e = np.frombuffer(e_bytes, dtype=self.ring_store.dtype)
+        if len(e) != self.ring_store.dim:
+            send_error(conn, f"expected {self.ring_store.dim} {self.ring_store.dtype.name} ring elements")
+            return
+        try:
+            a_share, c_share = self.triples.finish(triple_id)
+        except TripleReuseError as err:
+            send_error(conn, str(err))
+            return
+        z_share = finish_share(e, a_share, c_share, self.party)
+        calculation_time = time.perf_counter()
+
+        send_large_data(conn, STATUS_OK)
+        send_large_data(conn, z_share)
+        server_proc_end = time.perf_counter()
+        print(f"[{self.name}] MPC_FINISH triple={triple_id} "
+              f"calculation time : {(calculation_time - receive_time) * 1e6:.1f}us, "
+              f"total processing time : {(server_proc_end - server_proc_start) * 1e6:.1f}us")
+
+    def warm_up(self):
+        """Encodes the enrolled templates (single and packed) for the default CKKS parameters."""
+        start = time.perf_counter()
+        context = create_ckks_context()
+        samples = self.enrolled[:self.templates.maxsize]
+        self.templates.warm_up(context, samples)
+        seal_context = context.seal_context().data
+        self.templates.gallery(seal_context, level_parms_id(seal_context), context.global_scale,
+                               self.enrolled, self.block_dim, self.per_block)
+        print(f"[{self.name}] encoded {len(samples)} templates and a gallery of {len(self.enrolled)} "
+              f"in {time.perf_counter() - start:.3f}s")
+
+
+def serve_until_stopped(server, once=False):
+    """Serves until SIGINT / SIGTERM (or a single connection with `once`), then stops gracefully."""
+    def request_stop(signum, frame):
+        threading.Thread(target=server.stop).start()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    try:
+        if once:
+            server.handle_request()
+        else:
+            server.serve_forever()
+    finally:
+        server.server_close()
+        print(f"{server.name} stopped")
+
+
+def serve_workers(server, workers):
+    """
+    Pre-fork model: runs `server` in `workers` forked processes, each with its
+    own SO_REUSEPORT socket (see SessionServer.listen) and threads. Whatever the
+    server loaded before the fork (the memory-mapped share store, templates
+    encoded by warm_up) is shared copy-on-write instead of loaded per worker.
+    SIGINT / SIGTERM are passed on to the workers, which stop gracefully.
+    """
+    name = server.name
+    pids = []
+    for worker in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                server.name = f"{name}/{worker}"
+                server.listen()
+                serve_until_stopped(server)
+                status = 0
+            finally:
+                # Never return into the parent's code
+                os._exit(status)
+        pids.append(pid)
+
+    def forward_signal(signum, frame):
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, forward_signal)
+    signal.signal(signal.SIGTERM, forward_signal)
+    for pid in pids:
+        _, status = os.waitpid(pid, 0)
+        if status:
+            print(f"{name}: worker {pid} exited with status {status}")
+    print(f"{name} stopped")
+
+
+def parse_address(value):
+    """HOST:PORT -> (host, port)"""
+    host, _, port = value.rpartition(":")
+    try:
+        return host or HOST, int(port)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected HOST:PORT, got {value}")
+
+
+def main(party=None):
+    parser = argparse.ArgumentParser(description="Matching server holding one party's shares")
+    parser.add_argument("--party", type=int, default=party, required=party is None,
+                        help="0-based index of this server's shares: server N is party N - 1")
+    parser.add_argument("--parties", type=int, default=2,
+                        help="number of servers the templates are shared among (see database_splitter.py)")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, help=f"default: {BASE_PORT} + party")
+    parser.add_argument("--database", help="template store directory (see template_store.py), "
+                                           "default: server<N>_database")
+    parser.add_argument("--ring-database",
+                        help="template store of ring shares for the MPC mode, skipped if missing, "
+                             "default: server<N>_ring_database")
+    parser.add_argument("--triples",
+                        help="Beaver triple shares for the MPC mode (see beaver.py), skipped if missing, "
+                             "default: server<N>_triples")
+    parser.add_argument("--context-cache-size", type=int, default=CONTEXT_CACHE_SIZE,
+                        help="number of client contexts kept deserialized")
+    parser.add_argument("--template-cache-size", type=int, default=TEMPLATE_CACHE_SIZE,
+                        help="number of templates kept encoded as CKKS plaintexts")
+    parser.add_argument("--no-warm-up", action="store_true",
+                        help="encode templates on first use instead of at startup")
+    parser.add_argument("--aggregator", type=parse_address, default=None, metavar="HOST:PORT",
+                        help="aggregator that VERIFY_FORWARD requests send their diffs to (see aggregator.py)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="pre-forked worker processes accepting on the port (SO_REUSEPORT)")
+    parser.add_argument("--tenseal-threads", type=int, default=None,
+                        help="TenSEAL threads per client context and worker (default: one per core)")
+    parser.add_argument("--once", action="store_true",
+                        help="serve a single connection and exit (the old one-shot behaviour)")
+    args = parser.parse_args()
+    if not 0 <= args.party < args.parties:
+        parser.error(f"--party must be between 0 and {args.parties - 1}")
+    if args.workers < 1 or (args.once and args.workers > 1):
+        parser.error("--workers must be at least 1, and 1 with --once")
+
+    name = f"Server{args.party + 1}"
+    port = args.port or BASE_PORT + args.party
+    database = args.database or f"server{args.party + 1}_database"
+    ring_database = args.ring_database or f"server{args.party + 1}_ring_database"
+    triples = args.triples or f"server{args.party + 1}_triples"
+    ring_database = ring_database if Path(ring_database, META_FILE).exists() else None
+    triples = triples if Path(triples, "used.npy").exists() else None
+    server = MatchingServer(name, (args.host, port), database, args.context_cache_size,
+                            args.template_cache_size, args.party, ring_database, triples, args.aggregator,
+                            args.tenseal_threads, bind_and_activate=args.workers == 1)
+    if server.mpc_unavailable():
+        print(f"{name}: {server.mpc_unavailable()}, MPC requests will be refused")
+    if not args.no_warm_up:
+        server.warm_up()
+
+    print(f"{name} (party {args.party} of {args.parties}) waiting on {args.host}:{port}"
+          f"{f' with {args.workers} workers' if args.workers > 1 else ''}...")
+    if args.workers > 1:
+        serve_workers(server, args.workers)
+    else:
+        serve_until_stopped(server, args.once)
+
+
+if __name__ == "__main__":
+    main()
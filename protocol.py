@@ -0,0 +1,96 @@
+"""
+Wire protocol between client.py, the matching servers and the aggregator.
+
+Every request starts with an operation frame, every reply with a status frame:
+
+    CODECS    codec names, preferred first           -> OK, chosen codec name or "none"
+    REGISTER  ctx bytes                              -> OK, session id
+    VERIFY    session id, biometric id, enc share    -> OK, encrypted diff
+                                                     -> UNKNOWN_SESSION
+    VERIFY_SEED  session id, biometric id, seed      -> OK, encrypted diff
+                                                     -> UNKNOWN_SESSION
+    VERIFY_BATCH  session id, biometric ids,         -> OK, N x (result tag, encrypted
+                  N enc shares                             diff or error message)
+                                                     -> UNKNOWN_SESSION
+    VERIFY_FORWARD  session id, biometric id,        -> OK (diff sent to the aggregator)
+                    enc share, tag                   -> UNKNOWN_SESSION
+    IDENTIFY  session id, enc replicated share       -> OK, gallery ids, one frame per
+                                                        packed block of diffs
+                                                     -> UNKNOWN_SESSION
+
+    MPC_OPEN    biometric id, triple id, probe share   -> OK, share of e = d - a
+    MPC_OPEN_SEED  biometric id, triple id, seed       -> OK, share of e = d - a
+    MPC_FINISH  triple id, opened e                    -> OK, share of the squared distance
+
+Aggregator (aggregator.py), which takes CODECS and REGISTER as well:
+
+    AGG_PART    tag, party, encrypted diff             -> OK
+    AGG_RESULT  session id, tag                        -> OK, encrypted squared distance
+                                                       -> UNKNOWN_SESSION
+
+MPC shares and results are raw ring arrays in the dtype of the servers' ring
+stores, see beaver.py for the two rounds. Any request can also be answered
+with ERROR and a message frame.
+
+The *_SEED variants carry a 40-byte seed_payload() (seed and counter, see
+secret_sharing.py) instead of the probe share: the server expands the share
+itself and, for VERIFY_SEED, encrypts its difference under the session's
+public key.
+
+Gallery ids and batch ids are newline-separated subject IDs, see
+identification.py for the packing of the gallery.
+
+VERIFY_BATCH carries N (id, share) pairs: one frame with the N ids, then one
+frame per share. The server answers every pair as soon as it is computed, so
+a client must keep reading results while it uploads the batch. A result tag
+(BATCH_RESULT) holds the index of the pair and whether it succeeded; a pair
+whose ID is not enrolled fails alone without ending the batch.
+
+With an aggregator the client never sees the diffs: it registers a context
+with the relin and Galois keys for the square & sum at the aggregator, sends
+both servers VERIFY_FORWARD with the same random tag, and once both answered
+OK (each server only does after its AGG_PART was accepted) asks the aggregator
+for AGG_RESULT under that tag. The aggregator adds the parties' diffs, squares
+and sums them and returns one ciphertext; parts nobody collects expire.
+
+CODECS names are comma-separated (see transport.CODECS). Once the reply is
+sent (server) or received (client), either side compresses the frames it
+sends on this connection with the chosen codec.
+
+The session id is the SHA-256 of the serialized context, so a client that
+registers the same context twice (or two clients sharing one) reuse the same
+deserialized context on the server. Servers only keep a bounded number of
+contexts; UNKNOWN_SESSION tells the client to register again.
+"""
+import hashlib
+import struct
+
+OP_CODECS = b"CODECS"
+OP_REGISTER = b"REGISTER"
+OP_VERIFY = b"VERIFY"
+OP_VERIFY_SEED = b"VERIFY_SEED"
+OP_VERIFY_BATCH = b"VERIFY_BATCH"
+OP_VERIFY_FORWARD = b"VERIFY_FORWARD"
+OP_IDENTIFY = b"IDENTIFY"
+OP_MPC_OPEN = b"MPC_OPEN"
+OP_MPC_OPEN_SEED = b"MPC_OPEN_SEED"
+OP_MPC_FINISH = b"MPC_FINISH"
+OP_AGG_PART = b"AGG_PART"
+OP_AGG_RESULT = b"AGG_RESULT"
+
+STATUS_OK = b"OK"
+STATUS_UNKNOWN_SESSION = b"UNKNOWN_SESSION"
+STATUS_ERROR = b"ERROR"
+
+# Index of the pair in the batch, then BATCH_OK or BATCH_FAILED
+BATCH_RESULT = struct.Struct("!IB")
+BATCH_OK = 0
+BATCH_FAILED = 1
+
+
+class UnknownSessionError(Exception):
+    """The server no longer (or never did) hold the context for this session."""
+
+
+def context_digest(ctx_bytes):
+    return hashlib.sha256(ctx_bytes).hexdigest()
@@ -0,0 +1,235 @@
+"""
+Binary score files of a biometric system, in place of the gzip text files
+(<system>_mated.txt.gz / <system>_nonmated.txt.gz, still available as an
+export):
+
+    <system>_scores.json          metadata: system name, score type, counts,
+                                  whether pairs are recorded, run parameters
+    <system>_mated.npy            float32 scores, one row per comparison
+    <system>_nonmated.npy         (np.load(..., mmap_mode="r") maps them)
+    <system>_mated_pairs.npy      int32 (count x 2): template row, probe row
+    <system>_nonmated_pairs.npy   of every comparison, into the sample list
+    <system>_samples.tsv          one "subject<TAB>sample" line per row
+
+The .npy files are written as a stream: a fixed-size header whose row
+count is rewritten on every flush, then the rows appended. A file cut off
+by an interruption still loads with the rows of its last flush, and a
+writer can resume it at a row count (see comparison_performance.py).
+
+In a notebook:
+
+    from score_io import load_scores
+    mated_scores, nonmated_scores = load_scores("iris_non-encrypted")
+
+Conversions:
+
+    python score_io.py export iris_non-encrypted      # -> .txt.gz
+    python score_io.py import comparison_scores/CKKS01  # .txt.gz ->
+    python score_io.py info iris_non-encrypted
+"""
+import argparse
+import json
+import os
+import struct
+import numpy as np
+
+SCORE_DTYPE = np.dtype(np.float32)
+PAIR_DTYPE = np.dtype(np.int32)
+DISSIMILARITY = "dissimilarity"
+SIMILARITY = "similarity"
+# Bytes of a streamed .npy header (magic, version, length, padded dict), a multiple of 64
+HEADER_SIZE = 128
+TEXT_FORMAT = "%.8f"
+
+
+def score_paths(system_name):
+    return {
+        "metadata": f"{system_name}_scores.json",
+        "mated": f"{system_name}_mated.npy",
+        "nonmated": f"{system_name}_nonmated.npy",
+        "mated_pairs": f"{system_name}_mated_pairs.npy",
+        "nonmated_pairs": f"{system_name}_nonmated_pairs.npy",
+        "samples": f"{system_name}_samples.tsv",
+        "mated_text": f"{system_name}_mated.txt.gz",
+        "nonmated_text": f"{system_name}_nonmated.txt.gz",
+    }
+
+
+def npy_header(dtype, shape):
+    """Version 1.0 .npy header of exactly HEADER_SIZE bytes."""
+    header = repr({"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": shape})
+    header = header.ljust(HEADER_SIZE - 10 - 1) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+
+class NpyAppender:
+    """
+    A .npy file of rows (scalars, or `width` columns) appended in chunks.
+    `rows` resumes an existing file at that many rows, cutting off the rest.
+    """
+
+    def __init__(self, path, dtype, width=None, rows=None):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.width = width
+        self.row_bytes = self.dtype.itemsize * (width or 1)
+        if rows is None:
+            self.file = open(path, "w+b")
+            self.rows = 0
+            self.file.write(npy_header(self.dtype, self.shape))
+        else:
+            size = HEADER_SIZE + rows * self.row_bytes
+            if os.path.getsize(path) < size:
+                raise ValueError(f"{path} holds fewer than {rows} rows")
+            self.file = open(path, "r+b")
+            self.file.truncate(size)
+            self.file.seek(size)
+            self.rows = rows
+        self.flush()
+
+    @property
+    def shape(self):
+        return (self.rows,) if self.width is None else (self.rows, self.width)
+
+    def append(self, values):
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        if self.width is not None:
+            values = values.reshape(-1, self.width)
+        self.file.write(values.data)
+        self.rows += len(values)
+
+    def flush(self):
+        """Writes the row count into the header, the file then loads with every row appended so far."""
+        end = self.file.tell()
+        self.file.seek(0)
+        self.file.write(npy_header(self.dtype, self.shape))
+        self.file.seek(end)
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class ScoreFileWriter:
+    """
+    Streams the mated and non-mated scores of a system to its binary score
+    files. With `samples` ((subject, sample) keys) the (template row, probe
+    row) pair of every score is recorded as well. `counts` (mated,
+    non-mated) resumes the files of an earlier writer at those counts.
+    """
+
+    def __init__(self, system_name, score_type=DISSIMILARITY, samples=None, params=None, counts=None):
+        self.system_name = system_name
+        self.score_type = score_type
+        self.params = params
+        self.paths = score_paths(system_name)
+        counts = counts or (None, None)
+        self.scores = [
+            NpyAppender(self.paths[kind], SCORE_DTYPE, rows=count) for kind, count in zip(("mated", "nonmated"), counts)
+        ]
+        self.pairs = None
+        if samples is not None:
+            self.pairs = [
+                NpyAppender(self.paths[f"{kind}_pairs"], PAIR_DTYPE, 2, rows=count)
+                for kind, count in zip(("mated", "nonmated"), counts)
+            ]
+            if counts[0] is None:
+                with open(self.paths["samples"], "w") as f:
+                    f.writelines(f"{subject}\t{sample}\n" for subject, sample in samples)
+        self.write_metadata()
+
+    @property
+    def counts(self):
+        return self.scores[0].rows, self.scores[1].rows
+
+    def append(self, mated, nonmated, mated_pairs=None, nonmated_pairs=None):
+        self.scores[0].append(mated)
+        self.scores[1].append(nonmated)
+        if self.pairs is not None:
+            self.pairs[0].append(mated_pairs)
+            self.pairs[1].append(nonmated_pairs)
+
+    def flush(self):
+        for appender in self.scores + (self.pairs or []):
+            appender.flush()
+
+    def write_metadata(self):
+        path = self.paths["metadata"]
+        with open(path + ".tmp", "w") as f:
+            json.dump({"system": self.system_name, "score_type": self.score_type, "dtype": SCORE_DTYPE.name,
+                       "mated": self.counts[0], "nonmated": self.counts[1], "pairs": self.pairs is not None,
+                       "params": self.params}, f, indent=1)
+        os.replace(path + ".tmp", path)
+
+    def close(self):
+        for appender in self.scores + (self.pairs or []):
+            appender.close()
+        self.write_metadata()
+
+
+def load_metadata(system_name):
+    with open(score_paths(system_name)["metadata"]) as f:
+        return json.load(f)
+
+
+def load_scores(system_name, mmap=True):
+    """
+    (mated, non-mated) scores of `system_name`: the binary files,
+    memory-mapped read-only unless `mmap` is False, or the .txt.gz files of
+    systems that have no binary ones.
+    """
+    paths = score_paths(system_name)
+    if not os.path.exists(paths["metadata"]):
+        return np.loadtxt(paths["mated_text"]), np.loadtxt(paths["nonmated_text"])
+    mmap_mode = "r" if mmap else None
+    return np.load(paths["mated"], mmap_mode=mmap_mode), np.load(paths["nonmated"], mmap_mode=mmap_mode)
+
+
+def load_pairs(system_name):
+    """(mated pairs, non-mated pairs, sample keys): rows of the keys per score, None if not recorded."""
+    paths = score_paths(system_name)
+    if not load_metadata(system_name)["pairs"]:
+        return None
+    with open(paths["samples"]) as f:
+        samples = [tuple(line.rstrip("\n").split("\t")) for line in f]
+    return np.load(paths["mated_pairs"], mmap_mode="r"), np.load(paths["nonmated_pairs"], mmap_mode="r"), samples
+
+
+def export_text(system_name, fmt=TEXT_FORMAT):
+    """Writes the scores of `system_name` as <system>_mated.txt.gz / _nonmated.txt.gz, returns their paths."""
+    paths = score_paths(system_name)
+    for kind, scores in zip(("mated", "nonmated"), load_scores(system_name)):
+        np.savetxt(paths[f"{kind}_text"], scores, fmt=fmt)
+    return paths["mated_text"], paths["nonmated_text"]
+
+
+def import_text(system_name, score_type=DISSIMILARITY):
+    """Binary score files from the .txt.gz files of `system_name` (no pairs)."""
+    paths = score_paths(system_name)
+    writer = ScoreFileWriter(system_name, score_type)
+    writer.append(np.loadtxt(paths["mated_text"]), np.loadtxt(paths["nonmated_text"]))
+    writer.close()
+    return writer.counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert between binary and text score files")
+    parser.add_argument("command", choices=["export", "import", "info"])
+    parser.add_argument("system_name", help="path prefix of the score files, e.g. comparison_scores/CKKS01")
+    parser.add_argument("--score-type", choices=[DISSIMILARITY, SIMILARITY], default=DISSIMILARITY,
+                        help="recorded by import")
+    parser.add_argument("--fmt", default=TEXT_FORMAT, help="number format of export")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        print(f"Wrote {', '.join(export_text(args.system_name, args.fmt))}")
+    elif args.command == "import":
+        mated, nonmated = import_text(args.system_name, args.score_type)
+        print(f"Converted {mated} mated and {nonmated} non-mated scores of {args.system_name}")
+    else:
+        print(json.dumps(load_metadata(args.system_name), indent=1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Additive secret sharing of templates and probes.
+
+Two flavours, both drawing masks from a numpy Generator:
+
+    real shares   s1 = x - r, s2 = r with r uniform in [0, 1). Needed by the
+                  CKKS path, which can only add and subtract real numbers.
+    ring shares   x is quantized to fixed point (FRAC_BITS fractional bits,
+                  two's complement) in the ring Z_2^64 (uint64) or Z_2^32
+                  (uint32), s2 = r is a uniform ring element taken from the
+                  generator's raw bit stream and s1 = x - r wraps around.
+                  Reconstruction is exact, r hides x perfectly and servers
+                  can compute on shares with plain integer arithmetic (see
+                  beaver.py).
+
+Both split into any number of parties (N-of-N): s2..sN are independent
+masks and s1 is the secret minus all of them, so any N - 1 shares reveal
+nothing.
+
+Products of two fixed-point values carry twice the fractional bits, decode
+them with decode_fixed(value, 2 * frac_bits). With uint32 rings and 8
+fractional bits a squared distance has to stay below 2^15.
+
+The random shares never have to be stored or sent in full: each can be
+expanded on demand from a 32-byte seed and a nonce (a query counter or the
+sample key) with Philox, a counter-mode PRG, keyed by BLAKE2b(seed, nonce).
+"""
+import hashlib
+import os
+import numpy as np
+
+RING_DTYPES = ("uint64", "uint32")
+# Fractional bits per ring: the square of a value must still fit in the ring
+FRAC_BITS = {"uint64": 20, "uint32": 8}
+
+_SIGNED = {"uint64": np.int64, "uint32": np.int32}
+
+SEED_BYTES = 32
+COUNTER_BYTES = 8
+
+
+def split_into_shares(secret_vector, rng=None, parties=2):
+    """
+    Real-valued shares (s1, ..., sN) of `parties` parties summing to
+    secret_vector up to rounding: s2..sN are the masks, s1 the remainder.
+    """
+    rng = rng or np.random.default_rng()
+    masks = [rng.random(np.shape(secret_vector)) for _ in range(parties - 1)]
+    return (secret_vector - sum(masks), *masks)
+
+
+def frac_bits_for(dtype):
+    return FRAC_BITS[np.dtype(dtype).name]
+
+
+def encode_fixed(values, dtype=np.uint64, frac_bits=None):
+    """Quantizes real values to two's complement fixed point in the ring of `dtype`."""
+    dtype = np.dtype(dtype)
+    if frac_bits is None:
+        frac_bits = frac_bits_for(dtype)
+    signed = _SIGNED[dtype.name]
+    scaled = np.rint(np.asarray(values, dtype=np.float64) * (1 << frac_bits))
+    limit = np.iinfo(signed)
+    if scaled.size and (scaled.min() < limit.min or scaled.max() > limit.max):
+        raise ValueError(f"Values do not fit in {dtype.name} with {frac_bits} fractional bits")
+    return scaled.astype(signed).view(dtype)
+
+
+def decode_fixed(ring_values, frac_bits=None):
+    """Real values of ring elements (interpreted as two's complement)."""
+    ring_values = np.asarray(ring_values)
+    if frac_bits is None:
+        frac_bits = frac_bits_for(ring_values.dtype)
+    return ring_values.view(_SIGNED[ring_values.dtype.name]) / float(1 << frac_bits)
+
+
+def random_ring_elements(shape, dtype=np.uint64, rng=None):
+    """Uniform ring elements straight from the generator's 64-bit output."""
+    rng = rng or np.random.default_rng()
+    dtype = np.dtype(dtype)
+    count = int(np.prod(shape))
+    words = -(-count * dtype.itemsize // 8)
+    return rng.bit_generator.random_raw(words).view(dtype)[:count].reshape(shape)
+
+
+def split_into_ring_shares(secret_vector, dtype=np.uint64, rng=None, frac_bits=None, parties=2):
+    """Ring shares (s1, ..., sN) summing to encode_fixed(secret_vector) exactly."""
+    x = encode_fixed(secret_vector, dtype, frac_bits)
+    masks = [random_ring_elements(x.shape, dtype, rng) for _ in range(parties - 1)]
+    for mask in masks:
+        x = x - mask
+    return (x, *masks)
+
+
+def reconstruct(s1, s2, frac_bits=None):
+    """The real values behind two ring shares."""
+    return decode_fixed(s1 + s2, frac_bits)
+
+
+def new_seed():
+    return os.urandom(SEED_BYTES)
+
+
+def counter_nonce(counter):
+    return counter.to_bytes(COUNTER_BYTES, "big")
+
+
+def sample_nonce(subject, sample):
+    return f"{subject}\t{sample}".encode()
+
+
+def seeded_generator(seed, nonce):
+    """Philox generator keyed by (seed, nonce); distinct nonces give independent streams."""
+    key = hashlib.blake2b(nonce, key=seed, digest_size=16).digest()
+    return np.random.Generator(np.random.Philox(key=int.from_bytes(key, "little")))
+
+
+def expand_share(seed, nonce, shape, dtype=np.float64):
+    """The random share s2 for (seed, nonce): ring elements or reals in [0, 1)."""
+    rng = seeded_generator(seed, nonce)
+    if np.dtype(dtype).name in RING_DTYPES:
+        return random_ring_elements(shape, dtype, rng)
+    return rng.random(shape).astype(dtype)
+
+
+def seed_payload(seed, counter):
+    """What a party gets instead of its share: the seed and the counter to expand it with."""
+    return seed + counter_nonce(counter)
+
+
+def expand_payload(payload, shape, dtype=np.float64):
+    """The share a seed_payload() stands for."""
+    if len(payload) != SEED_BYTES + COUNTER_BYTES:
+        raise ValueError(f"expected a {SEED_BYTES}-byte seed and a {COUNTER_BYTES}-byte counter, "
+                         f"got {len(payload)} bytes")
+    payload = bytes(payload)
+    return expand_share(payload[:SEED_BYTES], payload[SEED_BYTES:], shape, dtype)
+
+
+def split_with_seed(secret_vector, seed, nonce, dtype=np.float64):
+    """
+    The explicit share s1 for a random share s2 = expand_share(seed, nonce),
+    so that whoever holds the seed holds the other share.
+    """
+    return split_with_seeds(secret_vector, [seed], nonce, dtype)
+
+
+def split_with_seeds(secret_vector, seeds, nonce, dtype=np.float64):
+    """split_with_seed() for N parties: one seed (and expanded share) per party but the first."""
+    if np.dtype(dtype).name in RING_DTYPES:
+        s1 = encode_fixed(secret_vector, dtype)
+    else:
+        s1 = np.asarray(secret_vector, dtype=np.float64)
+    for seed in seeds:
+        s1 = s1 - expand_share(seed, nonce, np.shape(secret_vector), dtype)
+    return s1.astype(dtype)
@@ -1,19 +1,15 @@
 import numpy as np
 
-
-def split_into_shares(secret_vector):
-    """ Splits a fingerprint template into two secret shares. """
-    s2 = np.random.rand(*secret_vector.shape)  # Use random float values
-    s1 = secret_vector - s2  # Ensure sum of shares reconstructs original
-    return s1, s2
+from secret_sharing import split_into_shares
+from template_store import open_store
 
 
 probe = np.load("IrisFingerprintDatabases/FingerprintDatabase/3567/3567d11.npy")
 
 p1, p2 = split_into_shares(probe)
 
-t1 = np.load("server1_database/3567/3567d1.npy")
-t2 = np.load("server2_database/3567/3567d1.npy")
+t1 = open_store("server1_database").get("3567", "3567d1")
+t2 = open_store("server2_database").get("3567", "3567d1")
 f = np.sum(t1 + t2)
 
 s1_diff = t1 - p1
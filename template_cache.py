@@ -0,0 +1,124 @@
+"""
+Server-side cache of template shares encoded as CKKS plaintexts.
+
+Encrypting a template share costs several times more than encoding it, and
+the difference the servers return only needs ciphertext - plaintext, so the
+servers keep templates encoded and compute Enc(t - p) as -(Enc(p) - t).
+Encoding only depends on the encryption parameters and scale, never on the
+client's keys, so one cached plaintext serves every session using the same
+parameters.
+
+Probes are mod-switched down to the transport level first (see
+ckks_utils.TRANSPORT_DEPTH), so templates are encoded, and diffs sent back,
+with only the primes the client still needs.
+"""
+import threading
+from collections import OrderedDict
+from tenseal import sealapi
+
+from ckks_utils import ckks_vector_bytes, level_parms_id, mod_switch_down
+from identification import pack_blocks
+
+TEMPLATE_CACHE_SIZE = 1024  # ~200 KB per plaintext with the default parameters
+
+
+class TemplateCache:
+    """LRU of encoded template shares keyed by (parms id, scale, subject, sample)."""
+
+    def __init__(self, store, maxsize=TEMPLATE_CACHE_SIZE):
+        self.store = store
+        self.maxsize = maxsize
+        self.plaintexts = OrderedDict()
+        # Encoder and evaluator per parameter set, created from the first context using it
+        self.tools = {}
+        # Packed gallery blocks per (parms id, scale, block layout), see identification.py
+        self.galleries = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load_template(self, subject, sample):
+        return self.store.get(subject, sample)
+
+    def _tools(self, seal_context, parms_id):
+        with self.lock:
+            tools = self.tools.get(parms_id)
+        if tools is None:
+            tools = (sealapi.CKKSEncoder(seal_context), sealapi.Evaluator(seal_context))
+            with self.lock:
+                tools = self.tools.setdefault(parms_id, tools)
+        return tools
+
+    def get(self, seal_context, parms_id, scale, subject, sample):
+        """Plaintext of the template share, encoded at `parms_id` and `scale`."""
+        parms_id = tuple(parms_id)
+        key = (parms_id, scale, subject, sample)
+        with self.lock:
+            plain = self.plaintexts.get(key)
+            if plain is not None:
+                self.plaintexts.move_to_end(key)
+                self.hits += 1
+                return plain
+            self.misses += 1
+
+        encoder, _ = self._tools(seal_context, parms_id)
+        plain = sealapi.Plaintext()
+        encoder.encode(self.load_template(subject, sample).tolist(), list(parms_id), scale, plain)
+        with self.lock:
+            self.plaintexts[key] = plain
+            while len(self.plaintexts) > self.maxsize:
+                self.plaintexts.popitem(last=False)
+        return plain
+
+    def gallery(self, seal_context, parms_id, scale, samples, block_dim, per_block):
+        """Plaintexts of `samples` packed `per_block` to a slot vector, encoded once per layout."""
+        parms_id = tuple(parms_id)
+        key = (parms_id, scale, block_dim, per_block)
+        with self.lock:
+            plains = self.galleries.get(key)
+        if plains is not None:
+            return plains
+
+        encoder, _ = self._tools(seal_context, parms_id)
+        plains = []
+        for block in pack_blocks(self.store.get_many(samples), block_dim, per_block):
+            plain = sealapi.Plaintext()
+            encoder.encode(block.tolist(), list(parms_id), scale, plain)
+            plains.append(plain)
+        with self.lock:
+            return self.galleries.setdefault(key, plains)
+
+    def subtract_gallery_from(self, enc_vector, samples, block_dim, per_block):
+        """Yields serialized Enc(block - p) for every packed block of `samples`."""
+        (probe,) = enc_vector.ciphertext()
+        seal_context = enc_vector.context().seal_context().data
+        _, evaluator = self._tools(seal_context, tuple(probe.parms_id()))
+        mod_switch_down(evaluator, probe, seal_context)
+        parms_id = tuple(probe.parms_id())
+        plains = self.gallery(seal_context, parms_id, probe.scale, samples, block_dim, per_block)
+
+        diff = sealapi.Ciphertext()
+        for plain in plains:
+            evaluator.sub_plain(probe, plain, diff)
+            evaluator.negate_inplace(diff)
+            yield ckks_vector_bytes(diff, enc_vector.size())
+
+    def subtract_from(self, enc_vector, subject, sample):
+        """Serialized Enc(template - p) for the encrypted probe share `enc_vector`."""
+        (ciphertext,) = enc_vector.ciphertext()
+        seal_context = enc_vector.context().seal_context().data
+        _, evaluator = self._tools(seal_context, tuple(ciphertext.parms_id()))
+        mod_switch_down(evaluator, ciphertext, seal_context)
+        parms_id = tuple(ciphertext.parms_id())
+        plain = self.get(seal_context, parms_id, ciphertext.scale, subject, sample)
+
+        evaluator.sub_plain_inplace(ciphertext, plain)
+        evaluator.negate_inplace(ciphertext)
+        return ckks_vector_bytes(ciphertext, enc_vector.size())
+
+    def warm_up(self, context, samples):
+        """Encodes (subject, sample) pairs at the transport level of `context`'s parameters."""
+        seal_context = context.seal_context().data
+        parms_id = level_parms_id(seal_context)
+        for subject, sample in samples:
+            self.get(seal_context, parms_id, context.global_scale, subject, sample)
@@ -0,0 +1,240 @@
+"""
+Packed template share store: one contiguous share matrix per server.
+
+    <store>/meta.json    {"dtype": "float64", "dim": 256, "rows": 1234, "frac_bits": null}
+    <store>/shares.bin   rows x dim matrix, row-major, no header (memory-mapped)
+    <store>/index.tsv    one "subject<TAB>sample" line per row, in row order
+
+Sample names are the old file names without ".npy" (e.g. "3567d0").
+Stores of ring shares (uint64 / uint32, see secret_sharing.py) record the
+fixed-point fractional bits in "frac_bits", real-valued stores leave it null.
+meta.json is written last on every append, so whatever lies beyond its row
+count in shares.bin / index.tsv (an interrupted append) is ignored and cut
+off before the next append.
+
+A seeded store ("seeded": true) holds the random share of every sample as a
+32-byte seed instead: <store>/seed.bin, with shares.bin left empty. A row is
+expanded on demand with secret_sharing.expand_share(seed, sample_nonce(...)),
+the other server's store holds the explicit remainder (see the --seeded
+option of database_splitter.py).
+
+To convert an existing per-subject .npy tree:
+    python template_store.py server1_database server1_database.store
+"""
+import argparse
+import json
+import os
+from pathlib import Path
+import numpy as np
+
+from secret_sharing import expand_share, sample_nonce
+
+META_FILE = "meta.json"
+SHARES_FILE = "shares.bin"
+INDEX_FILE = "index.tsv"
+SEED_FILE = "seed.bin"
+
+
+class TemplateStore:
+    """Read access to a packed store plus an append path for the splitter."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        meta_path = self.path / META_FILE
+        if not meta_path.exists():
+            raise FileNotFoundError(
+                f"{self.path} is not a template store (no {META_FILE}); convert a "
+                f".npy directory tree with: python template_store.py {self.path} <store>"
+            )
+        with open(meta_path) as f:
+            meta = json.load(f)
+        self.dtype = np.dtype(meta["dtype"])
+        self.dim = meta["dim"]
+        self.rows = meta["rows"]
+        self.frac_bits = meta.get("frac_bits")
+        self.seed = (self.path / SEED_FILE).read_bytes() if meta.get("seeded") else None
+
+        self.keys = []
+        # Bytes of index.tsv that belong to the first `rows` lines
+        self._index_size = 0
+        with open(self.path / INDEX_FILE, "rb") as f:
+            for line in f:
+                if len(self.keys) == self.rows:
+                    break
+                subject, sample = line.decode().rstrip("\n").split("\t")
+                self.keys.append((subject, sample))
+                self._index_size += len(line)
+        self.index = {key: row for row, key in enumerate(self.keys)}
+        self._shares = None
+
+    @classmethod
+    def create(cls, path, dim, dtype=np.float64, frac_bits=None, seed=None):
+        """
+        Creates an empty store at `path`, replacing any store already there.
+        With a `seed` the store is seeded and holds no share rows.
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        open(path / SHARES_FILE, "wb").close()
+        open(path / INDEX_FILE, "w").close()
+        if seed is not None:
+            (path / SEED_FILE).write_bytes(seed)
+        elif (path / SEED_FILE).exists():
+            os.remove(path / SEED_FILE)
+        cls._write_meta(path, np.dtype(dtype), dim, 0, frac_bits, seed is not None)
+        return cls(path)
+
+    @staticmethod
+    def _write_meta(path, dtype, dim, rows, frac_bits, seeded):
+        tmp = path / (META_FILE + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"dtype": dtype.name, "dim": dim, "rows": rows, "frac_bits": frac_bits,
+                       "seeded": seeded}, f)
+        os.replace(tmp, path / META_FILE)
+
+    def _update_meta(self):
+        self._write_meta(self.path, self.dtype, self.dim, self.rows, self.frac_bits, self.is_seeded)
+
+    @property
+    def is_ring(self):
+        return self.frac_bits is not None
+
+    @property
+    def is_seeded(self):
+        return self.seed is not None
+
+    @property
+    def shares(self):
+        """
+        The whole rows x dim share matrix, memory-mapped read-only (expanded
+        into memory for a seeded store, prefer get_many there).
+        """
+        if self._shares is None:
+            if self.is_seeded:
+                self._shares = self.get_many(self.keys)
+            elif self.rows == 0:
+                self._shares = np.empty((0, self.dim), dtype=self.dtype)
+            else:
+                self._shares = np.memmap(self.path / SHARES_FILE, dtype=self.dtype,
+                                         mode="r", shape=(self.rows, self.dim))
+        return self._shares
+
+    @property
+    def row_bytes(self):
+        """Bytes of one row in shares.bin (0 for a seeded store)."""
+        return 0 if self.is_seeded else self.dim * self.dtype.itemsize
+
+    def __len__(self):
+        return self.rows
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def row(self, subject, sample):
+        return self.index[(subject, sample)]
+
+    def get(self, subject, sample):
+        """Share vector of one sample (a view into the memory map, or expanded from the seed)."""
+        if self.is_seeded:
+            if (subject, sample) not in self.index:
+                raise KeyError((subject, sample))
+            return expand_share(self.seed, sample_nonce(subject, sample), self.dim, self.dtype)
+        return self.shares[self.index[(subject, sample)]]
+
+    def get_many(self, keys):
+        """len(keys) x dim matrix of the share vectors of (subject, sample) keys."""
+        if self.is_seeded:
+            out = np.empty((len(keys), self.dim), dtype=self.dtype)
+            for i, (subject, sample) in enumerate(keys):
+                out[i] = self.get(subject, sample)
+            return out
+        return self.shares[[self.index[key] for key in keys]]
+
+    def subjects(self):
+        """Subject IDs in the order they were appended."""
+        return list(dict.fromkeys(subject for subject, _ in self.keys))
+
+    def samples(self, subject):
+        return [sample for s, sample in self.keys if s == subject]
+
+    def append(self, keys, shares=None):
+        """
+        Appends (subject, sample) keys and the matching rows of `shares`
+        (None for a seeded store, whose rows follow from the keys).
+        """
+        if self.is_seeded:
+            # Only index.tsv grows, an interrupted append leaves lines beyond the row count
+            if os.path.getsize(self.path / INDEX_FILE) != self._index_size:
+                self._truncate_files(self.rows)
+        else:
+            shares = np.ascontiguousarray(shares, dtype=self.dtype).reshape(len(keys), self.dim)
+            # shares.bin is written first, so it outgrows meta.json whenever an append was interrupted
+            if os.path.getsize(self.path / SHARES_FILE) != self.rows * self.row_bytes:
+                self._truncate_files(self.rows)
+            with open(self.path / SHARES_FILE, "ab") as f:
+                f.write(shares.tobytes())
+        lines = "".join(f"{subject}\t{sample}\n" for subject, sample in keys).encode()
+        with open(self.path / INDEX_FILE, "ab") as f:
+            f.write(lines)
+        self._index_size += len(lines)
+        for key in keys:
+            self.index[key] = len(self.keys)
+            self.keys.append(key)
+        self.rows += len(keys)
+        self._update_meta()
+        self._shares = None
+
+    def truncate(self, rows):
+        """Drops every row from `rows` on."""
+        for key in self.keys[rows:]:
+            del self.index[key]
+        del self.keys[rows:]
+        self.rows = min(self.rows, rows)
+        self._update_meta()
+        self._truncate_files(self.rows)
+        self._shares = None
+
+    def _truncate_files(self, rows):
+        with open(self.path / SHARES_FILE, "r+b") as f:
+            f.truncate(rows * self.row_bytes)
+        with open(self.path / INDEX_FILE, "r+b") as f:
+            for _ in range(rows):
+                f.readline()
+            f.truncate(f.tell())
+            self._index_size = f.tell()
+
+    @classmethod
+    def from_directory(cls, tree, path, dtype=np.float64):
+        """Packs a <subject>/<sample>.npy tree into a new store at `path`."""
+        store = None
+        for subject_folder in sorted(p for p in Path(tree).iterdir() if p.is_dir()):
+            files = sorted(subject_folder.glob("*.npy"))
+            if not files:
+                continue
+            shares = np.stack([np.load(f) for f in files])
+            if store is None:
+                store = cls.create(path, shares.shape[1], dtype)
+            store.append([(subject_folder.name, f.stem) for f in files], shares)
+        if store is None:
+            raise ValueError(f"No .npy files found under {tree}")
+        return store
+
+
+def open_store(path):
+    """Loader used by every entry point that reads template shares."""
+    return TemplateStore(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack a <subject>/<sample>.npy tree into a template store")
+    parser.add_argument("tree")
+    parser.add_argument("store")
+    parser.add_argument("--dtype", choices=["float64", "float32"], default="float64")
+    args = parser.parse_args()
+
+    store = TemplateStore.from_directory(args.tree, args.store, args.dtype)
+    print(f"Packed {len(store)} samples of {len(store.subjects())} subjects into {args.store}")
+
+
+if __name__ == "__main__":
+    main()
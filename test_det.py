@@ -0,0 +1,201 @@
+"""
+DET.pavx and DET.rocch against the versions they replaced (legacy_pavx /
+legacy_rocch below: a Python loop over numpy scalars for PAV and a sum over
+all scores per ROCCH bin). The results must be identical, bit for bit and
+dtypes included. Inputs the legacy pavx fails on (never pooling, e.g.
+strictly increasing: its back-fill runs off the start) are checked on
+their own, and rocch now rejects a class without scores (the legacy one
+divided by zero).
+
+    python -m pytest test_det.py
+"""
+import copy
+import numpy as np
+import pytest
+
+from DET import pavx, rocch
+
+
+def legacy_pavx(y):
+    # DET.pavx before the stack-of-blocks version
+    assert y.ndim == 1, 'Argument should be a 1-D array'
+    assert y.shape[0] > 0, 'Input array is empty'
+    n = y.shape[0]
+
+    index = np.zeros(n,dtype=int)
+    length = np.zeros(n,dtype=int)
+
+    ghat = np.zeros(n)
+
+    ci = 0
+    index[ci] = 1
+    length[ci] = 1
+    ghat[ci] = y[0]
+
+    for j in range(1, n):
+        ci += 1
+        index[ci] = j+1
+        length[ci] = 1
+        ghat[ci] = y[j]
+        while (ci >= 1) & (ghat[np.max(ci - 1, 0)] >= ghat[ci]):
+            nw = length[ci - 1] + length[ci]
+            ghat[ci - 1] = ghat[ci - 1] + (length[ci] / nw) * (ghat[ci] - ghat[ci - 1])
+            length[ci - 1] = nw
+            ci -= 1
+
+    height = copy.deepcopy(ghat[:ci + 1])
+    width = copy.deepcopy(length[:ci + 1])
+
+    while n >= 0:
+        for j in range(index[ci], n+1):
+            ghat[j-1] = ghat[ci]
+        n = index[ci] - 1
+        ci -= 1
+
+    return ghat, width, height
+
+
+def legacy_rocch(tar_scores, nontar_scores, laplace=True):
+    # DET.rocch before the cumulative sums, on legacy_pavx
+    Nt = tar_scores.shape[0]
+    Nn = nontar_scores.shape[0]
+    N = Nt + Nn
+    scores = np.concatenate((tar_scores, nontar_scores))
+    Pideal = np.concatenate((np.ones(Nt), np.zeros(Nn)))
+    perturb = np.argsort(scores, kind='mergesort')
+    Pideal = Pideal[perturb]
+    if laplace:
+        Pideal = np.concatenate(([1,0], Pideal, [1,0]))
+
+    Popt, width, foo = legacy_pavx(Pideal)
+
+    if laplace:
+        Popt = Popt[2:-2]
+
+    nbins = width.shape[0]
+    pmiss = np.zeros(nbins + 1)
+    pfa = np.zeros(nbins + 1)
+    left = 0
+    fa = Nn
+    miss = 0
+    for i in range(nbins):
+        pmiss[i] = miss / Nt
+        pfa[i] = fa / Nn
+        left = int(left + width[i])
+        miss = np.sum(Pideal[:left])
+        fa = N - left - np.sum(Pideal[left:])
+    pmiss[nbins] = miss / Nt
+    pfa[nbins] = fa / Nn
+
+    return pmiss, pfa
+
+
+def assert_identical(new, old):
+    for a, b in zip(new, old):
+        assert a.dtype == b.dtype and a.shape == b.shape, f"{a.dtype}{a.shape} vs {b.dtype}{b.shape}"
+        assert np.array_equal(a, b, equal_nan=True)
+
+
+def assert_same_as_legacy(function, legacy, *args):
+    """`function` returns what `legacy` does, or raises the same exception type."""
+    try:
+        old = legacy(*args)
+    except Exception as err:
+        with pytest.raises(type(err)):
+            function(*args)
+        return
+    assert_identical(function(*args), old)
+
+
+def random_scores(rng, count, mated_fraction, decimals=None):
+    mated_count = max(1, int(count * mated_fraction))
+    tar = rng.normal(2.0, 1.0, mated_count)
+    non = rng.normal(0.0, 1.0, count - mated_count)
+    if decimals is not None:
+        tar, non = tar.round(decimals), non.round(decimals)
+    return tar, non
+
+
+def pavx_inputs(rng, trials):
+    for _ in range(trials):
+        n = int(rng.integers(2, 400))
+        yield rng.normal(size=n)
+        yield rng.integers(0, 4, n).astype(float)
+        yield rng.integers(0, 2, n).astype(float)
+        yield rng.normal(size=n).astype(np.float32)
+        special = rng.integers(0, 3, n).astype(float)
+        special[rng.random(n) < 0.1] = np.inf
+        special[rng.random(n) < 0.1] = -np.inf
+        special[rng.random(n) < 0.05] = np.nan
+        yield special
+
+
+def test_pavx_random():
+    checked = 0
+    for y in pavx_inputs(np.random.default_rng(0), 50):
+        try:
+            old = legacy_pavx(y)
+        except IndexError:
+            continue
+        assert_identical(pavx(y), old)
+        checked += 1
+    assert checked > 100
+
+
+@pytest.mark.parametrize("y", [
+    np.full(7, 0.3), np.zeros(5), np.ones(3), np.full(4, np.inf), np.full(4, -np.inf),
+    np.array([3.0, 3.0, 1.0, 1.0, 2.0, 2.0, 0.0]), np.array([1.0, 0.0, 0.0, 1.0, 1.0, 0.0]),
+])
+def test_pavx_ties(y):
+    assert_same_as_legacy(pavx, legacy_pavx, y)
+
+
+@pytest.mark.parametrize("y", [np.arange(6, dtype=float), np.array([2.5])])
+def test_pavx_increasing(y):
+    # No violators: every value is a block of its own (the legacy version fails here)
+    assert_identical(pavx(y), (y, np.ones(len(y), dtype=int), y))
+
+
+def test_pavx_empty():
+    with pytest.raises(AssertionError):
+        pavx(np.zeros(0))
+
+
+@pytest.mark.parametrize("laplace", [True, False])
+def test_rocch_random(laplace):
+    rng = np.random.default_rng(1)
+    for _ in range(30):
+        count = int(rng.integers(2, 3000))
+        tar, non = random_scores(rng, count, rng.uniform(0.01, 0.5))
+        tied_tar, tied_non = random_scores(rng, count, rng.uniform(0.01, 0.5), decimals=1)
+        nan_tar, nan_non = tar.copy(), non.copy()
+        nan_tar[rng.random(len(tar)) < 0.05] = np.nan
+        nan_non[rng.random(len(non)) < 0.05] = np.nan
+        cases = [(tar, non), (tied_tar, tied_non), (tied_tar.astype(np.float32), tied_non),
+                 ((tied_tar * 10).astype(int), (tied_non * 10).astype(int)), (nan_tar, nan_non)]
+        for tar, non in cases:
+            assert_same_as_legacy(rocch, legacy_rocch, tar, non, laplace)
+
+
+@pytest.mark.parametrize("laplace", [True, False])
+@pytest.mark.parametrize("tar, non", [
+    # all scores equal, across and within the classes
+    (np.full(5, 0.5), np.full(9, 0.5)),
+    (np.array([1, 1, 2, 2]), np.array([0, 1, 1, 2, 2, 2])),
+    (np.array([0.2, 0.2]), np.array([0.7, 0.7, 0.7])),
+])
+def test_rocch_ties(tar, non, laplace):
+    assert_same_as_legacy(rocch, legacy_rocch, tar, non, laplace)
+
+
+@pytest.mark.parametrize("laplace", [True, False])
+@pytest.mark.parametrize("tar, non", [
+    (np.array([0.1, 0.4, 0.4, 0.9]), np.zeros(0)),
+    (np.zeros(0), np.array([0.1, 0.4, 0.4, 0.9])),
+    (np.array([0.3]), np.zeros(0)),
+    (np.zeros(0), np.zeros(0)),
+])
+def test_rocch_single_class(tar, non, laplace):
+    # The legacy version divided by the empty class's count (ZeroDivisionError)
+    with pytest.raises(AssertionError):
+        rocch(tar, non, laplace)
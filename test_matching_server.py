@@ -0,0 +1,106 @@
+"""
+Error replies of the matching server: an unknown subject ID or malformed
+share bytes get a STATUS_ERROR reply (a BATCH_FAILED result within a
+batch) and the connection keeps serving. A failure once a reply is being
+streamed drops the connection instead.
+
+    python -m pytest test_matching_server.py
+"""
+import threading
+import numpy as np
+import pytest
+import tenseal as ts
+
+from beaver import deal
+from ckks_utils import create_ckks_context, public_context_bytes
+from client import ServerSession, mpc_open, query_batch
+from matching_server import MatchingServer
+from template_store import TemplateStore
+
+DIM = 16
+
+
+@pytest.fixture(scope="module")
+def context():
+    return create_ckks_context()
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("store")
+    store = TemplateStore.create(folder / "shares", DIM)
+    store.append([("1", "1d0")], np.arange(DIM, dtype=np.float64)[None])
+    ring_store = TemplateStore.create(folder / "ring", DIM, dtype=np.uint64, frac_bits=16)
+    ring_store.append([("1", "1d0")], np.arange(DIM, dtype=np.uint64)[None])
+    deal(4, DIM, [folder / "triples0", folder / "triples1"], folder / "client_triples.npy")
+    server = MatchingServer("test server", ("127.0.0.1", 0), folder / "shares",
+                            ring_database_folder=folder / "ring", triples_folder=folder / "triples0")
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.stop()
+    thread.join()
+    server.server_close()
+
+
+@pytest.fixture
+def session(server, context):
+    session = ServerSession(*server.server_address, public_context_bytes(context))
+    yield session
+    session.close()
+
+
+def test_unknown_id(session, context):
+    share = ts.ckks_vector(context, np.zeros(DIM).tolist()).serialize()
+    with pytest.raises(ConnectionError, match="not enrolled"):
+        session.verify("2", share, context)
+    # The connection is still in step
+    assert session.verify("1", share, context).size() == DIM
+
+
+def test_malformed_share(session, context):
+    with pytest.raises(ConnectionError, match="Server error"):
+        session.verify("1", b"not a ciphertext", context)
+    share = ts.ckks_vector(context, np.zeros(DIM).tolist()).serialize()
+    assert session.verify("1", share, context).size() == DIM
+
+
+def test_batch_failed_pairs(session, context, server, monkeypatch):
+    share = ts.ckks_vector(context, np.zeros(DIM).tolist()).serialize()
+    pairs = [("1", share), ("2", share), ("1", b"not a ciphertext"), ("1", share)]
+    results = sorted(query_batch(session.sock, session.session_id, pairs, context))
+    assert [diff is not None for _, diff, _ in results] == [True, False, False, True]
+
+    def fail(*args):
+        raise KeyError("template")
+
+    # Any failure of a pair is reported in the stream, the rest of the batch is still read
+    monkeypatch.setattr(server.templates, "subtract_from", fail)
+    results = list(query_batch(session.sock, session.session_id, pairs, context))
+    assert all(diff is None for _, diff, _ in results)
+    monkeypatch.undo()
+    assert session.verify("1", share, context).size() == DIM
+
+
+def test_identify_failure_drops_connection(session, context, server, monkeypatch):
+    def fail(*args):
+        raise KeyError("gallery")
+        yield
+
+    monkeypatch.setattr(server.templates, "subtract_gallery_from", fail)
+    share = ts.ckks_vector(context, np.zeros(server.block_dim * server.per_block).tolist()).serialize()
+    assert session.identify(share) == ["1"]
+    # The blocks had started, so no error frame: the connection is closed instead
+    with pytest.raises(ConnectionError):
+        session.receive_block(context)
+
+
+def test_mpc_open_errors(session):
+    with pytest.raises(ConnectionError, match="not enrolled"):
+        mpc_open(session.sock, "2", 0, np.zeros(DIM, dtype=np.uint64))
+    with pytest.raises(ConnectionError, match="ring elements"):
+        mpc_open(session.sock, "1", 0, np.zeros(DIM - 1, dtype=np.uint64))
+    with pytest.raises(ConnectionError, match="Server error"):
+        mpc_open(session.sock, "1", "not a triple", np.zeros(DIM, dtype=np.uint64))
+    # No triple was used up by the failed requests
+    assert len(mpc_open(session.sock, "1", 0, np.zeros(DIM, dtype=np.uint64))) == DIM
@@ -0,0 +1,261 @@
+"""
+Length-prefixed framing shared by client.py and the matching servers.
+
+A frame is an 8-byte big-endian header followed by the payload: the top
+byte of the header names the codec the payload is compressed with (0 for
+none), the lower 56 bits hold the payload length. Frames are received
+straight into a preallocated bytearray (no chunk concatenation) and sent with
+a single scatter-gather sendmsg() so the header is never copied in front of
+a multi-MB payload. The *_async variants frame asyncio streams the same way
+(see async_client.py).
+
+Compression is negotiated per connection (OP_CODECS, see protocol.py): after
+set_codec() every frame of at least COMPRESS_THRESHOLD bytes sent on the
+socket is compressed, and kept compressed only if that made it smaller.
+Receivers decode whatever codec a frame names. SEAL already compresses the
+ciphertexts and keys it serializes, so mostly the other frames gain.
+"""
+import asyncio
+import io
+import socket
+import struct
+import threading
+import weakref
+import zlib
+
+HEADER = struct.Struct("!Q")
+CODEC_SHIFT = 56
+LENGTH_MASK = (1 << CODEC_SHIFT) - 1
+# Refuse absurd lengths instead of trying to allocate them
+MAX_FRAME_SIZE = 1 << 32
+# Stay well below IOV_MAX (1024 on Linux) buffers per sendmsg() call
+MAX_SENDMSG_BUFFERS = 512
+# Smaller frames are not worth a compression attempt
+COMPRESS_THRESHOLD = 1024
+# Streamed codecs decompress this much at a time, see read_capped()
+DECOMPRESS_CHUNK = 1 << 20
+
+
+def too_large(limit):
+    return ConnectionError(f"Frame decompresses to more than the {limit} byte limit")
+
+
+def read_capped(stream, limit):
+    """Everything a decompressing `stream` yields, refused as soon as that passes `limit` bytes."""
+    data = bytearray()
+    while True:
+        chunk = stream.read(DECOMPRESS_CHUNK)
+        if not chunk:
+            return data
+        data += chunk
+        if len(data) > limit:
+            raise too_large(limit)
+
+
+def zlib_decompress(data, limit):
+    decompressor = zlib.decompressobj()
+    payload = decompressor.decompress(data, limit)
+    if decompressor.unconsumed_tail:
+        raise too_large(limit)
+    return payload
+
+
+class Codec:
+    """decompress(data, limit) raises ConnectionError rather than return more than `limit` bytes."""
+
+    def __init__(self, name, codec_id, compress, decompress):
+        self.name = name
+        self.codec_id = codec_id
+        self.compress = compress
+        self.decompress = decompress
+
+
+# Installed codecs, fastest first
+CODECS = []
+try:
+    import zstandard
+    CODECS.append(Codec("zstd", 2, lambda data: zstandard.ZstdCompressor(level=1).compress(data),
+                        lambda data, limit: read_capped(zstandard.ZstdDecompressor().stream_reader(data), limit)))
+except ImportError:
+    pass
+try:
+    import lz4.frame
+    CODECS.append(Codec("lz4", 3, lz4.frame.compress,
+                        lambda data, limit: read_capped(lz4.frame.LZ4FrameFile(io.BytesIO(data)), limit)))
+except ImportError:
+    pass
+CODECS.append(Codec("zlib", 1, lambda data: zlib.compress(data, 1), zlib_decompress))
+CODECS_BY_NAME = {codec.name: codec for codec in CODECS}
+CODECS_BY_ID = {codec.codec_id: codec for codec in CODECS}
+
+# Codec negotiated for each socket, see set_codec()
+_socket_codecs = weakref.WeakKeyDictionary()
+
+
+def choose_codec(offered):
+    """The first of the `offered` codec names this side supports, None if there is none."""
+    for name in offered:
+        if name in CODECS_BY_NAME:
+            return CODECS_BY_NAME[name]
+    return None
+
+
+def set_codec(sock, codec):
+    """Compresses the frames sent on `sock` from now on with `codec` (None for no compression)."""
+    if codec is None:
+        _socket_codecs.pop(sock, None)
+    else:
+        _socket_codecs[sock] = codec
+
+
+class BandwidthCounter:
+    """
+    Thread-safe count of the bytes (headers included) sent and received: on
+    the wire, and logical (payloads before compression).
+    """
+
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.logical_sent = 0
+        self.logical_received = 0
+        self.lock = threading.Lock()
+
+    def add_sent(self, n, logical=None):
+        with self.lock:
+            self.sent += n
+            self.logical_sent += n if logical is None else logical
+
+    def add_received(self, n, logical=None):
+        with self.lock:
+            self.received += n
+            self.logical_received += n if logical is None else logical
+
+    @property
+    def total(self):
+        return self.sent + self.received
+
+    @property
+    def logical_total(self):
+        return self.logical_sent + self.logical_received
+
+
+def encode_frame(frame, codec):
+    """(header, payload) of one frame, the payload compressed with `codec` if that pays off."""
+    payload = memoryview(frame).cast("B")
+    if codec is not None and len(payload) >= COMPRESS_THRESHOLD:
+        compressed = codec.compress(payload)
+        if len(compressed) < len(payload):
+            return HEADER.pack(codec.codec_id << CODEC_SHIFT | len(compressed)), memoryview(compressed)
+    return HEADER.pack(len(payload)), payload
+
+
+def parse_header(header):
+    """(codec or None, payload length) of a frame header."""
+    (value,) = HEADER.unpack(header)
+    codec_id, size = value >> CODEC_SHIFT, value & LENGTH_MASK
+    if size > MAX_FRAME_SIZE:
+        raise ConnectionError(f"Frame of {size} bytes exceeds the {MAX_FRAME_SIZE} byte limit")
+    if codec_id and codec_id not in CODECS_BY_ID:
+        raise ConnectionError(f"Frame compressed with unknown codec {codec_id}")
+    return CODECS_BY_ID.get(codec_id), size
+
+
+def decode_frame(codec, data):
+    # A small compressed frame may expand to any size, so decompressing is held to the same limit
+    return data if codec is None else codec.decompress(data, MAX_FRAME_SIZE)
+
+
+def set_nodelay(sock):
+    """
+    Requests are several small frames in a row; without TCP_NODELAY Nagle's
+    algorithm holds them back until the peer's delayed ACK (~40 ms).
+    """
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+def connect(address):
+    sock = socket.create_connection(address)
+    set_nodelay(sock)
+    return sock
+
+
+def send_frames(sock, frames, counter=None):
+    """
+    Send several frames (any contiguous buffers) with as few sendmsg() calls
+    as possible, optionally counting their bytes in `counter`.
+    """
+    codec = _socket_codecs.get(sock)
+    buffers = []
+    logical = 0
+    for frame in frames:
+        header, payload = encode_frame(frame, codec)
+        buffers += [memoryview(header), payload]
+        logical += HEADER.size + memoryview(frame).nbytes
+    size = sum(len(buffer) for buffer in buffers)
+    if hasattr(sock, "sendmsg"):
+        first = 0
+        while first < len(buffers):
+            sent = sock.sendmsg(buffers[first:first + MAX_SENDMSG_BUFFERS])
+            # Skip what went out, keep sending the rest of a partially sent buffer
+            while first < len(buffers) and sent >= len(buffers[first]):
+                sent -= len(buffers[first])
+                first += 1
+            if sent:
+                buffers[first] = buffers[first][sent:]
+    else:
+        for buffer in buffers:
+            sock.sendall(buffer)
+    if counter is not None:
+        counter.add_sent(size, logical)
+
+
+def send_large_data(sock, data_bytes, counter=None):
+    """Send one frame (any contiguous buffer), optionally counting its bytes in `counter`."""
+    send_frames(sock, [data_bytes], counter)
+
+
+def receive_exactly_into(sock, view):
+    """Fill the writable memoryview `view` completely from `sock`."""
+    while len(view):
+        n = sock.recv_into(view)
+        if n == 0:
+            raise ConnectionError("Connection closed prematurely")
+        view = view[n:]
+
+
+def receive_large_data(sock, counter=None):
+    """Receive one frame and return its (decompressed) payload as a bytes-like object."""
+    header = bytearray(HEADER.size)
+    receive_exactly_into(sock, memoryview(header))
+    codec, size = parse_header(header)
+    data = bytearray(size)
+    receive_exactly_into(sock, memoryview(data))
+    data = decode_frame(codec, data)
+    if counter is not None:
+        counter.add_received(HEADER.size + size, HEADER.size + len(data))
+    return data
+
+
+async def send_frames_async(writer, frames, counter=None, codec=None):
+    """Writes several frames to an asyncio StreamWriter and waits until they are flushed."""
+    for frame in frames:
+        header, payload = encode_frame(frame, codec)
+        writer.write(header)
+        writer.write(payload)
+        if counter is not None:
+            counter.add_sent(HEADER.size + len(payload), HEADER.size + memoryview(frame).nbytes)
+    await writer.drain()
+
+
+async def receive_frame_async(reader, counter=None):
+    """Receives one frame from an asyncio StreamReader."""
+    try:
+        codec, size = parse_header(await reader.readexactly(HEADER.size))
+        data = await reader.readexactly(size)
+    except asyncio.IncompleteReadError:
+        raise ConnectionError("Connection closed prematurely") from None
+    data = decode_frame(codec, data)
+    if counter is not None:
+        counter.add_received(HEADER.size + size, HEADER.size + len(data))
+    return data